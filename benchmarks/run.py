@@ -0,0 +1,348 @@
+"""\
+Micro benchmarks for the frame, codec and command hot paths.
+
+    python benchmarks/run.py                        # run and compare to baseline
+    python benchmarks/run.py --output results.json  # store results
+    python benchmarks/run.py --save-baseline        # replace the stored baseline
+    python benchmarks/run.py --filter frame_decoder --threshold 0.1
+    python benchmarks/run.py --filter corpus --corpus corpus.bin
+
+Timings are compared relative to a calibration loop of plain interpreter work
+measured around every repetition, so a baseline stored on one host is usable
+on another. Absolute timings are stored alongside for reference.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+import typing
+from pathlib import Path
+
+import uecp
+from uecp import byte_stuffing_codec, rds_character_set_codec
+from uecp.commands import RadioTextSetCommand, UECPCommand
+from uecp.corpus import (
+    COMMAND_FACTORIES,
+    CorpusGenerator,
+    UECPCorpus,
+    decode_corpus,
+)
+from uecp.frame import UECPFrame, UECPFrameDecoder
+from uecp.scan import scan_frames
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+Benchmark = typing.Callable[[], typing.Callable[[], object]]
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> typing.Callable[[Benchmark], Benchmark]:
+    """Register a setup function returning the callable to be timed."""
+
+    def register(setup: Benchmark) -> Benchmark:
+        if name in BENCHMARKS:
+            raise ValueError(f"Benchmark {name!r} already registered")
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def sample_commands() -> list[UECPCommand]:
+    """\
+    One command of every type in UECPCommand.ELEMENT_CODE_MAP, generated by
+    the corpus command factories with a fixed seed.
+    """
+    missing = [
+        command_type.__name__
+        for command_type in UECPCommand.ELEMENT_CODE_MAP.values()
+        if command_type not in COMMAND_FACTORIES
+    ]
+    if missing:
+        raise RuntimeError(f"No corpus command factory for {', '.join(missing)}")
+    generator = CorpusGenerator(seed=0)
+    return [
+        COMMAND_FACTORIES[command_type](generator)
+        for _, command_type in sorted(UECPCommand.ELEMENT_CODE_MAP.items())
+    ]
+
+
+SAMPLE_COMMANDS = sample_commands()
+
+
+def frame_with_payload(payload_size: int) -> UECPFrame:
+    """Frame filled with radio text commands up to roughly payload_size bytes."""
+    frame = UECPFrame(site_address=0x3FF, encoder_address=0x3F, sequence_counter=0xFE)
+    remaining = payload_size
+    while remaining >= 5:
+        text_length = min(64, remaining - 5)
+        if text_length < 61:
+            text_length = max(1, text_length)
+            text = "x" * (text_length - 1) + "\r"
+        else:
+            text = "x" * text_length
+        frame.add_command(RadioTextSetCommand(text=text))
+        remaining -= 5 + len(text)
+    return frame
+
+
+PAYLOAD_SIZES = (0, 16, 64, 250)
+
+for _size in PAYLOAD_SIZES:
+
+    @benchmark(f"frame_encode[payload={_size}]")
+    def _frame_encode(size=_size):
+        return frame_with_payload(size).encode
+
+    @benchmark(f"frame_create_from_enclosed[payload={_size}]")
+    def _frame_create_from_enclosed(size=_size):
+        encoded = frame_with_payload(size).encode()
+        enclosed = byte_stuffing_codec.decode(encoded[1:-1])[0]
+        return lambda: UECPFrame.create_from_enclosed(enclosed)
+
+
+def _frame_stream(frame_count: int = 100) -> bytes:
+    rng = random.Random(0)
+    frames = []
+    for sequence_counter in range(frame_count):
+        frame = UECPFrame(sequence_counter=sequence_counter % 256)
+        for command in rng.sample(SAMPLE_COMMANDS, 3):
+            frame.add_command(command)
+        frames.append(frame.encode())
+    return b"".join(frames)
+
+
+for _chunk_size in (1, 16, 256, 4096):
+
+    @benchmark(f"frame_decoder_stream[chunk={_chunk_size}]")
+    def _frame_decoder_stream(chunk_size=_chunk_size):
+        stream = _frame_stream()
+        chunks = [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+        def run():
+            decoder = UECPFrameDecoder()
+            for chunk in chunks:
+                frame, remaining_data = decoder.decode(chunk)
+                while frame is not None:
+                    frame, remaining_data = decoder.decode(remaining_data)
+
+        return run
+
+
+_CORPUS_SIZE = 16 * 1024
+
+for _name, _options in {
+    "clean": {},
+    "stuffed": {"stuffing_density": 0.5},
+    "noisy": {"stuffing_density": 0.1, "garbage_rate": 0.02, "corrupt_rate": 0.02},
+}.items():
+
+    @benchmark(f"frame_decoder_corpus[{_name},16KiB]")
+    def _frame_decoder_corpus(options=_options):
+        corpus = CorpusGenerator(seed=0, **options).generate(_CORPUS_SIZE)
+        return lambda: decode_corpus(corpus)
+
+    @benchmark(f"frame_scan_corpus[{_name},16KiB]")
+    def _frame_scan_corpus(options=_options):
+        corpus = CorpusGenerator(seed=0, **options).generate(_CORPUS_SIZE)
+        return lambda: sum(frame.valid for frame in scan_frames(corpus.data))
+
+
+def register_corpus_file(path: Path):
+    corpus = UECPCorpus.load(path)
+
+    @benchmark(f"frame_decoder_corpus[{path.name}]")
+    def _frame_decoder_corpus_file():
+        return lambda: decode_corpus(corpus)
+
+
+_WORST_CASE_STUFFING = bytes([0xFD, 0xFE, 0xFF] * 342)[:1024]
+_RANDOM_DATA = random.Random(1).randbytes(1024)
+
+
+@benchmark("byte_stuffing_encode[worst_case,1KiB]")
+def _stuffing_encode_worst():
+    return lambda: byte_stuffing_codec.encode(_WORST_CASE_STUFFING)
+
+
+@benchmark("byte_stuffing_decode[worst_case,1KiB]")
+def _stuffing_decode_worst():
+    stuffed = byte_stuffing_codec.encode(_WORST_CASE_STUFFING)[0]
+    return lambda: byte_stuffing_codec.decode(stuffed)
+
+
+@benchmark("byte_stuffing_encode[random,1KiB]")
+def _stuffing_encode_random():
+    return lambda: byte_stuffing_codec.encode(_RANDOM_DATA)
+
+
+@benchmark("byte_stuffing_decode[random,1KiB]")
+def _stuffing_decode_random():
+    stuffed = byte_stuffing_codec.encode(_RANDOM_DATA)[0]
+    return lambda: byte_stuffing_codec.decode(stuffed)
+
+
+@benchmark("byte_stuffing_incremental_decode[worst_case,1KiB]")
+def _stuffing_incremental_decode_worst():
+    stuffed = byte_stuffing_codec.encode(_WORST_CASE_STUFFING)[0]
+
+    def run():
+        decoder = byte_stuffing_codec.IncrementalDecoder()
+        return decoder.decode(stuffed, final=True)
+
+    return run
+
+
+_RDS_TEXT = "Grüße aus Köln, Café Olé für 5 € oder £ 4! " * 2
+
+
+@benchmark("rds_character_set_encode[64]")
+def _rds_encode():
+    text = _RDS_TEXT[:64]
+    return lambda: rds_character_set_codec.encode(text)
+
+
+@benchmark("rds_character_set_decode[64]")
+def _rds_decode():
+    data = rds_character_set_codec.encode(_RDS_TEXT[:64])[0]
+    return lambda: rds_character_set_codec.decode(data)
+
+
+for _command in SAMPLE_COMMANDS:
+
+    @benchmark(f"decode_commands[{type(_command).__name__}]")
+    def _decode_command(command=_command):
+        data = command.encode()
+        return lambda: UECPCommand.decode_commands(data)
+
+
+_CALIBRATION_DATA = bytes(range(256)) * 4
+
+
+def calibration_loop() -> int:
+    """Fixed interpreter work, the unit of relative timings."""
+    total = 0
+    for value in _CALIBRATION_DATA:
+        total += value & 0x0F
+    return total
+
+
+def _loops(timer: timeit.Timer, min_time: float) -> int:
+    number, _ = timer.autorange()
+    return max(1, int(number * min_time / 0.2))
+
+
+def measure(
+    function: typing.Callable[[], object], repeat: int, min_time: float
+) -> dict[str, float]:
+    timer = timeit.Timer(function)
+    number = _loops(timer, min_time)
+    calibration = timeit.Timer(calibration_loop)
+    calibration_number = _loops(calibration, min_time / 4)
+    timings = []
+    relative = []
+    for _ in range(repeat):
+        # calibrate around every repetition to follow the speed of the host
+        before = calibration.timeit(calibration_number)
+        timing = timer.timeit(number) / number
+        after = calibration.timeit(calibration_number)
+        timings.append(timing)
+        relative.append(timing / (min(before, after) / calibration_number))
+    return {
+        "best_s": min(timings),
+        "median_s": statistics.median(timings),
+        "relative": statistics.median(relative),
+        "loops": number,
+        "repeat": repeat,
+    }
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[tuple[str, float]]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["relative"] / baseline[name]["relative"]
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="substring of benchmark names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="seconds per repetition"
+    )
+    parser.add_argument("--output", type=Path, help="write JSON results")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as regression",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        action="append",
+        default=[],
+        help="additionally decode a corpus file written by python -m uecp.corpus",
+    )
+    args = parser.parse_args(argv)
+    for path in args.corpus:
+        register_corpus_file(path)
+
+    results: dict[str, dict[str, float]] = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = result = measure(setup(), args.repeat, args.min_time)
+        print(
+            f"{name:<60} {result['best_s'] * 1e6:>12.2f} µs"
+            f" {result['relative']:>10.3f}x",
+            flush=True,
+        )
+
+    document = {
+        "uecp_version": uecp.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(document, indent=2) + "\n")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, nothing to compare")
+        return 0
+    baseline = json.loads(args.baseline.read_text())["results"]
+    if not all("relative" in result for result in baseline.values()):
+        print(f"Baseline {args.baseline} has no relative timings, store it again")
+        return 1
+    regressions = compare(results, baseline, args.threshold)
+    for name, ratio in regressions:
+        print(f"REGRESSION {name}: {ratio:.2f}x slower than baseline")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""\
+Parallel decoding of large captures and raw serial dumps.
+
+    python -m uecp.batch capture.cap --workers 8
+    python -m uecp.batch dump.bin --dump --json
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import functools
+import heapq
+import json
+import operator
+import os
+import sys
+import typing
+from pathlib import Path
+
+import attr
+
+from uecp.capture import RECORD_HEADER_SIZE, Direction, MappedCaptureReader
+from uecp.commands import MessageAcknowledgementCommand, ResponseCode, UECPCommand
+from uecp.frame import UECPAddressFilter, UECPFrame, crc16
+from uecp.scan import FrameScanner, ScannedFrame, map_file
+
+DEFAULT_SHARD_SIZE = 16 << 20
+
+DecodedFrame = tuple[typing.Optional[int], typing.Optional[Direction], UECPFrame]
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class EncoderStatistics:
+    frames: int = attr.ib(default=0)
+    first_timestamp_ns: typing.Optional[int] = attr.ib(default=None)
+    last_timestamp_ns: typing.Optional[int] = attr.ib(default=None)
+
+    @property
+    def frames_per_second(self) -> typing.Optional[float]:
+        if self.first_timestamp_ns is None or self.last_timestamp_ns is None:
+            return None
+        duration = (self.last_timestamp_ns - self.first_timestamp_ns) / 1e9
+        return self.frames / duration if duration > 0 else None
+
+    def add(self, timestamp_ns: typing.Optional[int]):
+        self.frames += 1
+        if timestamp_ns is not None:
+            if self.first_timestamp_ns is None:
+                self.first_timestamp_ns = timestamp_ns
+            self.last_timestamp_ns = timestamp_ns
+
+    def merge(self, other: "EncoderStatistics"):
+        """\
+        Merge the statistics of a later shard.
+        """
+        self.frames += other.frames
+        if self.first_timestamp_ns is None:
+            self.first_timestamp_ns = other.first_timestamp_ns
+        if other.last_timestamp_ns is not None:
+            self.last_timestamp_ns = other.last_timestamp_ns
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class DecodeStatistics:
+    frames: int = attr.ib(default=0)
+    decoded_frames: int = attr.ib(default=0)
+    errors: collections.Counter[str] = attr.ib(factory=collections.Counter)
+    element_codes: collections.Counter[int] = attr.ib(factory=collections.Counter)
+    response_codes: collections.Counter[ResponseCode] = attr.ib(
+        factory=collections.Counter
+    )
+    encoders: dict[tuple[int, int], EncoderStatistics] = attr.ib(factory=dict)
+    torn_frames: int = attr.ib(default=0)
+
+    def merge(self, other: "DecodeStatistics"):
+        """\
+        Merge the statistics of a later shard.
+        """
+        self.frames += other.frames
+        self.decoded_frames += other.decoded_frames
+        self.errors.update(other.errors)
+        self.element_codes.update(other.element_codes)
+        self.response_codes.update(other.response_codes)
+        for key, encoder in other.encoders.items():
+            if key in self.encoders:
+                self.encoders[key].merge(encoder)
+            else:
+                self.encoders[key] = encoder
+        self.torn_frames += other.torn_frames
+
+    def summary(self) -> dict[str, typing.Any]:
+        mec_names = {
+            mec: command_type.__name__
+            for mec, command_type in UECPCommand.ELEMENT_CODE_MAP.items()
+        }
+        return {
+            "frames": self.frames,
+            "decoded_frames": self.decoded_frames,
+            "torn_frames": self.torn_frames,
+            "errors": dict(self.errors.most_common()),
+            "commands": {
+                mec_names.get(mec, f"{mec:#04x}"): count
+                for mec, count in self.element_codes.most_common()
+            },
+            "response_codes": {
+                code.name: self.response_codes[code]
+                for code in sorted(self.response_codes)
+            },
+            "encoders": {
+                f"{site_address}/{encoder_address}": {
+                    "frames": encoder.frames,
+                    "frames_per_second": encoder.frames_per_second,
+                }
+                for (site_address, encoder_address), encoder in sorted(
+                    self.encoders.items()
+                )
+            },
+        }
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class BatchDecodeResult:
+    statistics: DecodeStatistics = attr.ib(factory=DecodeStatistics)
+    frames: list[DecodedFrame] = attr.ib(factory=list, repr=False)
+    shards: int = attr.ib(default=0)
+    # (offset of the record completing the frame, frame offset) per frame
+    positions: list[tuple[int, int]] = attr.ib(factory=list, repr=False, eq=False)
+
+
+def _classify(enclosed: bytes) -> typing.Optional[str]:
+    if len(enclosed) < 6:
+        return "short"
+    if crc16(enclosed[:-2]) != enclosed[-2] << 8 | enclosed[-1]:
+        return "crc"
+    if enclosed[3] != len(enclosed) - 6:
+        return "length"
+    return None
+
+
+def _decode_into(
+    result: BatchDecodeResult,
+    scanned: ScannedFrame,
+    address_filter: typing.Optional[UECPAddressFilter],
+    collect_frames: bool,
+    completed_at: int,
+):
+    statistics = result.statistics
+    try:
+        enclosed = scanned.enclosed
+    except ValueError:
+        statistics.frames += 1
+        statistics.errors["stuffing"] += 1
+        return
+    if address_filter is not None and not scanned.matches(address_filter):
+        return
+    statistics.frames += 1
+    error = _classify(enclosed)
+    if error is not None:
+        statistics.errors[error] += 1
+        return
+    try:
+        commands = UECPCommand.decode_commands(enclosed[4:-2])
+    except Exception as e:
+        statistics.errors[f"command:{type(e).__name__}"] += 1
+        return
+
+    statistics.decoded_frames += 1
+    for command in commands:
+        statistics.element_codes[command.ELEMENT_CODE] += 1
+        if isinstance(command, MessageAcknowledgementCommand):
+            statistics.response_codes[command.code] += 1
+    key = scanned.site_address, scanned.encoder_address
+    encoder = statistics.encoders.get(key)
+    if encoder is None:
+        encoder = statistics.encoders[key] = EncoderStatistics()
+    encoder.add(scanned.timestamp_ns)
+    if collect_frames:
+        frame = UECPFrame(
+            site_address=key[0],
+            encoder_address=key[1],
+            sequence_counter=scanned.sequence_counter,
+            commands=commands,
+        )
+        result.frames.append(
+            (
+                scanned.timestamp_ns,
+                (
+                    Direction(scanned.direction)
+                    if scanned.direction is not None
+                    else None
+                ),
+                frame,
+            )
+        )
+        result.positions.append((completed_at, scanned.offset))
+
+
+def _decode_capture_shard(
+    path: Path,
+    start: int,
+    end: int,
+    direction: typing.Optional[Direction],
+    address_filter: typing.Optional[UECPAddressFilter],
+    collect_frames: bool,
+) -> BatchDecodeResult:
+    """\
+    Decode the frames starting within records [start, end). Frames running
+    into the following shard are completed from its records, frames started
+    in the previous shard are left to it.
+    """
+    result = BatchDecodeResult(shards=1)
+    with MappedCaptureReader(path) as reader:
+        buffer = reader.buffer
+        scanners = {Direction.RX: FrameScanner(), Direction.TX: FrameScanner()}
+        for timestamp_ns, record_direction, data_start, data_end in reader.records(
+            offset=start
+        ):
+            if direction is not None and record_direction is not direction:
+                continue
+            scanner = scanners[record_direction]
+            beyond = data_start - RECORD_HEADER_SIZE >= end
+            if beyond:
+                if all(
+                    s.pending_offset is None or s.pending_offset >= end
+                    for s in scanners.values()
+                ):
+                    break
+                pending_offset = scanner.pending_offset
+                if pending_offset is None or pending_offset >= end:
+                    continue
+            for raw, offset in scanner.feed(buffer, data_start, data_end):
+                if beyond and offset >= end:
+                    continue
+                _decode_into(
+                    result,
+                    ScannedFrame(raw, offset, timestamp_ns, record_direction),
+                    address_filter,
+                    collect_frames,
+                    data_start,
+                )
+        result.statistics.torn_frames = sum(s.torn_frames for s in scanners.values())
+    return result
+
+
+def _decode_dump_shard(
+    path: Path,
+    start: int,
+    end: int,
+    address_filter: typing.Optional[UECPAddressFilter],
+    collect_frames: bool,
+) -> BatchDecodeResult:
+    result = BatchDecodeResult(shards=1)
+    buffer = map_file(path)
+    scanner = FrameScanner()
+    try:
+        for raw, offset in scanner.feed(buffer, start, end):
+            _decode_into(
+                result,
+                ScannedFrame(raw, offset),
+                address_filter,
+                collect_frames,
+                offset,
+            )
+        result.statistics.torn_frames = scanner.torn_frames
+    finally:
+        if hasattr(buffer, "close"):
+            buffer.close()
+    return result
+
+
+def capture_shards(
+    path: typing.Union[str, Path], shard_size: int = DEFAULT_SHARD_SIZE
+) -> list[tuple[int, int]]:
+    """\
+    Split a capture at indexed record boundaries into shards of at least
+    shard_size bytes.
+    """
+    with MappedCaptureReader(path) as reader:
+        size = reader.size
+        boundaries = [reader.offset_for(0)]
+        for _, offset in reader.index:
+            if offset - boundaries[-1] >= shard_size:
+                boundaries.append(offset)
+    return list(zip(boundaries, boundaries[1:] + [size]))
+
+
+def dump_shards(
+    path: typing.Union[str, Path], shard_size: int = DEFAULT_SHARD_SIZE
+) -> list[tuple[int, int]]:
+    """\
+    Split a raw dump at start bytes into shards of about shard_size bytes.
+    """
+    buffer = map_file(path)
+    try:
+        boundaries = [0]
+        while True:
+            boundary = buffer.find(bytes([UECPFrame.STA]), boundaries[-1] + shard_size)
+            if boundary < 0:
+                break
+            boundaries.append(boundary)
+        return list(zip(boundaries, boundaries[1:] + [len(buffer)]))
+    finally:
+        if hasattr(buffer, "close"):
+            buffer.close()
+
+
+def _run(
+    shard_function: typing.Callable[..., BatchDecodeResult],
+    shards: list[tuple[int, int]],
+    workers: typing.Optional[int],
+) -> BatchDecodeResult:
+    if workers == 1 or len(shards) <= 1:
+        results = [shard_function(start, end) for start, end in shards]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # map returns results in shard order
+            results = list(executor.map(shard_function, *zip(*shards)))
+
+    result = BatchDecodeResult()
+    for shard_result in results:
+        result.statistics.merge(shard_result.statistics)
+        result.shards += shard_result.shards
+    # frames completed beyond a shard end interleave with the next shard
+    for position, frame in heapq.merge(
+        *(zip(r.positions, r.frames) for r in results), key=operator.itemgetter(0)
+    ):
+        result.positions.append(position)
+        result.frames.append(frame)
+    return result
+
+
+def decode_capture(
+    path: typing.Union[str, Path],
+    workers: typing.Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    direction: typing.Optional[Direction] = None,
+    address_filter: typing.Optional[UECPAddressFilter] = None,
+    collect_frames: bool = False,
+) -> BatchDecodeResult:
+    """\
+    Decode a capture in shards on up to workers processes, defaulting to the
+    CPU count. Decoded frames are only returned with collect_frames, in
+    capture order.
+    """
+    path = Path(path)
+    return _run(
+        functools.partial(
+            _decode_capture_shard,
+            path,
+            direction=direction,
+            address_filter=address_filter,
+            collect_frames=collect_frames,
+        ),
+        capture_shards(path, shard_size),
+        workers,
+    )
+
+
+def decode_dump(
+    path: typing.Union[str, Path],
+    workers: typing.Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    address_filter: typing.Optional[UECPAddressFilter] = None,
+    collect_frames: bool = False,
+) -> BatchDecodeResult:
+    path = Path(path)
+    return _run(
+        functools.partial(
+            _decode_dump_shard,
+            path,
+            address_filter=address_filter,
+            collect_frames=collect_frames,
+        ),
+        dump_shards(path, shard_size),
+        workers,
+    )
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m uecp.batch", description=__doc__.splitlines()[1]
+    )
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--dump", action="store_true", help="path is a raw serial dump")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument(
+        "--direction", choices=[d.name for d in Direction], default=None
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON summary")
+    return parser
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    if args.dump:
+        result = decode_dump(args.path, args.workers, args.shard_size)
+    else:
+        result = decode_capture(
+            args.path,
+            args.workers,
+            args.shard_size,
+            direction=Direction[args.direction] if args.direction else None,
+        )
+    summary = {"shards": result.shards, **result.statistics.summary()}
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for key, value in summary.items():
+            print(f"{key:>16}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
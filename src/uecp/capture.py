@@ -0,0 +1,360 @@
+"""\
+Append-only binary capture of raw UECP link traffic.
+
+A capture file starts with a magic and version, followed by records of a
+little endian header (timestamp in ns since the epoch, direction, data length)
+and the raw, still stuffed, bytes as seen on the link. A sidecar index file
+(capture path + ".idx") holds (timestamp, offset) pairs of every record
+starting after index_interval bytes, allowing a bisect seek into large
+captures. Timestamps within a capture never decrease.
+"""
+
+import bisect
+import enum
+import mmap
+import os
+import struct
+import time
+import typing
+from pathlib import Path
+
+import attr
+
+from uecp.frame import UECPAddressFilter
+from uecp.scan import Buffer, FrameScanner, ScannedFrame, map_file
+
+CAPTURE_MAGIC = b"UECPCAP\x00"
+CAPTURE_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+_FILE_HEADER = struct.Struct("<8sH")
+_RECORD_HEADER = struct.Struct("<QBH")
+RECORD_HEADER_SIZE = _RECORD_HEADER.size
+_INDEX_ENTRY = struct.Struct("<QQ")
+
+MAX_RECORD_LENGTH = 0xFFFF
+
+
+@enum.unique
+class Direction(enum.IntEnum):
+    RX = 0
+    TX = 1
+
+
+_DIRECTIONS = tuple(Direction)
+
+
+@attr.s(auto_detect=True, frozen=True, slots=True)
+class CaptureRecord:
+    timestamp_ns: int = attr.ib()
+    direction: Direction = attr.ib()
+    data: bytes = attr.ib()
+    offset: int = attr.ib(default=0, eq=False)
+
+
+def index_path(path: typing.Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _check_file_header(header: bytes, path: typing.Union[str, Path]):
+    if len(header) < _FILE_HEADER.size:
+        raise ValueError(f"{path} is too short for a capture file")
+    magic, version = _FILE_HEADER.unpack(header)
+    if magic != CAPTURE_MAGIC:
+        raise ValueError(f"{path} is not a capture file")
+    if version != CAPTURE_VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+
+
+def _read_index(path: Path, capture_size: int) -> list[tuple[int, int]]:
+    try:
+        data = index_path(path).read_bytes()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % _INDEX_ENTRY.size
+    return [
+        entry
+        for entry in _INDEX_ENTRY.iter_unpack(data[:usable])
+        if entry[1] < capture_size
+    ]
+
+
+def _offset_for(index: list[tuple[int, int]], timestamp_ns: int) -> int:
+    position = bisect.bisect_left(index, (timestamp_ns, -1))
+    # records sharing the timestamp may start before the indexed one
+    if position == 0:
+        return _FILE_HEADER.size
+    return index[position - 1][1]
+
+
+class CaptureWriter:
+    def __init__(
+        self,
+        path: typing.Union[str, Path],
+        index_interval: int = 1 << 16,
+        clock: typing.Callable[[], int] = time.time_ns,
+    ):
+        self.path = Path(path)
+        self.index_interval = int(index_interval)
+        self._clock = clock
+
+        self._file = open(self.path, "ab")
+        self._index_file = open(index_path(self.path), "ab")
+        self._offset = self._file.tell()
+        self._last_index_offset = -self.index_interval
+        self._last_timestamp_ns = 0
+        if self._offset == 0:
+            self._file.write(_FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+            self._offset = _FILE_HEADER.size
+        else:
+            self._resume()
+
+        self.records_written = 0
+
+    def _resume(self):
+        """\
+        Continue an existing capture: validate it, then recover the last
+        timestamp and index position. A torn record, e.g. after a crash while
+        writing, is dropped along with index entries beyond the capture.
+        """
+        self._file.flush()
+        reader = CaptureReader(self.path)
+        try:
+            index = reader.index
+            while True:
+                start = index[-1][1] if index else _FILE_HEADER.size
+                last_record = None
+                for last_record in reader.records(offset=start):
+                    pass
+                if last_record is not None or not index:
+                    break
+                # the last indexed record is the torn one
+                index.pop()
+        finally:
+            reader.close()
+
+        end = start
+        if last_record is not None:
+            self._last_timestamp_ns = last_record.timestamp_ns
+            end = last_record.offset + _RECORD_HEADER.size + len(last_record.data)
+        if end != self._offset:
+            self._file.truncate(end)
+            self._offset = end
+        # also drops a torn index entry
+        self._index_file.truncate(len(index) * _INDEX_ENTRY.size)
+        if index:
+            self._last_index_offset = index[-1][1]
+
+    @property
+    def offset(self) -> int:
+        return self._offset
+
+    def write(
+        self,
+        direction: Direction,
+        data: bytes,
+        timestamp_ns: typing.Optional[int] = None,
+    ):
+        if timestamp_ns is None:
+            timestamp_ns = self._clock()
+        if timestamp_ns < self._last_timestamp_ns:
+            timestamp_ns = self._last_timestamp_ns
+        self._last_timestamp_ns = timestamp_ns
+
+        for start in range(0, len(data), MAX_RECORD_LENGTH):
+            chunk = data[start : start + MAX_RECORD_LENGTH]
+            if self._offset - self._last_index_offset >= self.index_interval:
+                self._index_file.write(_INDEX_ENTRY.pack(timestamp_ns, self._offset))
+                self._last_index_offset = self._offset
+            self._file.write(
+                _RECORD_HEADER.pack(timestamp_ns, direction, len(chunk)) + chunk
+            )
+            self._offset += _RECORD_HEADER.size + len(chunk)
+            self.records_written += 1
+
+    def flush(self):
+        # data before index, so index entries never point beyond the capture
+        self._file.flush()
+        self._index_file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        self._index_file.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader:
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        _check_file_header(self._file.read(_FILE_HEADER.size), self.path)
+        self._index = _read_index(self.path, os.fstat(self._file.fileno()).st_size)
+
+    @property
+    def index(self) -> list[tuple[int, int]]:
+        return list(self._index)
+
+    def offset_for(self, timestamp_ns: int) -> int:
+        """\
+        Offset of a record at or before the first record with a timestamp at or
+        after timestamp_ns.
+        """
+        return _offset_for(self._index, timestamp_ns)
+
+    def records(
+        self,
+        start_ns: typing.Optional[int] = None,
+        end_ns: typing.Optional[int] = None,
+        offset: typing.Optional[int] = None,
+    ) -> typing.Iterator[CaptureRecord]:
+        """\
+        Iterate records with start_ns <= timestamp < end_ns, starting at offset
+        or the index position of start_ns. A torn last record is skipped.
+        """
+        if offset is None:
+            offset = (
+                self.offset_for(start_ns) if start_ns is not None else _FILE_HEADER.size
+            )
+        self._file.seek(offset)
+        read = self._file.read
+        header_size = _RECORD_HEADER.size
+        unpack = _RECORD_HEADER.unpack
+        while True:
+            header = read(header_size)
+            if len(header) < header_size:
+                return
+            timestamp_ns, direction, length = unpack(header)
+            data = read(length)
+            if len(data) < length:
+                return
+            if end_ns is not None and timestamp_ns >= end_ns:
+                return
+            if start_ns is None or timestamp_ns >= start_ns:
+                yield CaptureRecord(timestamp_ns, Direction(direction), data, offset)
+            offset += header_size + length
+
+    def __iter__(self) -> typing.Iterator[CaptureRecord]:
+        return self.records()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MappedCaptureReader:
+    """\
+    Memory mapped capture access for captures too large to be read, records
+    and frames refer to the mapped file instead of copying it.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._buffer = map_file(self.path)
+        _check_file_header(bytes(self._buffer[: _FILE_HEADER.size]), self.path)
+        self._index = _read_index(self.path, len(self._buffer))
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def buffer(self) -> Buffer:
+        return self._buffer
+
+    @property
+    def index(self) -> list[tuple[int, int]]:
+        return list(self._index)
+
+    def offset_for(self, timestamp_ns: int) -> int:
+        return _offset_for(self._index, timestamp_ns)
+
+    def records(
+        self,
+        start_ns: typing.Optional[int] = None,
+        end_ns: typing.Optional[int] = None,
+        offset: typing.Optional[int] = None,
+    ) -> typing.Iterator[tuple[int, Direction, int, int]]:
+        """\
+        Yield (timestamp, direction, data start, data end) of records with
+        start_ns <= timestamp < end_ns, starting at the record at offset or the
+        index position of start_ns.
+        """
+        buffer = self._buffer
+        size = len(buffer)
+        if offset is None:
+            offset = (
+                self.offset_for(start_ns) if start_ns is not None else _FILE_HEADER.size
+            )
+        unpack_from = _RECORD_HEADER.unpack_from
+        header_size = _RECORD_HEADER.size
+        while offset + header_size <= size:
+            timestamp_ns, direction, length = unpack_from(buffer, offset)
+            start = offset + header_size
+            offset = start + length
+            if offset > size or (end_ns is not None and timestamp_ns >= end_ns):
+                return
+            if start_ns is None or timestamp_ns >= start_ns:
+                yield timestamp_ns, _DIRECTIONS[direction], start, offset
+
+    def frames(
+        self,
+        start_ns: typing.Optional[int] = None,
+        end_ns: typing.Optional[int] = None,
+        direction: typing.Optional[Direction] = None,
+        address_filter: typing.Optional[UECPAddressFilter] = None,
+    ) -> typing.Iterator[ScannedFrame]:
+        """\
+        Yield the frames completed within the given time range, stamped with
+        the time of the record holding their stop byte. Frames torn by the
+        range start are skipped.
+        """
+        scanners = {Direction.RX: FrameScanner(), Direction.TX: FrameScanner()}
+        for timestamp_ns, record_direction, start, end in self.records(
+            start_ns, end_ns
+        ):
+            if direction is not None and record_direction is not direction:
+                continue
+            for raw, offset in scanners[record_direction].feed(
+                self._buffer, start, end
+            ):
+                frame = ScannedFrame(raw, offset, timestamp_ns, record_direction)
+                if address_filter is None or frame.matches(address_filter):
+                    yield frame
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self) -> "MappedCaptureReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_index(path: typing.Union[str, Path], index_interval: int = 1 << 16):
+    """\
+    Rewrite the sidecar index of a capture, e.g. after it got lost.
+    """
+    entries = []
+    last_index_offset = -index_interval
+    with CaptureReader(path) as reader:
+        for record in reader.records(offset=_FILE_HEADER.size):
+            if record.offset - last_index_offset >= index_interval:
+                entries.append(_INDEX_ENTRY.pack(record.timestamp_ns, record.offset))
+                last_index_offset = record.offset
+    index_path(path).write_bytes(b"".join(entries))
@@ -0,0 +1,22 @@
+"""\
+Argument parsing and reporting helpers shared by the command line tools.
+"""
+
+import typing
+
+
+def parse_host_port(value: str) -> tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return host, int(port)
+
+
+def parse_port_baudrate(value: str) -> tuple[str, int]:
+    port, _, baudrate = value.rpartition(":")
+    return port, int(baudrate)
+
+
+def percentile(sorted_values: typing.Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
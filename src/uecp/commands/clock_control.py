@@ -44,7 +44,7 @@ class RealTimeClockSetCommand(UECPCommand):
             ts.hour,
             ts.minute,
             ts.second,
-            round(ts.microsecond / 10_000),
+            ts.microsecond // 10_000,
             self._encode_localtime_offset(self._timestamp.utcoffset() or timedelta()),
         ]
 
@@ -68,7 +68,7 @@ class RealTimeClockSetCommand(UECPCommand):
             second,
             centisecond,
             encoded_localtime_offset,
-        ) = data
+        ) = data[0:9]
 
         if mec != cls.ELEMENT_CODE:
             raise UECPCommandDecodeElementCodeMismatchError(mec, cls.ELEMENT_CODE)
@@ -0,0 +1,531 @@
+"""\
+Deterministic synthetic UECP byte streams for benchmarks and throughput runs.
+
+    python -m uecp.corpus --seed 1 --size 8388608 corpus.bin
+    python -m uecp.corpus --stuffing-density 0.5 --garbage-rate 0.01 \\
+        --corrupt-rate 0.01 --mix RadioTextSetCommand=4,RequestCommand=1 corpus.bin
+"""
+
+import argparse
+import array
+import random
+import struct
+import sys
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import attr
+
+from uecp import byte_stuffing_codec
+from uecp.commands import (
+    CommunicationMode,
+    CommunicationModeSetCommand,
+    DataSetSelectCommand,
+    DecoderInformationSetCommand,
+    EncoderAddressSetCommand,
+    MessageAcknowledgementCommand,
+    ProgrammeIdentificationSetCommand,
+    ProgrammeServiceNameSetCommand,
+    ProgrammeType,
+    ProgrammeTypeNameSetCommand,
+    ProgrammeTypeSetCommand,
+    RadioTextBufferConfiguration,
+    RadioTextSetCommand,
+    RDSEnabledSetCommand,
+    RDSLevelSetCommand,
+    RDSPhaseSetCommand,
+    RealTimeClockCorrectionSetCommand,
+    RealTimeClockEnabledSetCommand,
+    RealTimeClockSetCommand,
+    RequestCommand,
+    ResponseCode,
+    SiteAddressSetCommand,
+    SiteEncoderAddressSetCommandMode,
+    TrafficAnnouncementProgrammeSetCommand,
+    UECPCommand,
+)
+from uecp.frame import UECPFrame, UECPFrameDecoder
+
+CORPUS_MAGIC = b"UECPCORP"
+CORPUS_VERSION = 1
+# magic, version, seed, frames, corrupted frames, garbage blocks, chunk count
+_HEADER = struct.Struct("<8sHQIIII")
+
+CommandFactory = typing.Callable[["CorpusGenerator"], UECPCommand]
+COMMAND_FACTORIES: dict[type[UECPCommand], CommandFactory] = {}
+
+# RDS characters encoding to 0xFD and 0xFE, which need byte stuffing on the wire
+_STUFFED_CHARACTERS = "źŧ"
+_CHARACTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ abcdefghijklmnopqrstuvwxyz0123456789-.äöüß"
+
+
+def command_factory(
+    command_type: type[UECPCommand],
+) -> typing.Callable[[CommandFactory], CommandFactory]:
+    def register(factory: CommandFactory) -> CommandFactory:
+        COMMAND_FACTORIES[command_type] = factory
+        return factory
+
+    return register
+
+
+def parse_mix(value: str) -> dict[type[UECPCommand], float]:
+    by_name = {
+        command_type.__name__: command_type
+        for command_type in UECPCommand.ELEMENT_CODE_MAP.values()
+    }
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in by_name:
+            raise ValueError(f"Unknown command {name!r}, use one of {sorted(by_name)}")
+        mix[by_name[name]] = float(weight) if weight else 1.0
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one command needs a positive weight")
+    return mix
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class UECPCorpus:
+    data: bytes = attr.ib(repr=False)
+    chunk_lengths: array.array = attr.ib(repr=False)
+    seed: int = attr.ib(default=0)
+    frames: int = attr.ib(default=0)
+    corrupted_frames: int = attr.ib(default=0)
+    garbage_blocks: int = attr.ib(default=0)
+
+    @chunk_lengths.validator
+    def _check_chunk_lengths(self, _, chunk_lengths: array.array):
+        if sum(chunk_lengths) != len(self.data):
+            raise ValueError("Chunk lengths don't add up to the corpus size")
+
+    @property
+    def valid_frames(self) -> int:
+        return self.frames - self.corrupted_frames
+
+    def chunks(self) -> typing.Iterator[memoryview]:
+        view = memoryview(self.data)
+        offset = 0
+        for length in self.chunk_lengths:
+            yield view[offset : offset + length]
+            offset += length
+
+    def save(self, path: typing.Union[str, Path]):
+        lengths = array.array("I", self.chunk_lengths)
+        if sys.byteorder != "little":
+            lengths.byteswap()
+        with open(path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    CORPUS_MAGIC,
+                    CORPUS_VERSION,
+                    self.seed,
+                    self.frames,
+                    self.corrupted_frames,
+                    self.garbage_blocks,
+                    len(lengths),
+                )
+            )
+            f.write(lengths.tobytes())
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path: typing.Union[str, Path]) -> "UECPCorpus":
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"{path} is too short for a corpus file")
+            magic, version, seed, frames, corrupted, garbage, chunk_count = (
+                _HEADER.unpack(header)
+            )
+            if magic != CORPUS_MAGIC:
+                raise ValueError(f"{path} is not a corpus file")
+            if version != CORPUS_VERSION:
+                raise ValueError(f"Unsupported corpus version {version}")
+            lengths = array.array("I")
+            lengths.frombytes(f.read(chunk_count * lengths.itemsize))
+            if sys.byteorder != "little":
+                lengths.byteswap()
+            data = f.read()
+        return cls(
+            data=data,
+            chunk_lengths=lengths,
+            seed=seed,
+            frames=frames,
+            corrupted_frames=corrupted,
+            garbage_blocks=garbage,
+        )
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class CorpusDecodeResult:
+    frames: int = attr.ib(default=0)
+    errors: int = attr.ib(default=0)
+    bytes_decoded: int = attr.ib(default=0)
+
+
+def decode_corpus(
+    corpus: UECPCorpus, decoder: typing.Optional[UECPFrameDecoder] = None
+) -> CorpusDecodeResult:
+    """\
+    Feed the corpus chunk by chunk into decoder. Like a serial link, decoding
+    resumes after the next stop byte when a frame is broken.
+    """
+    if decoder is None:
+        decoder = UECPFrameDecoder()
+    result = CorpusDecodeResult()
+    for chunk in corpus.chunks():
+        data = bytes(chunk)
+        result.bytes_decoded += len(data)
+        start = 0
+        while start < len(data):
+            end = data.find(UECPFrame.STP, start)
+            end = len(data) if end < 0 else end + 1
+            try:
+                frame, _ = decoder.decode(data[start:end])
+            except Exception:
+                result.errors += 1
+            else:
+                if frame is not None:
+                    result.frames += 1
+            start = end
+    return result
+
+
+class CorpusGenerator:
+    def __init__(
+        self,
+        seed: int = 0,
+        mix: typing.Optional[typing.Mapping[type[UECPCommand], float]] = None,
+        stuffing_density: float = 0.0,
+        max_commands_per_frame: int = 4,
+        chunk_size: tuple[int, int] = (1, 4096),
+        garbage_rate: float = 0.0,
+        corrupt_rate: float = 0.0,
+    ):
+        if mix is None:
+            mix = {command_type: 1.0 for command_type in COMMAND_FACTORIES}
+        for command_type in mix:
+            if command_type not in COMMAND_FACTORIES:
+                raise ValueError(f"No corpus factory for {command_type.__name__}")
+        if not (0.0 <= stuffing_density <= 1.0):
+            raise ValueError("Stuffing density must be in range of 0 to 1")
+        if not (1 <= chunk_size[0] <= chunk_size[1]):
+            raise ValueError(f"Invalid chunk size range {chunk_size}")
+
+        self.seed = int(seed)
+        self.rng = random.Random(self.seed)
+        self.stuffing_density = float(stuffing_density)
+        self.max_commands_per_frame = int(max_commands_per_frame)
+        self.chunk_size = chunk_size
+        self.garbage_rate = float(garbage_rate)
+        self.corrupt_rate = float(corrupt_rate)
+        self._types = list(mix.keys())
+        self._weights = list(mix.values())
+
+    def byte(self, low: int = 0, high: int = 0xFF) -> int:
+        """\
+        Random byte in [low, high], biased towards 0xFD to 0xFF by the stuffing
+        density where that range is allowed.
+        """
+        if high >= 0xFD and self.rng.random() < self.stuffing_density:
+            return self.rng.randint(max(low, 0xFD), high)
+        return self.rng.randint(low, high)
+
+    def text(self, length: int) -> str:
+        return "".join(
+            (
+                self.rng.choice(_STUFFED_CHARACTERS)
+                if self.rng.random() < self.stuffing_density
+                else self.rng.choice(_CHARACTERS)
+            )
+            for _ in range(length)
+        )
+
+    def command(self) -> UECPCommand:
+        command_type = self.rng.choices(self._types, self._weights)[0]
+        return COMMAND_FACTORIES[command_type](self)
+
+    def frame(self) -> UECPFrame:
+        frame = UECPFrame(
+            site_address=self.byte() << 2 | self.rng.randint(0, 3),
+            encoder_address=self.rng.randint(0, 0x3F),
+            sequence_counter=self.byte(),
+        )
+        for _ in range(self.rng.randint(1, self.max_commands_per_frame)):
+            try:
+                frame.add_command(self.command())
+            except OverflowError:
+                break
+        return frame
+
+    def corrupt(self, encoded_frame: bytes) -> bytes:
+        enclosed = bytearray(byte_stuffing_codec.decode(encoded_frame[1:-1])[0])
+        enclosed[-1] ^= self.rng.randint(1, 0xFF)
+        return (
+            bytes([UECPFrame.STA])
+            + byte_stuffing_codec.encode(bytes(enclosed))[0]
+            + bytes([UECPFrame.STP])
+        )
+
+    def garbage(self) -> bytes:
+        """\
+        The torn tail of a frame as seen when joining a link mid-transmission,
+        terminated by a stop byte. It holds no other special byte, so wherever
+        the chunks split it, it is decoded as exactly one error.
+        """
+        length = self.rng.randint(1, 32)
+        return bytes(self.rng.randint(0, 0xFC) for _ in range(length)) + bytes(
+            [UECPFrame.STP]
+        )
+
+    def generate(self, size: int) -> UECPCorpus:
+        """\
+        Generate at least size bytes of whole frames and garbage blocks, split
+        into randomly sized chunks.
+        """
+        data = bytearray()
+        frames = corrupted_frames = garbage_blocks = 0
+        while len(data) < size:
+            if self.rng.random() < self.garbage_rate:
+                data += self.garbage()
+                garbage_blocks += 1
+                continue
+            encoded_frame = self.frame().encode()
+            if self.rng.random() < self.corrupt_rate:
+                encoded_frame = self.corrupt(encoded_frame)
+                corrupted_frames += 1
+            data += encoded_frame
+            frames += 1
+
+        chunk_lengths = array.array("I")
+        remaining = len(data)
+        while remaining > 0:
+            length = min(remaining, self.rng.randint(*self.chunk_size))
+            chunk_lengths.append(length)
+            remaining -= length
+
+        return UECPCorpus(
+            data=bytes(data),
+            chunk_lengths=chunk_lengths,
+            seed=self.seed,
+            frames=frames,
+            corrupted_frames=corrupted_frames,
+            garbage_blocks=garbage_blocks,
+        )
+
+
+def _dsn_psn(generator: CorpusGenerator) -> dict[str, typing.Any]:
+    return {
+        "data_set_number": generator.byte(),
+        "programme_service_number": generator.byte(),
+    }
+
+
+@command_factory(ProgrammeIdentificationSetCommand)
+def _programme_identification(g: CorpusGenerator) -> UECPCommand:
+    return ProgrammeIdentificationSetCommand(pi=g.byte() << 8 | g.byte(), **_dsn_psn(g))
+
+
+@command_factory(ProgrammeServiceNameSetCommand)
+def _programme_service_name(g: CorpusGenerator) -> UECPCommand:
+    return ProgrammeServiceNameSetCommand(ps=g.text(8), **_dsn_psn(g))
+
+
+@command_factory(TrafficAnnouncementProgrammeSetCommand)
+def _traffic_announcement_programme(g: CorpusGenerator) -> UECPCommand:
+    return TrafficAnnouncementProgrammeSetCommand(
+        announcement=g.rng.random() < 0.5, programme=g.rng.random() < 0.5, **_dsn_psn(g)
+    )
+
+
+@command_factory(DecoderInformationSetCommand)
+def _decoder_information(g: CorpusGenerator) -> UECPCommand:
+    return DecoderInformationSetCommand(
+        stereo=g.rng.random() < 0.5, dynamic_pty=g.rng.random() < 0.5, **_dsn_psn(g)
+    )
+
+
+@command_factory(ProgrammeTypeSetCommand)
+def _programme_type(g: CorpusGenerator) -> UECPCommand:
+    return ProgrammeTypeSetCommand(
+        programme_type=g.rng.choice(list(ProgrammeType)), **_dsn_psn(g)
+    )
+
+
+@command_factory(ProgrammeTypeNameSetCommand)
+def _programme_type_name(g: CorpusGenerator) -> UECPCommand:
+    return ProgrammeTypeNameSetCommand(programme_type_name=g.text(8), **_dsn_psn(g))
+
+
+@command_factory(RadioTextSetCommand)
+def _radio_text(g: CorpusGenerator) -> UECPCommand:
+    length = g.rng.randint(1, 64)
+    text = g.text(length) if length >= 61 else g.text(length - 1) + "\r"
+    return RadioTextSetCommand(
+        text=text,
+        number_of_transmissions=g.rng.randint(0, 0xF),
+        a_b_toggle=g.rng.random() < 0.5,
+        buffer_configuration=g.rng.choice(list(RadioTextBufferConfiguration)),
+        **_dsn_psn(g),
+    )
+
+
+@command_factory(RealTimeClockSetCommand)
+def _real_time_clock(g: CorpusGenerator) -> UECPCommand:
+    timestamp = datetime(2000, 1, 1, tzinfo=timezone.utc) + timedelta(
+        seconds=g.rng.randrange(100 * 365 * 86400),
+        milliseconds=g.rng.randrange(100) * 10,
+    )
+    return RealTimeClockSetCommand(timestamp=timestamp)
+
+
+@command_factory(RealTimeClockCorrectionSetCommand)
+def _real_time_clock_correction(g: CorpusGenerator) -> UECPCommand:
+    return RealTimeClockCorrectionSetCommand(
+        adjustment_ms=(g.byte() << 8 | g.byte()) - 0x8000
+    )
+
+
+@command_factory(RealTimeClockEnabledSetCommand)
+def _real_time_clock_enabled(g: CorpusGenerator) -> UECPCommand:
+    return RealTimeClockEnabledSetCommand(enable=g.rng.random() < 0.5)
+
+
+@command_factory(RDSEnabledSetCommand)
+def _rds_enabled(g: CorpusGenerator) -> UECPCommand:
+    return RDSEnabledSetCommand(enable=g.rng.random() < 0.5)
+
+
+@command_factory(RDSLevelSetCommand)
+def _rds_level(g: CorpusGenerator) -> UECPCommand:
+    return RDSLevelSetCommand(
+        reference_table=g.rng.randint(0, 7),
+        level=g.rng.randint(0, 0x1F) << 8 | g.byte(),
+    )
+
+
+@command_factory(RDSPhaseSetCommand)
+def _rds_phase(g: CorpusGenerator) -> UECPCommand:
+    return RDSPhaseSetCommand(
+        reference_table=g.rng.randint(0, 7), deci_degrees=g.rng.randint(0, 3599)
+    )
+
+
+@command_factory(MessageAcknowledgementCommand)
+def _message_acknowledgement(g: CorpusGenerator) -> UECPCommand:
+    return MessageAcknowledgementCommand(
+        code=g.rng.choice(list(ResponseCode)), sequence_counter=g.byte()
+    )
+
+
+@command_factory(RequestCommand)
+def _request(g: CorpusGenerator) -> UECPCommand:
+    command_type = g.rng.choice(list(UECPCommand.ELEMENT_CODE_MAP.values()))
+    return RequestCommand(
+        command=command_type,
+        data_set_number=(
+            g.byte() if hasattr(command_type, "data_set_number") else None
+        ),
+        programme_service_number=(
+            g.byte() if hasattr(command_type, "programme_service_number") else None
+        ),
+    )
+
+
+@command_factory(DataSetSelectCommand)
+def _data_set_select(g: CorpusGenerator) -> UECPCommand:
+    return DataSetSelectCommand(select_data_set_number=g.byte(1))
+
+
+@command_factory(SiteAddressSetCommand)
+def _site_address(g: CorpusGenerator) -> UECPCommand:
+    return SiteAddressSetCommand(
+        mode=g.rng.choice(list(SiteEncoderAddressSetCommandMode)),
+        site_address=g.rng.randint(0, 3) << 8 | g.byte(),
+    )
+
+
+@command_factory(EncoderAddressSetCommand)
+def _encoder_address(g: CorpusGenerator) -> UECPCommand:
+    return EncoderAddressSetCommand(
+        mode=g.rng.choice(list(SiteEncoderAddressSetCommandMode)),
+        encoder_address=g.rng.randint(0, 0x3F),
+    )
+
+
+@command_factory(CommunicationModeSetCommand)
+def _communication_mode(g: CorpusGenerator) -> UECPCommand:
+    return CommunicationModeSetCommand(mode=g.rng.choice(list(CommunicationMode)))
+
+
+def _parse_chunk_size(value: str) -> tuple[int, int]:
+    low, _, high = value.partition(":")
+    return int(low), int(high or low)
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m uecp.corpus", description=__doc__.splitlines()[1]
+    )
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=1 << 20, help="bytes")
+    parser.add_argument("--mix", type=parse_mix, default=None)
+    parser.add_argument("--stuffing-density", type=float, default=0.0)
+    parser.add_argument("--max-commands-per-frame", type=int, default=4)
+    parser.add_argument(
+        "--chunk-size", type=_parse_chunk_size, default=(1, 4096), metavar="MIN:MAX"
+    )
+    parser.add_argument("--garbage-rate", type=float, default=0.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--verify", action="store_true", help="decode the corpus after writing it"
+    )
+    return parser
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    generator = CorpusGenerator(
+        seed=args.seed,
+        mix=args.mix,
+        stuffing_density=args.stuffing_density,
+        max_commands_per_frame=args.max_commands_per_frame,
+        chunk_size=args.chunk_size,
+        garbage_rate=args.garbage_rate,
+        corrupt_rate=args.corrupt_rate,
+    )
+    corpus = generator.generate(args.size)
+    corpus.save(args.output)
+    print(
+        f"{args.output}: {len(corpus.data)} bytes, {corpus.frames} frames "
+        f"({corpus.corrupted_frames} corrupted), {corpus.garbage_blocks} garbage "
+        f"blocks, {len(corpus.chunk_lengths)} chunks"
+    )
+    if not args.verify:
+        return 0
+    started = time.perf_counter()
+    result = decode_corpus(corpus)
+    elapsed = time.perf_counter() - started
+    print(
+        f"decoded {result.frames} frames with {result.errors} errors in "
+        f"{elapsed:.3f}s, {result.bytes_decoded / elapsed / 1e6:.2f} MB/s"
+    )
+    expected_errors = corpus.corrupted_frames + corpus.garbage_blocks
+    return (
+        0
+        if (result.frames, result.errors)
+        == (
+            corpus.valid_frames,
+            expected_errors,
+        )
+        else 1
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
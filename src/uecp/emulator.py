@@ -0,0 +1,440 @@
+import asyncio
+import logging
+import os
+import random
+import tty
+import typing
+
+from uecp.commands import (
+    CommunicationMode,
+    CommunicationModeSetCommand,
+    DataSetSelectCommand,
+    EncoderAddressSetCommand,
+    MessageAcknowledgementCommand,
+    RDSEnabledSetCommand,
+    RequestCommand,
+    ResponseCode,
+    SiteAddressSetCommand,
+    SiteEncoderAddressSetCommandMode,
+    UECPCommand,
+)
+from uecp.commands.mixins import UECPCommandDataSetNumber
+from uecp.frame import (
+    CRCError,
+    FramingError,
+    UECPAddressFilter,
+    UECPFrame,
+    UECPFrameDecoder,
+)
+
+StateKey = tuple[int, typing.Optional[int], typing.Optional[int]]
+
+
+class UECPEncoderEmulator:
+    """\
+    Stand-in for a bidirectional UECP encoder, listening on TCP or a pty pair.
+    Set commands are stored per element code, data set and programme service
+    number and returned on request.
+    """
+
+    BITS_PER_BYTE = 10  # 8N1, start and stop bit included
+
+    # commands changing the emulator itself instead of being stored as state
+    _NOT_STORED = (
+        MessageAcknowledgementCommand.ELEMENT_CODE,
+        RequestCommand.ELEMENT_CODE,
+        SiteAddressSetCommand.ELEMENT_CODE,
+        EncoderAddressSetCommand.ELEMENT_CODE,
+    )
+
+    def __init__(
+        self,
+        site_address: int = 0,
+        encoder_address: int = 0,
+        data_set_count: int = 8,
+        ack_latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: ResponseCode = ResponseCode.MSG_NOT_ACCEPTABLE,
+        drop_rate: float = 0.0,
+        baudrate: typing.Optional[int] = None,
+        seed: typing.Optional[int] = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self.data_set_count = int(data_set_count)
+        self.ack_latency = float(ack_latency)
+        self.error_rate = float(error_rate)
+        self.error_code = ResponseCode(error_code)
+        self.drop_rate = float(drop_rate)
+        self.baudrate = baudrate
+        self._random = random.Random(seed)
+
+        self._site_addresses = {site_address}
+        self._encoder_addresses = {encoder_address}
+        self._response_site_address = site_address
+        self._response_encoder_address = encoder_address
+        self._sequence_counter = UECPFrame.UNUSED_SEQUENCE_COUNTER
+
+        self.state: dict[StateKey, list[int]] = {}
+        self.store(DataSetSelectCommand(select_data_set_number=1))
+        self.store(RDSEnabledSetCommand(enable=True))
+        self.store(
+            CommunicationModeSetCommand(
+                mode=CommunicationMode.BIDIRECTIONAL_REQUESTED_RESPONSE
+            )
+        )
+
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.errors_injected = 0
+        self.frames_dropped = 0
+        self.decode_errors = 0
+
+        self._connections: list["_EmulatorProtocol"] = []
+        self._servers: list[asyncio.AbstractServer] = []
+        self._ptys: list[tuple[int, int, "_PtyTransport"]] = []
+
+    @property
+    def address_filter(self) -> UECPAddressFilter:
+        return UECPAddressFilter(
+            site_addresses=self._site_addresses,
+            encoder_addresses=self._encoder_addresses,
+        )
+
+    @property
+    def active_data_set(self) -> int:
+        return self.state[(DataSetSelectCommand.ELEMENT_CODE, None, None)][1]
+
+    @property
+    def communication_mode(self) -> CommunicationMode:
+        return CommunicationMode(
+            self.state[(CommunicationModeSetCommand.ELEMENT_CODE, None, None)][1]
+        )
+
+    def get(
+        self,
+        command_type: type[UECPCommand],
+        data_set_number: typing.Optional[int] = None,
+        programme_service_number: typing.Optional[int] = None,
+    ) -> typing.Optional[UECPCommand]:
+        key = (command_type.ELEMENT_CODE, data_set_number, programme_service_number)
+        if key not in self.state:
+            return None
+        return command_type.create_from(self.state[key])[0]
+
+    def store(self, command: UECPCommand):
+        data = command.encode()
+        if not isinstance(command, UECPCommandDataSetNumber):
+            self.state[(command.ELEMENT_CODE, None, None)] = data
+            return
+        psn = getattr(command, "programme_service_number", None)
+        for dsn in self._resolve_data_set_number(command.data_set_number):
+            # all data set aware commands encode as MEC, DSN, ...
+            self.state[(command.ELEMENT_CODE, dsn, psn)] = [data[0], dsn] + data[2:]
+
+    def _resolve_data_set_number(self, data_set_number: int) -> list[int]:
+        active = self.active_data_set
+        if data_set_number == UECPCommandDataSetNumber.CURRENT_DATA_SET:
+            return [active]
+        if data_set_number == UECPCommandDataSetNumber.ALL_DATA_SETS:
+            return list(range(1, self.data_set_count + 1))
+        if data_set_number == UECPCommandDataSetNumber.ALL_EXCEPT_CURRENT_DATA_SET:
+            return [dsn for dsn in range(1, self.data_set_count + 1) if dsn != active]
+        if data_set_number > self.data_set_count:
+            raise _CommandError(ResponseCode.DSN_ERROR)
+        return [data_set_number]
+
+    def _next_sequence_counter(self) -> int:
+        self._sequence_counter = self._sequence_counter % 0xFF + 1
+        return self._sequence_counter
+
+    def _frame(self, commands: list[UECPCommand]) -> UECPFrame:
+        return UECPFrame(
+            site_address=self._response_site_address,
+            encoder_address=self._response_encoder_address,
+            sequence_counter=self._next_sequence_counter(),
+            commands=commands,
+        )
+
+    def _ack(
+        self, code: ResponseCode = ResponseCode.OK, sequence_counter: int = 0
+    ) -> UECPFrame:
+        return self._frame(
+            [
+                MessageAcknowledgementCommand(
+                    code=code, sequence_counter=sequence_counter
+                )
+            ]
+        )
+
+    def handle_frame(self, frame: UECPFrame) -> list[UECPFrame]:
+        self.frames_received += 1
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            self.frames_dropped += 1
+            return []
+        acknowledge = self.communication_mode is not CommunicationMode.UNIDIRECTIONAL
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors_injected += 1
+            if not acknowledge:
+                return []
+            return [self._ack(self.error_code, frame.sequence_counter)]
+
+        responses: list[UECPCommand] = []
+        try:
+            for command in frame.commands:
+                responses += self._handle_command(command)
+        except _CommandError as e:
+            return [self._ack(e.code, frame.sequence_counter)] if acknowledge else []
+
+        frames = [self._ack()] if acknowledge else []
+        response_frame: typing.Optional[UECPFrame] = None
+        for response in responses:
+            if response_frame is None:
+                response_frame = self._frame([])
+            try:
+                response_frame.add_command(response)
+            except OverflowError:
+                frames.append(response_frame)
+                response_frame = self._frame([response])
+        if response_frame is not None:
+            frames.append(response_frame)
+        return frames
+
+    def handle_decode_error(self, exc: Exception) -> list[UECPFrame]:
+        self.decode_errors += 1
+        self.logger.debug(f"Decoding failed {exc!r}")
+        if self.communication_mode is CommunicationMode.UNIDIRECTIONAL:
+            return []
+        if isinstance(exc, CRCError):
+            return [self._ack(ResponseCode.CRC_ERROR)]
+        if isinstance(exc, FramingError):
+            return [self._ack(ResponseCode.UNEXPECTED_END_OF_MSG)]
+        if isinstance(exc, UnicodeError):
+            return [self._ack(ResponseCode.BAD_STUFFING)]
+        return [self._ack(ResponseCode.MSG_UNKNOWN)]
+
+    def _handle_command(self, command: UECPCommand) -> list[UECPCommand]:
+        if isinstance(command, RequestCommand):
+            return self._handle_request(command)
+        if isinstance(command, SiteAddressSetCommand):
+            self._update_addresses(
+                self._site_addresses, command.mode, command.site_address
+            )
+        elif isinstance(command, EncoderAddressSetCommand):
+            self._update_addresses(
+                self._encoder_addresses, command.mode, command.encoder_address
+            )
+        elif isinstance(command, DataSetSelectCommand):
+            if command.select_data_set_number > self.data_set_count:
+                raise _CommandError(ResponseCode.DSN_ERROR)
+        if command.ELEMENT_CODE not in self._NOT_STORED:
+            self.store(command)
+        return []
+
+    def _handle_request(self, request: RequestCommand) -> list[UECPCommand]:
+        command_type = UECPCommand.ELEMENT_CODE_MAP.get(request.element_code)
+        if command_type is None:
+            raise _CommandError(ResponseCode.MSG_UNKNOWN)
+        dsn = request.data_set_number
+        if dsn is not None:
+            dsn = self._resolve_data_set_number(dsn)[0]
+        key = (request.element_code, dsn, request.programme_service_number)
+        if key not in self.state:
+            return []
+        return [command_type.create_from(self.state[key])[0]]
+
+    def _update_addresses(
+        self, addresses: set[int], mode: SiteEncoderAddressSetCommandMode, value: int
+    ):
+        if mode is SiteEncoderAddressSetCommandMode.ADD_SINGLE:
+            addresses.add(value)
+        elif mode is SiteEncoderAddressSetCommandMode.REMOVE_SINGLE:
+            addresses.discard(value)
+        elif mode is SiteEncoderAddressSetCommandMode.REMOVE_ALL:
+            addresses.clear()
+        for connection in self._connections:
+            connection.address_filter = self.address_filter
+
+    def transmission_time(self, byte_count: int) -> float:
+        if not self.baudrate:
+            return 0.0
+        return byte_count * self.BITS_PER_BYTE / self.baudrate
+
+    def create_protocol(self) -> "_EmulatorProtocol":
+        return _EmulatorProtocol(self)
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        server = await asyncio.get_running_loop().create_server(
+            self.create_protocol, host, port
+        )
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def open_pty(self) -> str:
+        """\
+        Create a pty pair, serve the master side and return the path of the slave
+        side to be opened like a serial port.
+        """
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        loop = asyncio.get_running_loop()
+        transport = _PtyTransport(master, loop)
+        protocol = self.create_protocol()
+        protocol.connection_made(transport)
+        loop.add_reader(master, self._pty_readable, master, protocol)
+        self._ptys.append((master, slave, transport))
+        return os.ttyname(slave)
+
+    def _pty_readable(self, master: int, protocol: "_EmulatorProtocol"):
+        try:
+            data = os.read(master, 4096)
+        except OSError:
+            data = b""
+        if data:
+            protocol.data_received(data)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        for connection in list(self._connections):
+            connection.close()
+        for master, slave, transport in self._ptys:
+            transport.close()
+            loop.remove_reader(master)
+            os.close(master)
+            os.close(slave)
+        self._ptys.clear()
+
+
+class _CommandError(Exception):
+    def __init__(self, code: ResponseCode):
+        self.code = code
+
+
+class _PtyTransport(asyncio.Transport):
+    """\
+    Writes to the non-blocking master side of a pty, what the pty doesn't take
+    is buffered and written once the pty is writable again.
+    """
+
+    def __init__(self, fd: int, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._fd = fd
+        self._loop = loop
+        self._buffer = bytearray()
+        self._closing = False
+        os.set_blocking(fd, False)
+
+    def write(self, data):
+        if self._closing:
+            return
+        if not self._buffer:
+            data = data[self._write_some(data) :]
+            if not data:
+                return
+            self._loop.add_writer(self._fd, self._write_ready)
+        self._buffer += data
+
+    def _write_some(self, data) -> int:
+        try:
+            return os.write(self._fd, data)
+        except BlockingIOError:
+            return 0
+        except OSError as e:
+            # nobody on the slave side, the data is lost like on a serial line
+            self.logger.debug(f"Writing to pty failed {e!r}")
+            return len(data)
+
+    def _write_ready(self):
+        del self._buffer[: self._write_some(self._buffer)]
+        if not self._buffer:
+            self._loop.remove_writer(self._fd)
+
+    def get_write_buffer_size(self) -> int:
+        return len(self._buffer)
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._buffer.clear()
+        self._loop.remove_writer(self._fd)
+
+
+class _EmulatorProtocol(asyncio.Protocol):
+    def __init__(self, emulator: UECPEncoderEmulator):
+        self._emulator = emulator
+        self._decoder = UECPFrameDecoder(address_filter=emulator.address_filter)
+        self._transport: typing.Optional[asyncio.BaseTransport] = None
+        self._rx_busy_until = 0.0
+        self._tx_busy_until = 0.0
+
+    @property
+    def address_filter(self) -> typing.Optional[UECPAddressFilter]:
+        return self._decoder.address_filter
+
+    @address_filter.setter
+    def address_filter(self, value: typing.Optional[UECPAddressFilter]):
+        self._decoder.address_filter = value
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self._transport = transport
+        self._emulator._connections.append(self)
+
+    def connection_lost(self, exc: typing.Optional[Exception]):
+        self._transport = None
+        if self in self._emulator._connections:
+            self._emulator._connections.remove(self)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+        self.connection_lost(None)
+
+    def data_received(self, data: bytes):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._rx_busy_until = max(
+            now, self._rx_busy_until
+        ) + self._emulator.transmission_time(len(data))
+
+        responses: list[UECPFrame] = []
+        # feed the decoder up to one stop byte at a time, so a broken frame
+        # doesn't affect the following ones
+        start = 0
+        while start < len(data):
+            end = data.find(UECPFrame.STP, start)
+            end = len(data) if end < 0 else end + 1
+            try:
+                frame, _ = self._decoder.decode(data[start:end])
+            except Exception as e:
+                responses += self._emulator.handle_decode_error(e)
+            else:
+                if frame is not None:
+                    responses += self._emulator.handle_frame(frame)
+            start = end
+
+        for response in responses:
+            self._send(response.encode(), loop)
+
+    def _send(self, data: bytes, loop: asyncio.AbstractEventLoop):
+        start = max(
+            self._rx_busy_until + self._emulator.ack_latency, self._tx_busy_until
+        )
+        self._tx_busy_until = start + self._emulator.transmission_time(len(data))
+        if self._tx_busy_until <= loop.time():
+            self._write(data)
+        else:
+            loop.call_at(self._tx_busy_until, self._write, data)
+
+    def _write(self, data: bytes):
+        if self._transport is None:
+            return
+        typing.cast(asyncio.WriteTransport, self._transport).write(data)
+        self._emulator.frames_sent += 1
@@ -1,7 +1,8 @@
+import binascii
 import codecs
 import typing
 
-from crc import Configuration, CrcCalculator  # type: ignore
+from crc import Configuration  # type: ignore
 
 from uecp.byte_stuffing_codec import (
     IncrementalDecoder as ByteStuffingIncrementalDecoder,
@@ -9,6 +10,24 @@ from uecp.byte_stuffing_codec import (
 from uecp.commands.base import UECPCommand
 
 
+class CRCError(ValueError):
+    pass
+
+
+class FramingError(ValueError):
+    pass
+
+
+def crc16(data: typing.Union[bytes, bytearray, memoryview, list[int]]) -> int:
+    """\
+    UECP frame checksum, equal to UECPFrame.CRC_CONFIGURATION but computed by
+    binascii.
+    """
+    if isinstance(data, list):
+        data = bytes(data)
+    return binascii.crc_hqx(data, 0xFFFF) ^ 0xFFFF
+
+
 class UECPFrame:
     STA = 0xFE
     STP = 0xFF
@@ -125,8 +144,7 @@ class UECPFrame:
         data.append(len(msg_data))
         data += msg_data
 
-        crc_calculator = CrcCalculator(self.CRC_CONFIGURATION)
-        crc = crc_calculator.calculate_checksum(data)
+        crc = crc16(data)
         data.append(crc >> 8)
         data.append(crc & 0xFF)
 
@@ -136,21 +154,37 @@ class UECPFrame:
 
     @classmethod
     def create_from_enclosed(cls, data: typing.Union[bytes, list[int]]) -> "UECPFrame":
+        site_address, encoder_address, sequence_counter, msg_data = cls._parse_enclosed(
+            data
+        )
+
+        commands = UECPCommand.decode_commands(msg_data)
+
+        return cls(
+            site_address=site_address,
+            encoder_address=encoder_address,
+            sequence_counter=sequence_counter,
+            commands=commands,
+        )
+
+    @classmethod
+    def _parse_enclosed(
+        cls, data: typing.Union[bytes, list[int]]
+    ) -> tuple[int, int, int, typing.Union[bytes, list[int]]]:
         if len(data) < 6:
-            raise ValueError("not enough data")
+            raise FramingError("not enough data")
 
         data, crc_high, crc_low = data[:-2], data[-2], data[-1]
         crc = crc_high << 8 | crc_low
 
-        crc_calculator = CrcCalculator(cls.CRC_CONFIGURATION)
-        crc_computed = crc_calculator.calculate_checksum(data)
+        crc_computed = crc16(data)
         if crc != crc_computed:
-            raise ValueError(f"CRC error {crc} vs {crc_computed}")
+            raise CRCError(f"CRC error {crc} vs {crc_computed}")
 
         address_high, address_low, sequence_counter = data[0:3]
         msg_len, msg_data = data[3], data[4:]
         if msg_len != len(msg_data):
-            raise ValueError(
+            raise FramingError(
                 f"Data length doesn't match, expected {msg_len}, given {len(msg_data)}"
             )
 
@@ -159,22 +193,67 @@ class UECPFrame:
         site_address = address >> 6
         encoder_address = address & 0x3F
 
-        commands = UECPCommand.decode_commands(msg_data)
+        return site_address, encoder_address, sequence_counter, msg_data
 
-        return cls(
-            site_address=site_address,
-            encoder_address=encoder_address,
-            sequence_counter=sequence_counter,
-            commands=commands,
+
+class UECPAddressFilter:
+    def __init__(
+        self,
+        site_addresses: typing.Optional[typing.Iterable[int]] = None,
+        encoder_addresses: typing.Optional[typing.Iterable[int]] = None,
+    ):
+        self._site_addresses: typing.Optional[frozenset[int]] = (
+            frozenset(site_addresses) if site_addresses is not None else None
+        )
+        self._encoder_addresses: typing.Optional[frozenset[int]] = (
+            frozenset(encoder_addresses) if encoder_addresses is not None else None
+        )
+
+    @property
+    def site_addresses(self) -> typing.Optional[frozenset[int]]:
+        return self._site_addresses
+
+    @property
+    def encoder_addresses(self) -> typing.Optional[frozenset[int]]:
+        return self._encoder_addresses
+
+    def matches(self, site_address: int, encoder_address: int) -> bool:
+        if (
+            self._site_addresses is not None
+            and site_address != UECPFrame.ALL_SITES
+            and site_address not in self._site_addresses
+        ):
+            return False
+        if (
+            self._encoder_addresses is not None
+            and encoder_address != UECPFrame.ALL_ENCODERS
+            and encoder_address not in self._encoder_addresses
+        ):
+            return False
+        return True
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(site_addresses={self._site_addresses!r}, "
+            f"encoder_addresses={self._encoder_addresses!r})"
         )
 
 
 class UECPFrameDecoder:
-    def __init__(self):
+    def __init__(self, address_filter: typing.Optional[UECPAddressFilter] = None):
         self._start_bit_seen = False
-        self._enclosed_data = []
+        self._enclosed_data: list[int] = []
         self._enclosed_incremental_decoder = ByteStuffingIncrementalDecoder()
 
+        self.address_filter = address_filter
+        self.filtered_frames = 0
+
+        self.frames_decoded = 0
+        self.crc_errors = 0
+        self.framing_errors = 0
+        self.command_errors = 0
+        self.resyncs = 0
+
     def decode(
         self, data: typing.Union[bytes, list[int]]
     ) -> tuple[typing.Optional[UECPFrame], typing.Union[bytes, list[int]]]:
@@ -183,25 +262,59 @@ class UECPFrameDecoder:
         try:
             for i, byte in enumerate(data, start=1):
                 if byte == UECPFrame.STA:
+                    if not self.empty:
+                        # previous frame torn or garbage in front, start over
+                        self.resyncs += 1
+                        self.reset()
                     self._start_bit_seen = True
                 elif byte == UECPFrame.STP:
                     if self._start_bit_seen is False:
-                        raise ValueError("Stop bit seen, but no start bit")
+                        raise FramingError("Stop bit seen, but no start bit")
                     if len(self._enclosed_data) <= 1:
-                        raise ValueError("No payload data decoded")
-                    frame = UECPFrame.create_from_enclosed(self._enclosed_data)
+                        raise FramingError("No payload data decoded")
+                    if self.address_filter is None:
+                        frame = UECPFrame.create_from_enclosed(self._enclosed_data)
+                    else:
+                        filtered_frame = self._decode_filtered(self.address_filter)
+                        if filtered_frame is None:
+                            self.filtered_frames += 1
+                            self.reset()
+                            continue
+                        frame = filtered_frame
                     self.reset()
+                    self.frames_decoded += 1
                     return frame, data[i:]
                 else:
                     self._enclosed_data += list(
                         self._enclosed_incremental_decoder.decode([byte])
                     )
         except Exception as e:
+            if isinstance(e, CRCError):
+                self.crc_errors += 1
+            elif isinstance(e, (FramingError, UnicodeError)):
+                self.framing_errors += 1
+            else:
+                self.command_errors += 1
             self.reset()
             raise e
 
         return None, data[i:]
 
+    def _decode_filtered(
+        self, address_filter: UECPAddressFilter
+    ) -> typing.Optional[UECPFrame]:
+        site_address, encoder_address, sequence_counter, msg_data = (
+            UECPFrame._parse_enclosed(self._enclosed_data)
+        )
+        if not address_filter.matches(site_address, encoder_address):
+            return None
+        return UECPFrame(
+            site_address=site_address,
+            encoder_address=encoder_address,
+            sequence_counter=sequence_counter,
+            commands=UECPCommand.decode_commands(msg_data),
+        )
+
     def reset(self):
         self._enclosed_data.clear()
         self._enclosed_incremental_decoder.reset()
@@ -210,6 +323,7 @@ class UECPFrameDecoder:
     @property
     def empty(self) -> bool:
         return (
-            len(self._enclosed_data) == 0
-            and self._enclosed_incremental_decoder.getstate()[1] == 1
+            not self._start_bit_seen
+            and len(self._enclosed_data) == 0
+            and self._enclosed_incremental_decoder.getstate()[1] == 0
         )
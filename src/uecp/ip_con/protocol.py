@@ -0,0 +1,145 @@
+import asyncio
+import socket
+import typing
+from asyncio import transports
+from typing import Optional
+
+from uecp.frame import UECPAddressFilter
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+Address = tuple[str, int]
+
+
+class UECPDatagramProtocol(UECPSerialProtocol, asyncio.DatagramProtocol):
+    def __init__(
+        self,
+        address_filter: Optional[UECPAddressFilter] = None,
+        reply_to_sender: bool = False,
+    ) -> None:
+        super().__init__(address_filter=address_filter)
+        self._reply_to_sender = reply_to_sender
+        self._peer: Optional[Address] = None
+
+    @property
+    def peer(self) -> Optional[Address]:
+        return self._peer
+
+    def datagram_received(self, data: bytes, addr: Address):
+        if self._reply_to_sender:
+            self._peer = addr
+        self.data_received(data)
+
+    def error_received(self, exc: Exception):
+        self.logger.error(f"Error received {exc!r}")
+
+    def _write_data(self, data: bytes):
+        transport = typing.cast(transports.DatagramTransport, self._transport)
+        if self._reply_to_sender:
+            if self._peer is None:
+                self.logger.error("No datagram received yet, peer unknown")
+                return
+            transport.sendto(data, self._peer)
+        else:
+            transport.sendto(data)
+
+
+def configure_socket(
+    sock: Optional[socket.socket],
+    nodelay: bool = True,
+    keepalive: bool = True,
+    keepalive_idle: Optional[int] = None,
+    keepalive_interval: Optional[int] = None,
+    keepalive_count: Optional[int] = None,
+):
+    if sock is None:
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(keepalive))
+    if not keepalive:
+        return
+    # platform specific keepalive tuning, silently skipped where unavailable
+    for option_name, value in (
+        ("TCP_KEEPIDLE", keepalive_idle),
+        ("TCP_KEEPINTVL", keepalive_interval),
+        ("TCP_KEEPCNT", keepalive_count),
+    ):
+        if value is not None and hasattr(socket, option_name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option_name), value)
+
+
+async def open_tcp_protocol(
+    host: str,
+    port: int,
+    address_filter: Optional[UECPAddressFilter] = None,
+    nodelay: bool = True,
+    keepalive: bool = True,
+    keepalive_idle: Optional[int] = None,
+    keepalive_interval: Optional[int] = None,
+    keepalive_count: Optional[int] = None,
+) -> UECPSerialProtocol:
+    transport, protocol = await asyncio.get_running_loop().create_connection(
+        lambda: UECPSerialProtocol(address_filter=address_filter), host, port
+    )
+    configure_socket(
+        transport.get_extra_info("socket"),
+        nodelay=nodelay,
+        keepalive=keepalive,
+        keepalive_idle=keepalive_idle,
+        keepalive_interval=keepalive_interval,
+        keepalive_count=keepalive_count,
+    )
+    return protocol
+
+
+async def start_tcp_server(
+    host: Optional[str],
+    port: int,
+    client_connected_callback: typing.Callable[[UECPSerialProtocol], None],
+    address_filter: Optional[UECPAddressFilter] = None,
+    nodelay: bool = True,
+    keepalive: bool = True,
+) -> asyncio.Server:
+    def protocol_factory() -> UECPSerialProtocol:
+        protocol = UECPSerialProtocol(address_filter=address_filter)
+
+        def connection_made():
+            assert protocol.transport is not None
+            configure_socket(
+                protocol.transport.get_extra_info("socket"),
+                nodelay=nodelay,
+                keepalive=keepalive,
+            )
+            client_connected_callback(protocol)
+
+        protocol.connection_made_callbacks.append(connection_made)
+        return protocol
+
+    return await asyncio.get_running_loop().create_server(protocol_factory, host, port)
+
+
+async def open_udp_protocol(
+    host: str,
+    port: int,
+    local_addr: Optional[Address] = None,
+    address_filter: Optional[UECPAddressFilter] = None,
+) -> UECPDatagramProtocol:
+    _, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: UECPDatagramProtocol(address_filter=address_filter),
+        local_addr=local_addr,
+        remote_addr=(host, port),
+    )
+    return protocol
+
+
+async def start_udp_server(
+    host: str,
+    port: int,
+    address_filter: Optional[UECPAddressFilter] = None,
+) -> UECPDatagramProtocol:
+    _, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: UECPDatagramProtocol(
+            address_filter=address_filter, reply_to_sender=True
+        ),
+        local_addr=(host, port),
+    )
+    return protocol
@@ -0,0 +1,440 @@
+"""\
+Load generator and soak test for UECP endpoints.
+
+    python -m uecp.loadgen --emulate --connections 8 --duration 10
+    python -m uecp.loadgen --tcp 192.0.2.10:4001 --mix rt=4,ps=2,ta=1,poll=1
+
+The reported process CPU time is that of the load generator. With --emulate
+the emulator runs in a child process and its CPU time is reported separately.
+
+Acknowledgement latencies are only sampled for acknowledgements matched to
+their frame for certain. An OK acknowledgement after a retransmit may still be
+the late one of the attempt before, it is counted as uncertain instead.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import time
+import typing
+
+import attr
+
+from uecp.cli_util import parse_host_port, parse_port_baudrate, percentile
+from uecp.commands import (
+    DataSetSelectCommand,
+    ProgrammeServiceNameSetCommand,
+    RadioTextSetCommand,
+    RDSEnabledSetCommand,
+    RequestCommand,
+    ResponseCode,
+    TrafficAnnouncementProgrammeSetCommand,
+    UECPCommand,
+)
+from uecp.frame import UECPFrame
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+ProtocolOpener = typing.Callable[[], typing.Awaitable[UECPSerialProtocol]]
+
+TRAFFIC_KINDS = ("rt", "ps", "ta", "poll")
+
+_WORDS = (
+    "NOW PLAYING NEWS TRAFFIC WEATHER JAZZ ROCK LIVE MORNING SHOW RADIO "
+    "CITY MUSIC NONSTOP HITS CLASSIC EVENING LATE NIGHT"
+).split()
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in TRAFFIC_KINDS:
+            raise ValueError(
+                f"Unknown traffic kind {kind!r}, use one of {TRAFFIC_KINDS}"
+            )
+        mix[kind] = float(weight) if weight else 1.0
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one traffic kind needs a positive weight")
+    return mix
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class LoadReport:
+    connections: int = attr.ib()
+    duration: float = attr.ib()
+    frames_sent: int = attr.ib()
+    frames_acknowledged: int = attr.ib()
+    retransmits: int = attr.ib()
+    failures: int = attr.ib()
+    error_acks: int = attr.ib()
+    uncertain_acks: int = attr.ib(default=0)
+    # CPU time of the load generator process during the run
+    cpu_seconds: float = attr.ib()
+    # CPU time of an emulator in a child process, if any
+    emulator_cpu_seconds: typing.Optional[float] = attr.ib(default=None)
+    ack_latencies: list[float] = attr.ib(repr=False)
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.frames_sent / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def retransmit_rate(self) -> float:
+        return self.retransmits / self.frames_sent if self.frames_sent else 0.0
+
+    @property
+    def cpu_per_frame(self) -> float:
+        return self.cpu_seconds / self.frames_sent if self.frames_sent else 0.0
+
+    def summary(self) -> dict[str, typing.Any]:
+        latencies = sorted(self.ack_latencies)
+        summary = {
+            "connections": self.connections,
+            "duration_s": round(self.duration, 3),
+            "frames_sent": self.frames_sent,
+            "frames_acknowledged": self.frames_acknowledged,
+            "frames_per_second": round(self.frames_per_second, 1),
+            "retransmits": self.retransmits,
+            "retransmit_rate": round(self.retransmit_rate, 4),
+            "failures": self.failures,
+            "error_acks": self.error_acks,
+            "uncertain_acks": self.uncertain_acks,
+            "ack_latency_ms": {
+                f"p{q}": round(percentile(latencies, q) * 1000, 3)
+                for q in (50, 90, 99, 100)
+            },
+            "process_cpu_s": round(self.cpu_seconds, 3),
+            "process_cpu_us_per_frame": round(self.cpu_per_frame * 1_000_000, 1),
+        }
+        if self.emulator_cpu_seconds is not None:
+            per_frame = (
+                self.emulator_cpu_seconds / self.frames_sent
+                if self.frames_sent
+                else 0.0
+            )
+            summary["emulator_cpu_s"] = round(self.emulator_cpu_seconds, 3)
+            summary["emulator_cpu_us_per_frame"] = round(per_frame * 1_000_000, 1)
+        return summary
+
+
+class _Connection:
+    def __init__(
+        self,
+        protocol: UECPSerialProtocol,
+        rng: random.Random,
+        mix: dict[str, float],
+    ):
+        self.protocol = protocol
+        self._rng = rng
+        self._kinds = list(mix.keys())
+        self._weights = list(mix.values())
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+        self._acks.uncertain_callbacks.append(self._ack_uncertain)
+        self._uncertain = False
+        self._ps_text = " ".join(rng.sample(_WORDS, 6))
+        self._ps_offset = 0
+        self._ta = False
+        self._a_b_toggle = False
+
+        self.frames_sent = 0
+        self.frames_acknowledged = 0
+        self.retransmits = 0
+        self.failures = 0
+        self.error_acks = 0
+        self.uncertain_acks = 0
+        self.ack_latencies: list[float] = []
+
+    def close(self):
+        self._acks.uncertain_callbacks.remove(self._ack_uncertain)
+        if self.protocol.transport is not None:
+            self.protocol.transport.close()
+
+    def _ack_uncertain(self, frame: UECPFrame):
+        # a single frame is in flight per connection
+        self._uncertain = True
+
+    def next_commands(self) -> list[UECPCommand]:
+        kind = self._rng.choices(self._kinds, self._weights)[0]
+        if kind == "rt":
+            self._a_b_toggle = not self._a_b_toggle
+            words = " ".join(self._rng.choices(_WORDS, k=self._rng.randint(2, 8)))
+            return [
+                RadioTextSetCommand(text=words[:60] + "\r", a_b_toggle=self._a_b_toggle)
+            ]
+        if kind == "ps":
+            text = self._ps_text + " " * 8
+            self._ps_offset = (self._ps_offset + 1) % len(self._ps_text)
+            return [
+                ProgrammeServiceNameSetCommand(
+                    ps=text[self._ps_offset : self._ps_offset + 8]
+                )
+            ]
+        if kind == "ta":
+            self._ta = not self._ta
+            return [
+                TrafficAnnouncementProgrammeSetCommand(
+                    announcement=self._ta, programme=True
+                )
+            ]
+        return [
+            RequestCommand(command=DataSetSelectCommand),
+            RequestCommand(command=RDSEnabledSetCommand),
+        ]
+
+    async def send(self, ack_timeout: float, retries: int):
+        frame = UECPFrame(commands=self.next_commands())
+        loop = asyncio.get_running_loop()
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                self.retransmits += 1
+            waiter: asyncio.Future[ResponseCode] = loop.create_future()
+            self._uncertain = False
+            sent_at = time.perf_counter()
+            # each attempt is written with a sequence counter of its own
+            self._acks.write(frame, waiter, ack_timeout)
+            self.frames_sent += 1
+            try:
+                code = await asyncio.wait_for(waiter, ack_timeout)
+            except TimeoutError:
+                continue
+            if self._uncertain:
+                # possibly the late acknowledgement of the attempt before
+                self.uncertain_acks += 1
+            else:
+                self.ack_latencies.append(time.perf_counter() - sent_at)
+            if code is ResponseCode.OK:
+                self.frames_acknowledged += 1
+                return
+            self.error_acks += 1
+        self.failures += 1
+
+
+class LoadGenerator:
+    def __init__(
+        self,
+        openers: typing.Sequence[ProtocolOpener],
+        mix: typing.Optional[dict[str, float]] = None,
+        rate: typing.Optional[float] = None,
+        ack_timeout: float = 1.0,
+        retries: int = 2,
+        seed: typing.Optional[int] = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._openers = list(openers)
+        self.mix = mix or {"rt": 4, "ps": 2, "ta": 1, "poll": 1}
+        self.rate = rate
+        self.ack_timeout = float(ack_timeout)
+        self.retries = int(retries)
+        self._random = random.Random(seed)
+
+    async def run(self, duration: float) -> LoadReport:
+        protocols = await asyncio.gather(*(opener() for opener in self._openers))
+        connections = [
+            _Connection(protocol, random.Random(self._random.random()), self.mix)
+            for protocol in protocols
+        ]
+        loop = asyncio.get_running_loop()
+        cpu_start = time.process_time()
+        start = loop.time()
+        deadline = start + duration
+        try:
+            await asyncio.gather(
+                *(
+                    self._drive(connection, start, deadline)
+                    for connection in connections
+                )
+            )
+        finally:
+            elapsed = loop.time() - start
+            cpu_seconds = time.process_time() - cpu_start
+            for connection in connections:
+                connection.close()
+
+        return LoadReport(
+            connections=len(connections),
+            duration=elapsed,
+            frames_sent=sum(c.frames_sent for c in connections),
+            frames_acknowledged=sum(c.frames_acknowledged for c in connections),
+            retransmits=sum(c.retransmits for c in connections),
+            failures=sum(c.failures for c in connections),
+            error_acks=sum(c.error_acks for c in connections),
+            uncertain_acks=sum(c.uncertain_acks for c in connections),
+            cpu_seconds=cpu_seconds,
+            ack_latencies=[latency for c in connections for latency in c.ack_latencies],
+        )
+
+    async def _drive(self, connection: _Connection, start: float, deadline: float):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.rate if self.rate else 0.0
+        n = 0
+        while loop.time() < deadline:
+            if interval:
+                # schedule against the start time to avoid accumulating drift
+                delay = start + n * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                n += 1
+            await connection.send(self.ack_timeout, self.retries)
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m uecp.loadgen", description=__doc__.splitlines()[1]
+    )
+    target = parser.add_argument_group("targets")
+    target.add_argument("--tcp", action="append", default=[], metavar="HOST:PORT")
+    target.add_argument("--serial", action="append", default=[], metavar="PORT:BAUD")
+    target.add_argument(
+        "--emulate",
+        action="store_true",
+        help="start a local encoder emulator in a child process",
+    )
+    parser.add_argument(
+        "--connections", type=int, default=1, help="connections per TCP target"
+    )
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--rate", type=float, default=None, help="frames/s per connection"
+    )
+    parser.add_argument("--mix", type=parse_mix, default="rt=4,ps=2,ta=1,poll=1")
+    parser.add_argument("--ack-timeout", type=float, default=1.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--emulator-latency", type=float, default=0.0, help="seconds, --emulate only"
+    )
+    parser.add_argument(
+        "--emulator-baudrate", type=int, default=None, help="--emulate only"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    return parser
+
+
+def _serve_emulator(connection, **kwargs):
+    """\
+    Child process serving an emulator on TCP, sends the port on connection
+    and stops once anything is received, sending the CPU time spent serving.
+    """
+    from uecp.emulator import UECPEncoderEmulator
+
+    async def serve():
+        emulator = UECPEncoderEmulator(**kwargs)
+        port = await emulator.start_tcp()
+        cpu_start = time.process_time()
+        connection.send(port)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(connection.fileno(), stop.set)
+        try:
+            await stop.wait()
+        finally:
+            loop.remove_reader(connection.fileno())
+            await emulator.close()
+            connection.send(time.process_time() - cpu_start)
+
+    asyncio.run(serve())
+
+
+class _EmulatorProcess:
+    """\
+    Emulator in a child process, keeping its CPU time apart from the load
+    generator's.
+    """
+
+    def __init__(self, **kwargs):
+        context = multiprocessing.get_context("spawn")
+        self._connection, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve_emulator, args=(child,), kwargs=kwargs, daemon=True
+        )
+
+    async def start(self, timeout: float = 10.0) -> int:
+        self._process.start()
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._connection.poll, timeout):
+            self._process.kill()
+            raise TimeoutError("Emulator process did not start")
+        return self._connection.recv()
+
+    async def close(self, timeout: float = 5.0) -> typing.Optional[float]:
+        """\
+        Stop the emulator, returns the CPU time it spent serving, None if it
+        didn't stop in time.
+        """
+        cpu_seconds = None
+        if self._process.is_alive():
+            self._connection.send(None)
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self._connection.poll, timeout):
+                cpu_seconds = self._connection.recv()
+            await loop.run_in_executor(None, self._process.join, timeout)
+        if self._process.is_alive():
+            self._process.kill()
+        self._connection.close()
+        return cpu_seconds
+
+
+async def _main(args: argparse.Namespace) -> LoadReport:
+    from uecp.ip_con.protocol import open_tcp_protocol
+    from uecp.serial_con.protocol import open_serial_protocol
+
+    emulator = None
+    tcp_targets = [parse_host_port(value) for value in args.tcp]
+    serial_targets = [parse_port_baudrate(value) for value in args.serial]
+    if args.emulate:
+        emulator = _EmulatorProcess(
+            ack_latency=args.emulator_latency,
+            baudrate=args.emulator_baudrate,
+            seed=args.seed,
+        )
+        tcp_targets.append(("127.0.0.1", await emulator.start()))
+
+    openers: list[ProtocolOpener] = []
+    for host, port in tcp_targets:
+        for _ in range(args.connections):
+            openers.append(functools.partial(open_tcp_protocol, host, port))
+    for serial_port, baudrate in serial_targets:
+        openers.append(functools.partial(open_serial_protocol, serial_port, baudrate))
+    if not openers:
+        raise SystemExit("No target given, use --tcp, --serial or --emulate")
+
+    generator = LoadGenerator(
+        openers,
+        mix=args.mix,
+        rate=args.rate,
+        ack_timeout=args.ack_timeout,
+        retries=args.retries,
+        seed=args.seed,
+    )
+    try:
+        report = await generator.run(args.duration)
+    finally:
+        if emulator is not None:
+            emulator_cpu_seconds = await emulator.close()
+    if emulator is not None:
+        report.emulator_cpu_seconds = emulator_cpu_seconds
+    return report
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    report = asyncio.run(_main(args))
+    summary = report.summary()
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for key, value in summary.items():
+            print(f"{key:>20}: {value}")
+    return 0 if report.failures == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
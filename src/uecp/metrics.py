@@ -0,0 +1,232 @@
+"""\
+Counters and histograms of the protocol hot paths, read as a snapshot or
+exported in the Prometheus text format.
+
+    registry = MetricsRegistry()
+    registry.register(protocol.collect_metrics, link="encoder1")
+    exporter = MetricsExporter(registry)
+    await exporter.start(port=9464)
+
+Sources only count into plain integers and histograms, metrics are built when
+collected, hence nothing is spent while nobody looks.
+"""
+
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import typing
+
+import attr
+
+# seconds, from the decode time of a short frame up to a stalled callback
+DEFAULT_TIME_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.1,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@attr.s(auto_detect=True, frozen=True, slots=True)
+class HistogramSnapshot:
+    bounds: tuple[float, ...] = attr.ib()
+    # per bucket, the last one for values above all bounds
+    counts: tuple[int, ...] = attr.ib()
+    count: int = attr.ib()
+    sum: float = attr.ib()
+
+    def cumulative(self) -> typing.Iterator[tuple[float, int]]:
+        """\
+        Yield (upper bound, values <= upper bound) as exported to Prometheus.
+        """
+        return zip(
+            itertools.chain(self.bounds, (math.inf,)),
+            itertools.accumulate(self.counts),
+        )
+
+    def quantile(self, q: float) -> float:
+        """\
+        Upper bound of the bucket holding the q quantile, 0 <= q <= 1.
+        """
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        for bound, count in self.cumulative():
+            if count >= rank:
+                return bound
+        return math.inf
+
+
+class Histogram:
+    __slots__ = ("bounds", "_counts", "count", "sum")
+
+    def __init__(self, bounds: typing.Iterable[float] = DEFAULT_TIME_BUCKETS):
+        self.bounds = tuple(sorted(bounds))
+        self._counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> HistogramSnapshot:
+        return HistogramSnapshot(self.bounds, tuple(self._counts), self.count, self.sum)
+
+
+METRIC_KINDS = ("counter", "gauge", "histogram")
+
+
+@attr.s(auto_detect=True, frozen=True, slots=True)
+class Metric:
+    name: str = attr.ib()
+    kind: str = attr.ib(validator=attr.validators.in_(METRIC_KINDS))
+    help: str = attr.ib()
+    value: typing.Union[float, HistogramSnapshot] = attr.ib()
+    labels: dict[str, str] = attr.ib(factory=dict)
+
+
+MetricsSource = typing.Callable[[], typing.Iterable[Metric]]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._sources: list[tuple[MetricsSource, dict[str, str]]] = []
+
+    def register(self, source: MetricsSource, **labels: str):
+        """\
+        Add a source of metrics, e.g. UECPSerialProtocol.collect_metrics. The
+        labels tell sources with the same metrics apart.
+        """
+        self._sources.append((source, labels))
+
+    def unregister(self, source: MetricsSource):
+        self._sources = [entry for entry in self._sources if entry[0] != source]
+
+    def snapshot(self) -> list[Metric]:
+        metrics = []
+        for source, labels in list(self._sources):
+            for metric in source():
+                if labels:
+                    metric = attr.evolve(metric, labels={**labels, **metric.labels})
+                metrics.append(metric)
+        return metrics
+
+    def render(self) -> str:
+        """\
+        Current metrics in the Prometheus text exposition format.
+        """
+        families: dict[str, list[Metric]] = {}
+        for metric in self.snapshot():
+            families.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {_escape_help(metrics[0].help)}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                value = metric.value
+                if isinstance(value, HistogramSnapshot):
+                    for bound, count in value.cumulative():
+                        labels = {**metric.labels, "le": _format_value(bound)}
+                        lines.append(f"{name}_bucket{_format_labels(labels)} {count}")
+                    labels_text = _format_labels(metric.labels)
+                    lines.append(f"{name}_sum{labels_text} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{labels_text} {value.count}")
+                else:
+                    lines.append(
+                        f"{name}{_format_labels(metric.labels)} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return (
+        "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsExporter:
+    """\
+    Minimal HTTP server answering GET /metrics with the registry rendered for
+    Prometheus. Binds to localhost unless told otherwise.
+    """
+
+    PATH = "/metrics"
+
+    def __init__(self, registry: MetricsRegistry):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self.registry = registry
+        self._server: typing.Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        if self._server is not None:
+            raise ValueError("Exporter already started")
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # headers are of no interest, but have to be read
+            while (await reader.readline()).strip():
+                pass
+            method, path, *_ = request_line.decode("latin-1").split() + ["", ""]
+            if method != "GET":
+                status, body = "405 Method Not Allowed", b""
+            elif path.split("?", 1)[0] != self.PATH:
+                status, body = "404 Not Found", b""
+            else:
+                status, body = "200 OK", self.registry.render().encode()
+            header = (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(header.encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self.logger.debug(f"Metrics request failed {e!r}")
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
@@ -0,0 +1,330 @@
+"""\
+Replay of the frames sent in a capture to a UECP endpoint.
+
+    python -m uecp.replay burst.cap --emulate --speed 10
+    python -m uecp.replay burst.cap --tcp 192.0.2.10:4001 --fast --json
+
+Outbound frames are decoded and written through UECPSerialProtocol at their
+recorded timing divided by the speed multiplier, or as fast as possible. The
+responses received are compared with the frames recorded inbound by their
+commands, addresses and sequence counters are left out as they depend on the
+endpoint and its history. Acknowledgements compare by their response code.
+
+Frames are written with their recorded sequence counters and every frame
+received counts as response, the protocol has to be used by the replay alone.
+"""
+
+import argparse
+import asyncio
+import datetime
+import difflib
+import json
+import logging
+import sys
+import time
+import typing
+from pathlib import Path
+
+import attr
+
+from uecp.capture import Direction, MappedCaptureReader
+from uecp.cli_util import parse_host_port, parse_port_baudrate, percentile
+from uecp.commands import MessageAcknowledgementCommand
+from uecp.frame import UECPFrame
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+
+@attr.s(auto_detect=True, kw_only=True)
+class ReplayReport:
+    duration: float = attr.ib()
+    recorded_duration: float = attr.ib()
+    frames_sent: int = attr.ib()
+    frames_skipped: int = attr.ib()
+    responses_expected: int = attr.ib()
+    responses_received: int = attr.ib()
+    responses_matched: int = attr.ib()
+    responses_mismatched: int = attr.ib()
+    responses_missing: int = attr.ib()
+    responses_unexpected: int = attr.ib()
+    cpu_seconds: float = attr.ib()
+    send_lags: list[float] = attr.ib(repr=False)
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.frames_sent / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def verified(self) -> bool:
+        return (
+            self.responses_mismatched
+            == self.responses_missing
+            == self.responses_unexpected
+            == 0
+        )
+
+    def summary(self) -> dict[str, typing.Any]:
+        lags = sorted(self.send_lags)
+        return {
+            "duration_s": round(self.duration, 3),
+            "recorded_duration_s": round(self.recorded_duration, 3),
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "frames_per_second": round(self.frames_per_second, 1),
+            "send_lag_ms": {
+                f"p{q}": round(percentile(lags, q) * 1000, 3) for q in (50, 99, 100)
+            },
+            "responses_expected": self.responses_expected,
+            "responses_received": self.responses_received,
+            "responses_matched": self.responses_matched,
+            "responses_mismatched": self.responses_mismatched,
+            "responses_missing": self.responses_missing,
+            "responses_unexpected": self.responses_unexpected,
+            "verified": self.verified,
+            "cpu_s": round(self.cpu_seconds, 3),
+        }
+
+
+def response_key(frame: UECPFrame) -> tuple[bytes, ...]:
+    """\
+    What a response is compared by, the encoded commands of the frame with
+    acknowledgements reduced to their response code.
+    """
+    return tuple(
+        (
+            bytes([command.ELEMENT_CODE, int(command.code)])
+            if isinstance(command, MessageAcknowledgementCommand)
+            else bytes(command.encode())
+        )
+        for command in frame.commands
+    )
+
+
+class CaptureReplayer:
+    """\
+    Replays the TX frames of a capture. A speed of 1 keeps the recorded timing,
+    N replays N times faster and None sends as fast as possible.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, Path],
+        speed: typing.Optional[float] = 1.0,
+        start_ns: typing.Optional[int] = None,
+        end_ns: typing.Optional[int] = None,
+        response_timeout: float = 1.0,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("Speed must be positive")
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self.path = Path(path)
+        self.speed = speed
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.response_timeout = float(response_timeout)
+
+    async def run(self, protocol: UECPSerialProtocol) -> ReplayReport:
+        """\
+        Replay to protocol, which must not be written by anyone else meanwhile,
+        i.e. not be shared with an encoder, scheduler or bus.
+        """
+        loop = asyncio.get_running_loop()
+        received: list[tuple[bytes, ...]] = []
+        response = asyncio.Event()
+
+        def on_frame(frame: UECPFrame):
+            received.append(response_key(frame))
+            response.set()
+
+        expected: list[tuple[bytes, ...]] = []
+        send_lags: list[float] = []
+        frames_sent = frames_skipped = 0
+        first_timestamp_ns = last_timestamp_ns = None
+
+        protocol.received_frame_callbacks.append(on_frame)
+        cpu_start = time.process_time()
+        start = loop.time()
+        try:
+            with MappedCaptureReader(self.path) as reader:
+                for scanned in reader.frames(self.start_ns, self.end_ns):
+                    if scanned.direction is Direction.RX:
+                        # responses to frames sent before the replay started
+                        # can't be expected
+                        if first_timestamp_ns is not None:
+                            try:
+                                expected.append(response_key(scanned.decode()))
+                            except Exception:
+                                pass
+                        continue
+                    try:
+                        frame = scanned.decode()
+                    except Exception as exc:
+                        self.logger.warning(
+                            f"Skipping frame at offset {scanned.offset}: {exc}"
+                        )
+                        frames_skipped += 1
+                        continue
+                    timestamp_ns = typing.cast(int, scanned.timestamp_ns)
+                    if first_timestamp_ns is None:
+                        first_timestamp_ns = timestamp_ns
+                    last_timestamp_ns = timestamp_ns
+
+                    if self.speed is not None:
+                        # schedule against the start time to avoid accumulating drift
+                        due = start + (timestamp_ns - first_timestamp_ns) / (
+                            1e9 * self.speed
+                        )
+                        delay = due - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        send_lags.append(max(0.0, loop.time() - due))
+                    else:
+                        # let responses be processed between frames
+                        await asyncio.sleep(0)
+                    protocol.write(frame)
+                    frames_sent += 1
+
+            deadline = loop.time() + self.response_timeout
+            while len(received) < len(expected) and loop.time() < deadline:
+                response.clear()
+                try:
+                    await asyncio.wait_for(response.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            elapsed = loop.time() - start
+            cpu_seconds = time.process_time() - cpu_start
+            protocol.received_frame_callbacks.remove(on_frame)
+
+        matched = mismatched = missing = unexpected = 0
+        matcher = difflib.SequenceMatcher(None, expected, received, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                matched += i2 - i1
+            elif tag == "replace":
+                paired = min(i2 - i1, j2 - j1)
+                mismatched += paired
+                missing += i2 - i1 - paired
+                unexpected += j2 - j1 - paired
+            elif tag == "delete":
+                missing += i2 - i1
+            else:
+                unexpected += j2 - j1
+
+        recorded_duration = 0.0
+        if first_timestamp_ns is not None and last_timestamp_ns is not None:
+            recorded_duration = (last_timestamp_ns - first_timestamp_ns) / 1e9
+        return ReplayReport(
+            duration=elapsed,
+            recorded_duration=recorded_duration,
+            frames_sent=frames_sent,
+            frames_skipped=frames_skipped,
+            responses_expected=len(expected),
+            responses_received=len(received),
+            responses_matched=matched,
+            responses_mismatched=mismatched,
+            responses_missing=missing,
+            responses_unexpected=unexpected,
+            cpu_seconds=cpu_seconds,
+            send_lags=send_lags,
+        )
+
+
+def _parse_time(value: str) -> int:
+    """\
+    Nanoseconds since the epoch or an ISO 8601 timestamp.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.astimezone()
+    return int(timestamp.timestamp() * 1_000_000) * 1000
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m uecp.replay", description=__doc__.splitlines()[1]
+    )
+    parser.add_argument("capture", type=Path)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tcp", type=parse_host_port, metavar="HOST:PORT")
+    target.add_argument("--serial", type=parse_port_baudrate, metavar="PORT:BAUD")
+    target.add_argument(
+        "--emulate", action="store_true", help="replay to a local encoder emulator"
+    )
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument(
+        "--speed", type=float, default=1.0, help="multiple of the recorded timing"
+    )
+    timing.add_argument("--fast", action="store_true", help="send as fast as possible")
+    parser.add_argument(
+        "--start", type=_parse_time, default=None, help="ns since epoch or ISO 8601"
+    )
+    parser.add_argument(
+        "--end", type=_parse_time, default=None, help="ns since epoch or ISO 8601"
+    )
+    parser.add_argument(
+        "--response-timeout",
+        type=float,
+        default=1.0,
+        help="seconds to wait for outstanding responses",
+    )
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="don't fail on responses deviating from the capture",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    return parser
+
+
+async def _main(args: argparse.Namespace) -> ReplayReport:
+    from uecp.emulator import UECPEncoderEmulator
+    from uecp.ip_con.protocol import open_tcp_protocol
+    from uecp.serial_con.protocol import open_serial_protocol
+
+    replayer = CaptureReplayer(
+        args.capture,
+        speed=None if args.fast else args.speed,
+        start_ns=args.start,
+        end_ns=args.end,
+        response_timeout=args.response_timeout,
+    )
+    emulator = None
+    try:
+        if args.serial is not None:
+            protocol = await open_serial_protocol(*args.serial)
+        else:
+            if args.emulate:
+                emulator = UECPEncoderEmulator()
+                host, port = "127.0.0.1", await emulator.start_tcp()
+            else:
+                host, port = args.tcp
+            protocol = await open_tcp_protocol(host, port)
+        try:
+            return await replayer.run(protocol)
+        finally:
+            if protocol.transport is not None:
+                protocol.transport.close()
+    finally:
+        if emulator is not None:
+            await emulator.close()
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    report = asyncio.run(_main(args))
+    summary = report.summary()
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for key, value in summary.items():
+            print(f"{key:>20}: {value}")
+    return 0 if report.verified or args.no_verify else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""\
+Fast scanning of UECP frames in large buffers like memory mapped captures or
+raw serial dumps.
+
+Frames are delimited with bytes.find instead of feeding every byte through
+UECPFrameDecoder, only the frames themselves are copied out of the buffer, so
+a mapping can be closed while frames are still around. Byte stuffing is only
+undone for frames actually looked into.
+"""
+
+import mmap
+import typing
+from pathlib import Path
+
+from uecp.frame import UECPAddressFilter, UECPFrame, crc16
+
+Buffer = typing.Union[bytes, bytearray, mmap.mmap]
+
+_STA = bytes([UECPFrame.STA])
+_STP = bytes([UECPFrame.STP])
+
+
+def unstuff(data: bytes) -> bytes:
+    """\
+    Undo byte stuffing of the data enclosed by STA and STP.
+    """
+    escapes = data.count(b"\xfd")
+    if escapes == 0:
+        return data
+    if (
+        data.count(b"\xfd\x00") + data.count(b"\xfd\x01") + data.count(b"\xfd\x02")
+        != escapes
+    ):
+        raise ValueError("Invalid byte stuffing")
+    # escape sequences can't overlap, hence 0xFD can be restored last
+    return (
+        data.replace(b"\xfd\x01", b"\xfe")
+        .replace(b"\xfd\x02", b"\xff")
+        .replace(b"\xfd\x00", b"\xfd")
+    )
+
+
+class ScannedFrame:
+    __slots__ = ("raw", "offset", "timestamp_ns", "direction", "_enclosed")
+
+    def __init__(
+        self,
+        raw: bytes,
+        offset: int,
+        timestamp_ns: typing.Optional[int] = None,
+        direction: typing.Optional[int] = None,
+    ):
+        self.raw = raw
+        self.offset = offset
+        self.timestamp_ns = timestamp_ns
+        self.direction = direction
+        self._enclosed: typing.Optional[bytes] = None
+
+    @property
+    def enclosed(self) -> bytes:
+        """\
+        Unstuffed frame content between STA and STP, raises ValueError on
+        invalid byte stuffing.
+        """
+        if self._enclosed is None:
+            self._enclosed = unstuff(self.raw[1:-1])
+        return self._enclosed
+
+    @property
+    def site_address(self) -> int:
+        enclosed = self.enclosed
+        if len(enclosed) < 2:
+            raise ValueError("not enough data")
+        return (enclosed[0] << 8 | enclosed[1]) >> 6
+
+    @property
+    def encoder_address(self) -> int:
+        enclosed = self.enclosed
+        if len(enclosed) < 2:
+            raise ValueError("not enough data")
+        return enclosed[1] & 0x3F
+
+    @property
+    def sequence_counter(self) -> int:
+        enclosed = self.enclosed
+        if len(enclosed) < 3:
+            raise ValueError("not enough data")
+        return enclosed[2]
+
+    @property
+    def valid(self) -> bool:
+        """\
+        Whether stuffing, length and CRC are fine. The commands are not decoded.
+        """
+        try:
+            enclosed = self.enclosed
+        except ValueError:
+            return False
+        return (
+            len(enclosed) >= 6
+            and enclosed[3] == len(enclosed) - 6
+            and crc16(enclosed[:-2]) == enclosed[-2] << 8 | enclosed[-1]
+        )
+
+    def matches(self, address_filter: UECPAddressFilter) -> bool:
+        try:
+            return address_filter.matches(self.site_address, self.encoder_address)
+        except ValueError:
+            return False
+
+    def decode(self) -> UECPFrame:
+        return UECPFrame.create_from_enclosed(self.enclosed)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(raw={self.raw.hex()}, "
+            f"offset={self.offset}, timestamp_ns={self.timestamp_ns}, "
+            f"direction={self.direction!r})"
+        )
+
+
+class FrameScanner:
+    """\
+    Finds frames in consecutive pieces of a stream.
+    """
+
+    def __init__(self) -> None:
+        self._pending: typing.Optional[bytearray] = None
+        self._pending_offset = 0
+        self.torn_frames = 0
+
+    @property
+    def pending_offset(self) -> typing.Optional[int]:
+        """\
+        Offset of a frame started but not yet completed.
+        """
+        return self._pending_offset if self._pending is not None else None
+
+    def reset(self):
+        self._pending = None
+
+    def feed(
+        self, buffer: Buffer, start: int = 0, end: typing.Optional[int] = None
+    ) -> typing.Iterator[tuple[bytes, int]]:
+        """\
+        Yield (raw frame, offset) for frames completed within buffer[start:end].
+        Offsets of frames spanning pieces refer to the buffer of their start.
+        """
+        if end is None:
+            end = len(buffer)
+        find = buffer.find
+        position = start
+
+        if self._pending is not None:
+            stop = find(_STP, position, end)
+            restart = find(_STA, position, end if stop < 0 else stop)
+            if restart >= 0:
+                self.torn_frames += 1
+                self._pending = None
+                position = restart
+            elif stop < 0:
+                self._pending += buffer[position:end]
+                return
+            else:
+                self._pending += buffer[position : stop + 1]
+                yield bytes(self._pending), self._pending_offset
+                self._pending = None
+                position = stop + 1
+
+        rfind = buffer.rfind
+        while True:
+            begin = find(_STA, position, end)
+            if begin < 0:
+                return
+            stop = find(_STP, begin + 1, end)
+            if stop < 0:
+                self._pending = bytearray(buffer[begin:end])
+                self._pending_offset = begin
+                return
+            # a start byte within the frame means the previous one was torn
+            last_begin = rfind(_STA, begin + 1, stop)
+            if last_begin >= 0:
+                self.torn_frames += 1
+                begin = last_begin
+            yield bytes(buffer[begin : stop + 1]), begin
+            position = stop + 1
+
+
+def scan_frames(
+    buffer: Buffer,
+    start: int = 0,
+    end: typing.Optional[int] = None,
+    address_filter: typing.Optional[UECPAddressFilter] = None,
+) -> typing.Iterator[ScannedFrame]:
+    for raw, offset in FrameScanner().feed(buffer, start, end):
+        frame = ScannedFrame(raw, offset)
+        if address_filter is None or frame.matches(address_filter):
+            yield frame
+
+
+def map_file(path: typing.Union[str, Path]) -> Buffer:
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            return b""
+
+
+class MappedDumpReader:
+    """\
+    Frames of a raw serial dump, e.g. written by cat /dev/ttyUSB0 > dump.bin.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._buffer = map_file(self.path)
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def frames(
+        self, address_filter: typing.Optional[UECPAddressFilter] = None
+    ) -> typing.Iterator[ScannedFrame]:
+        return scan_frames(self._buffer, address_filter=address_filter)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self) -> "MappedDumpReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,280 @@
+"""\
+Matching of acknowledgements to the frames written on a protocol.
+
+Every frame is written with its own sequence counter, counted per address.
+Acknowledgements are matched to the frames sent to the address they come from.
+Error acknowledgements carry the counter of their frame and are matched by it,
+an OK acknowledgement is just the element code and a zero and is matched to the
+oldest frame awaiting one. That only holds when every frame expecting an
+acknowledgement is written through the same tracker:
+
+    acks = AcknowledgementTracker.for_protocol(protocol)
+    waiter = asyncio.get_running_loop().create_future()
+    acks.write(frame, waiter)
+    code = await asyncio.wait_for(waiter, 1.0)
+
+Once a frame was given up as lost its acknowledgement may still arrive late,
+until then OK acknowledgements can't be told apart and are reported to the
+uncertain_callbacks instead of the acknowledged_callbacks. An error
+acknowledgement matching a single frame resolves the doubt.
+
+The encoder, its hot frames, device queries, the send scheduler, the dynamic
+PS engine, the bus and the load generator write through the tracker of their
+protocol.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+import typing
+import weakref
+
+import attr
+
+from uecp.commands import MessageAcknowledgementCommand, ResponseCode
+from uecp.frame import UECPFrame
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_LATE_PERIOD = 5.0
+
+# site and encoder address
+Address = tuple[int, int]
+
+
+def _addressed(destination: Address, source: Address) -> bool:
+    """\
+    Whether a frame sent to destination may be acknowledged from source, with
+    0 standing for all sites or encoders on either side.
+    """
+    return all(
+        UECPFrame.ALL_SITES in (sent, responding) or sent == responding
+        for sent, responding in zip(destination, source)
+    )
+
+
+@attr.s(auto_detect=True, frozen=True, slots=True, eq=False)
+class _Unacknowledged:
+    frame: UECPFrame = attr.ib()
+    # the frame object may be written again with other values meanwhile
+    address: Address = attr.ib()
+    sequence_counter: int = attr.ib()
+    waiter: typing.Optional[asyncio.Future[ResponseCode]] = attr.ib()
+    lost_at: float = attr.ib()
+
+
+class AcknowledgementTracker:
+    _trackers: typing.ClassVar[
+        "weakref.WeakKeyDictionary[UECPSerialProtocol, AcknowledgementTracker]"
+    ] = weakref.WeakKeyDictionary()
+
+    def __init__(self, protocol: UECPSerialProtocol):
+        """\
+        Use for_protocol instead, a second tracker on a protocol would take the
+        acknowledgements of the frames written through the first one.
+        """
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        # the protocol keeps the tracker alive by its subscription, not the
+        # other way around
+        self._protocol = weakref.ref(protocol)
+        # last sequence counter by the address frames were sent to
+        self._sequence_counters: dict[Address, int] = {}
+        # written frames awaiting acknowledgement, oldest first
+        self._unacknowledged: collections.deque[_Unacknowledged] = collections.deque()
+        # frames given up as lost whose acknowledgement may still arrive, as
+        # time to stop waiting for it, address and sequence counter
+        self._late: collections.deque[tuple[float, Address, int]] = collections.deque()
+        # seconds an acknowledgement is still expected after a frame was lost
+        self.late_period = DEFAULT_LATE_PERIOD
+        # called with every frame certainly acknowledged and the response code
+        self.acknowledged_callbacks: list[
+            typing.Callable[[UECPFrame, ResponseCode], None]
+        ] = []
+        # called with frames taking an acknowledgement which might belong to
+        # a lost frame instead
+        self.uncertain_callbacks: list[typing.Callable[[UECPFrame], None]] = []
+        self.frames_acknowledged = 0
+        self.frames_lost = 0
+        self.uncertain_acknowledgements = 0
+        self.unexpected_acknowledgements = 0
+        # acknowledgements are matched by the address they come from
+        protocol.received_frame_callbacks.append(self._frame_received)
+
+    @classmethod
+    def for_protocol(cls, protocol: UECPSerialProtocol) -> "AcknowledgementTracker":
+        """\
+        The tracker shared by all writers of protocol.
+        """
+        tracker = cls._trackers.get(protocol)
+        if tracker is None:
+            tracker = cls._trackers[protocol] = cls(protocol)
+        return tracker
+
+    @property
+    def pending(self) -> int:
+        return len(self._unacknowledged)
+
+    def next_sequence_counter(
+        self,
+        site_address: int = UECPFrame.ALL_SITES,
+        encoder_address: int = UECPFrame.ALL_ENCODERS,
+    ) -> int:
+        """\
+        Counter for a frame to the given address, to be encoded ahead and
+        written by write_raw. Each address counts on its own.
+        """
+        address = site_address, encoder_address
+        # 0 signals an unused sequence counter, hence cycle through 1 to 255
+        counter = self._sequence_counters.get(address, 0) % 0xFF + 1
+        self._sequence_counters[address] = counter
+        return counter
+
+    def write(
+        self,
+        frame: UECPFrame,
+        waiter: typing.Optional[asyncio.Future[ResponseCode]] = None,
+        timeout: typing.Optional[float] = DEFAULT_TIMEOUT,
+    ):
+        """\
+        Write frame with the next sequence counter and expect its
+        acknowledgement, resolving waiter with the response code. Without
+        acknowledgement within timeout seconds, None to wait forever, the frame
+        is taken as lost and the waiter left pending.
+        """
+        protocol = self._get_protocol()
+        expecting = protocol.connected
+        frame.sequence_counter = self.next_sequence_counter(
+            frame.site_address, frame.encoder_address
+        )
+        protocol.write(frame)
+        if expecting:
+            self._expect(frame, waiter, timeout)
+
+    def write_raw(
+        self,
+        data: bytes,
+        frame: UECPFrame,
+        waiter: typing.Optional[asyncio.Future[ResponseCode]] = None,
+        timeout: typing.Optional[float] = DEFAULT_TIMEOUT,
+    ):
+        """\
+        Like write, for data being frame encoded ahead with a counter taken from
+        next_sequence_counter.
+        """
+        protocol = self._get_protocol()
+        expecting = protocol.connected
+        protocol.write_raw(data)
+        if expecting:
+            self._expect(frame, waiter, timeout)
+
+    def _get_protocol(self) -> UECPSerialProtocol:
+        protocol = self._protocol()
+        if protocol is None:
+            raise RuntimeError("Protocol of the tracker is gone")
+        return protocol
+
+    def _expect(
+        self,
+        frame: UECPFrame,
+        waiter: typing.Optional[asyncio.Future[ResponseCode]],
+        timeout: typing.Optional[float],
+    ):
+        now = time.monotonic()
+        self._drop_lost(now)
+        lost_at = float("inf") if timeout is None else now + timeout
+        self._unacknowledged.append(
+            _Unacknowledged(
+                frame,
+                (frame.site_address, frame.encoder_address),
+                frame.sequence_counter,
+                waiter,
+                lost_at,
+            )
+        )
+
+    def _drop_lost(self, now: float):
+        while self._late and self._late[0][0] < now:
+            self._late.popleft()
+        for entry in [entry for entry in self._unacknowledged if entry.lost_at < now]:
+            self._unacknowledged.remove(entry)
+            self.frames_lost += 1
+            self.logger.debug(f"No acknowledgement for {entry.frame!r}")
+            self._late.append(
+                (now + self.late_period, entry.address, entry.sequence_counter)
+            )
+
+    def _frame_received(self, frame: UECPFrame):
+        for command in frame.commands:
+            if isinstance(command, MessageAcknowledgementCommand):
+                self._ack_received((frame.site_address, frame.encoder_address), command)
+
+    def _ack_received(self, source: Address, command: MessageAcknowledgementCommand):
+        self._drop_lost(time.monotonic())
+        pending = [
+            index
+            for index, entry in enumerate(self._unacknowledged)
+            if _addressed(entry.address, source)
+        ]
+        late = [lost for lost in self._late if _addressed(lost[1], source)]
+        counter = command.sequence_counter
+        if (
+            command.code is not ResponseCode.OK
+            and counter != UECPFrame.UNUSED_SEQUENCE_COUNTER
+        ):
+            matching = [
+                index
+                for index in pending
+                if self._unacknowledged[index].sequence_counter == counter
+            ]
+            if matching:
+                # acknowledged in order, the frames before won't be anymore
+                for index in reversed(pending[: pending.index(matching[0])]):
+                    entry = self._unacknowledged[index]
+                    del self._unacknowledged[index]
+                    self.frames_lost += 1
+                    self.logger.debug(f"No acknowledgement for {entry.frame!r}")
+                certain = len(matching) == 1
+                if certain:
+                    for lost in late:
+                        self._late.remove(lost)
+                self._acknowledge(source, command.code, certain)
+                return
+            for lost in late:
+                if lost[2] == counter:
+                    self._late.remove(lost)
+                    self.logger.debug(f"Late acknowledgement {command.code!r}")
+                    return
+            self.unexpected_acknowledgements += 1
+            self.logger.debug(f"Unexpected acknowledgement {command.code!r}")
+            return
+
+        if not pending:
+            if late:
+                self._late.remove(late[0])
+                self.logger.debug(f"Late acknowledgement {command.code!r}")
+                return
+            self.unexpected_acknowledgements += 1
+            self.logger.debug(f"Unexpected acknowledgement {command.code!r}")
+            return
+        self._acknowledge(source, command.code, not late)
+
+    def _acknowledge(self, source: Address, code: ResponseCode, certain: bool):
+        """\
+        Resolve the oldest frame sent to source.
+        """
+        for entry in self._unacknowledged:
+            if _addressed(entry.address, source):
+                break
+        self._unacknowledged.remove(entry)
+        self.frames_acknowledged += 1
+        if certain:
+            for callback in self.acknowledged_callbacks:
+                callback(entry.frame, code)
+        else:
+            self.uncertain_acknowledgements += 1
+            self.logger.debug(f"Uncertain acknowledgement for {entry.frame!r}")
+            for uncertain_callback in self.uncertain_callbacks:
+                uncertain_callback(entry.frame)
+        if entry.waiter is not None and not entry.waiter.done():
+            entry.waiter.set_result(code)
@@ -0,0 +1,306 @@
+import asyncio
+import collections
+import logging
+import typing
+
+from uecp.commands import ResponseCode
+from uecp.commands.base import T_UECPCommand
+from uecp.frame import UECPFrame
+from uecp.metrics import Metric
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.dispatch import CommandHandler, UECPCommandDispatcher
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+DeviceKey = tuple[int, int]
+
+
+class UECPBusDevice:
+    def __init__(
+        self,
+        bus: "UECPBus",
+        site_address: int,
+        encoder_address: int,
+        expect_ack: bool = True,
+    ):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._bus = bus
+        self._site_address = site_address
+        self._encoder_address = encoder_address
+        self.expect_ack = bool(expect_ack)
+
+        self.received_frame_callbacks: list[typing.Callable[[UECPFrame], None]] = []
+        self._command_dispatcher = UECPCommandDispatcher()
+
+        self._queue: collections.deque[
+            tuple[UECPFrame, asyncio.Future[typing.Optional[ResponseCode]]]
+        ] = collections.deque()
+        self._in_flight: typing.Optional[
+            tuple[
+                UECPFrame,
+                asyncio.Future[typing.Optional[ResponseCode]],
+                asyncio.Future[ResponseCode],
+            ]
+        ] = None
+        self._in_flight_deadline = 0.0
+
+    @property
+    def site_address(self) -> int:
+        return self._site_address
+
+    @property
+    def encoder_address(self) -> int:
+        return self._encoder_address
+
+    @property
+    def key(self) -> DeviceKey:
+        return self._site_address, self._encoder_address
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> typing.Optional[UECPFrame]:
+        if self._in_flight is None:
+            return None
+        return self._in_flight[0]
+
+    @property
+    def ready(self) -> bool:
+        return len(self._queue) > 0 and self._in_flight is None
+
+    def subscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        self._command_dispatcher.subscribe(command_type, handler)
+
+    def unsubscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        self._command_dispatcher.unsubscribe(command_type, handler)
+
+    def send(self, frame: UECPFrame) -> asyncio.Future[typing.Optional[ResponseCode]]:
+        """\
+        Queue frame for this device. The address is set by the bus, the sequence
+        counter by the AcknowledgementTracker of the protocol once transmitted.
+        The returned future resolves with the response code of the
+        acknowledgement, with None for devices not expected to acknowledge, or
+        raises TimeoutError.
+        """
+        frame.site_address = self._site_address
+        frame.encoder_address = self._encoder_address
+        future: asyncio.Future[typing.Optional[ResponseCode]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._queue.append((frame, future))
+        self._bus._wake()
+        return future
+
+    def clear(self):
+        while self._queue:
+            _, future = self._queue.popleft()
+            future.cancel()
+
+    def _transmit(self, acks: AcknowledgementTracker, now: float, deadline: float):
+        frame, future = self._queue.popleft()
+        if future.cancelled():
+            return
+        if not self.expect_ack:
+            frame.sequence_counter = acks.next_sequence_counter(*self.key)
+            self._bus.protocol.write(frame)
+            future.set_result(None)
+            return
+        waiter: asyncio.Future[ResponseCode] = (
+            asyncio.get_running_loop().create_future()
+        )
+        # the tracker gives up on the frame when the bus does
+        acks.write(frame, waiter, deadline - now)
+        self._in_flight = frame, future, waiter
+        self._in_flight_deadline = deadline
+        waiter.add_done_callback(self._acknowledged)
+
+    def _expire(self, now: float) -> bool:
+        if self._in_flight is None or now < self._in_flight_deadline:
+            return False
+        frame, future, waiter = self._in_flight
+        self._in_flight = None
+        waiter.cancel()
+        self.logger.warning(
+            f"No acknowledgement from {self.key} for frame {frame.sequence_counter:#x}"
+        )
+        if not future.done():
+            future.set_exception(TimeoutError(self.key, frame.sequence_counter))
+        return True
+
+    def _frame_received(self, frame: UECPFrame):
+        for callback in self.received_frame_callbacks:
+            callback(frame)
+        self._command_dispatcher.dispatch(frame)
+
+    def _acknowledged(self, waiter: asyncio.Future[ResponseCode]):
+        if self._in_flight is None or self._in_flight[2] is not waiter:
+            # expired before
+            return
+        sent_frame, future, _ = self._in_flight
+        self._in_flight = None
+        code = waiter.result()
+        if code is not ResponseCode.OK:
+            self.logger.warning(
+                f"Frame {sent_frame.sequence_counter:#x} to {self.key} "
+                f"acknowledged with {code!r}"
+            )
+        if not future.done():
+            future.set_result(code)
+        self._bus._wake()
+
+
+class UECPBus:
+    def __init__(self, protocol: UECPSerialProtocol, ack_timeout: float = 1.0):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._protocol = protocol
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+        self.ack_timeout = float(ack_timeout)
+
+        self._devices: dict[DeviceKey, UECPBusDevice] = {}
+        self._round_robin: collections.deque[UECPBusDevice] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+        self.unrouted_frames = 0
+
+        self._protocol.received_frame_callbacks.append(self._frame_received)
+        self._protocol.connection_made_callbacks.append(self._wake)
+
+    @property
+    def protocol(self) -> UECPSerialProtocol:
+        return self._protocol
+
+    @property
+    def devices(self) -> dict[DeviceKey, UECPBusDevice]:
+        return dict(self._devices)
+
+    def add_device(
+        self, site_address: int, encoder_address: int, expect_ack: bool = True
+    ) -> UECPBusDevice:
+        key = site_address, encoder_address
+        if key in self._devices:
+            raise ValueError(f"Device {key} already added")
+        if UECPFrame.ALL_ENCODERS == encoder_address:
+            raise ValueError("Device must have a distinct encoder address")
+        device = UECPBusDevice(
+            self, site_address, encoder_address, expect_ack=expect_ack
+        )
+        self._devices[key] = device
+        self._round_robin.append(device)
+        return device
+
+    def remove_device(self, site_address: int, encoder_address: int):
+        device = self._devices.pop((site_address, encoder_address))
+        self._round_robin.remove(device)
+        device.clear()
+
+    def device(self, site_address: int, encoder_address: int) -> UECPBusDevice:
+        return self._devices[(site_address, encoder_address)]
+
+    def start(self):
+        if self._task is not None:
+            raise ValueError("Bus already started")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def close(self):
+        self._protocol.received_frame_callbacks.remove(self._frame_received)
+        self._protocol.connection_made_callbacks.remove(self._wake)
+        for device in self._devices.values():
+            device.clear()
+
+    def collect_metrics(self) -> typing.Iterator[Metric]:
+        yield Metric(
+            "uecp_bus_unrouted_frames_total",
+            "counter",
+            "Frames received without a matching device",
+            self.unrouted_frames,
+        )
+        for device in self._round_robin:
+            labels = {
+                "site": str(device.site_address),
+                "encoder": str(device.encoder_address),
+            }
+            yield Metric(
+                "uecp_bus_queue_depth",
+                "gauge",
+                "Frames queued for a device",
+                device.queue_depth,
+                labels,
+            )
+            yield Metric(
+                "uecp_bus_in_flight",
+                "gauge",
+                "Frames sent to a device awaiting acknowledgement",
+                int(device._in_flight is not None),
+                labels,
+            )
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def _frame_received(self, frame: UECPFrame):
+        device = self._devices.get((frame.site_address, frame.encoder_address))
+        if device is None:
+            self.unrouted_frames += 1
+            self.logger.debug(
+                f"No device for frame from {(frame.site_address, frame.encoder_address)}"
+            )
+            return
+        device._frame_received(frame)
+
+    def _next_ready_device(self) -> typing.Optional[UECPBusDevice]:
+        for _ in range(len(self._round_robin)):
+            device = self._round_robin[0]
+            self._round_robin.rotate(-1)
+            if device.ready:
+                return device
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            for device in self._round_robin:
+                device._expire(now)
+
+            if self._protocol.connected:
+                device = self._next_ready_device()
+                if device is not None:
+                    device._transmit(self._acks, now, now + self.ack_timeout)
+                    # give the event loop a chance to deliver acknowledgements
+                    await asyncio.sleep(0)
+                    continue
+
+            deadlines = [
+                device._in_flight_deadline
+                for device in self._round_robin
+                if device._in_flight is not None
+            ]
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+            # unlike wait_for, timeout doesn't swallow a cancellation coinciding
+            # with the wakeup
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
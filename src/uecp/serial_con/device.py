@@ -1,18 +1,61 @@
 import asyncio
+import collections
+import contextlib
+import datetime
+import enum
+import functools
 import logging
+import time
+import typing
+import warnings
 
 import attr
 
 from uecp.commands import (
     DataSetSelectCommand,
     MessageAcknowledgementCommand,
+    ProgrammeType,
+    ProgrammeTypeSetCommand,
     RDSEnabledSetCommand,
+    RDSLevelSetCommand,
+    RDSPhaseSetCommand,
+    RealTimeClockEnabledSetCommand,
+    RealTimeClockSetCommand,
     RequestCommand,
     ResponseCode,
+    TrafficAnnouncementProgrammeSetCommand,
     UECPCommand,
 )
+from uecp.commands.mixins import UECPCommandDataSetNumber
 from uecp.frame import UECPFrame
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.hot_frames import HotFrameRegistry
 from uecp.serial_con.protocol import UECPSerialProtocol, open_serial_protocol
+from uecp.serial_con.scheduler import SendScheduler
+from uecp.serial_con.state import (
+    ProgrammeServiceState,
+    ServiceKey,
+    ServiceMap,
+    SlotKey,
+    SlotSpec,
+    pack_frames,
+    slot_diff,
+    slot_key,
+)
+
+T = typing.TypeVar("T")
+
+
+def _track_change(
+    instance: "GenericRDSEncoderState", attribute: attr.Attribute, value: typing.Any
+) -> typing.Any:
+    if attribute.name == "services":
+        # replaced services may differ anywhere
+        instance.mark_all_dirty()
+        return ServiceMap(instance._mark_dirty, value)
+    spec = instance.SLOTS_BY_FIELD[attribute.name]
+    instance._mark_dirty((spec.command_type.ELEMENT_CODE, None, None))
+    return value
 
 
 @attr.s(
@@ -21,158 +64,1048 @@ from uecp.serial_con.protocol import UECPSerialProtocol, open_serial_protocol
     order=False,
     hash=False,
     kw_only=True,
+    on_setattr=[attr.setters.convert, attr.setters.validate, _track_change],
 )
 class GenericRDSEncoderState:
     active_data_set: int = attr.ib(
         converter=int, validator=attr.validators.in_(range(1, 9))
     )
     rds_enabled: bool = attr.ib(default=True, converter=bool)
+    rds_level: typing.Optional[int] = attr.ib(
+        default=None,
+        validator=attr.validators.optional(attr.validators.in_(range(8192))),
+    )
+    rds_phase: typing.Optional[int] = attr.ib(
+        default=None,
+        validator=attr.validators.optional(attr.validators.in_(range(3600))),
+    )
+    rtc_enabled: typing.Optional[bool] = attr.ib(
+        default=None, converter=attr.converters.optional(bool)
+    )
+    # programme services by (data set number, programme service number)
+    services: dict[ServiceKey, ProgrammeServiceState] = attr.ib(factory=dict)
+
+    # fields polled and awaited by init_from_device
+    REQUIRED_FIELDS: typing.ClassVar[frozenset[str]] = frozenset(
+        {"active_data_set", "rds_enabled"}
+    )
+
+    DATA_SET_SELECT: typing.ClassVar[SlotSpec] = SlotSpec(
+        DataSetSelectCommand, {"active_data_set": "select_data_set_number"}
+    )
+    SLOTS: typing.ClassVar[tuple[SlotSpec, ...]] = (
+        SlotSpec(RDSEnabledSetCommand, {"rds_enabled": "enable"}),
+        SlotSpec(
+            RDSLevelSetCommand,
+            {"rds_level": "level"},
+            {"reference_table": RDSPhaseSetCommand.CURRENT_REFERENCE_TABLE},
+        ),
+        SlotSpec(
+            RDSPhaseSetCommand,
+            {"rds_phase": "deci_degrees"},
+            {"reference_table": RDSPhaseSetCommand.CURRENT_REFERENCE_TABLE},
+        ),
+        SlotSpec(RealTimeClockEnabledSetCommand, {"rtc_enabled": "enable"}),
+    )
+    SLOTS_BY_ELEMENT_CODE: typing.ClassVar[dict[int, SlotSpec]] = {
+        spec.command_type.ELEMENT_CODE: spec for spec in (DATA_SET_SELECT,) + SLOTS
+    }
+    SLOTS_BY_FIELD: typing.ClassVar[dict[str, SlotSpec]] = {
+        field: spec for spec in (DATA_SET_SELECT,) + SLOTS for field in spec.fields
+    }
 
-    def __attrs_post_init__(self):
+    def __attrs_post_init__(self) -> None:
         self.logger = logging.getLogger(self.__class__.__qualname__)
+        # slots assigned since the last clear_dirty, with their services
+        self._dirty_slots: set[SlotKey] = set()
+        self._dirty_all = True
+        # called on every tracked assignment
+        self.change_callbacks: list[typing.Callable[[], None]] = []
+        # monotonic time each slot was last confirmed by the device
+        self.confirmed_at: dict[SlotKey, float] = {}
+        self.services = self.services
+
+    def copy(self) -> "GenericRDSEncoderState":
+        """\
+        Independent copy, services are not shared.
+        """
+        return attr.evolve(
+            self,
+            services={key: service.copy() for key, service in self.services.items()},
+        )
+
+    @property
+    def dirty_slots(self) -> typing.Optional[frozenset[SlotKey]]:
+        """\
+        Keys of the slots assigned since the last clear_dirty, None if the
+        whole state has to be compared.
+        """
+        if self._dirty_all:
+            return None
+        return frozenset(self._dirty_slots)
+
+    def clear_dirty(self, keys: typing.Optional[typing.Iterable[SlotKey]] = None):
+        """\
+        Forget the assignments of the given slots, of all slots if None.
+        """
+        if keys is not None:
+            self._dirty_slots.difference_update(keys)
+            return
+        self._dirty_slots.clear()
+        self._dirty_all = False
+
+    def mark_all_dirty(self):
+        self._dirty_all = True
+        for callback in self.change_callbacks:
+            callback()
+
+    def _mark_dirty(self, key: SlotKey):
+        self._dirty_slots.add(key)
+        for callback in self.change_callbacks:
+            callback()
+
+    def service(
+        self, data_set_number: int, programme_service_number: int = 0
+    ) -> ProgrammeServiceState:
+        """\
+        State of a programme service, added if not yet known.
+        """
+        key = data_set_number, programme_service_number
+        if key not in self.services:
+            self.services[key] = ProgrammeServiceState()
+        return self.services[key]
+
+    def slots(self) -> dict[SlotKey, UECPCommand]:
+        commands = [
+            command
+            for spec in (self.DATA_SET_SELECT,) + self.SLOTS
+            if (command := spec.create(self)) is not None
+        ]
+        for (dsn, psn), service in self.services.items():
+            commands += service.commands(dsn, psn)
+        return {slot_key(command): command for command in commands}
+
+    def slot(self, key: SlotKey) -> typing.Optional[UECPCommand]:
+        element_code, dsn, psn = key
+        if dsn is None or psn is None:
+            return self.SLOTS_BY_ELEMENT_CODE[element_code].create(self)
+        service = self.services.get((dsn, psn))
+        if service is None:
+            return None
+        return service.command(element_code, dsn, psn)
+
+    def _resolve_data_set_number(self, data_set_number: int) -> list[int]:
+        if data_set_number == UECPCommandDataSetNumber.CURRENT_DATA_SET:
+            return [self.active_data_set]
+        known = {dsn for dsn, _ in self.services} | {self.active_data_set}
+        if data_set_number == UECPCommandDataSetNumber.ALL_DATA_SETS:
+            return sorted(known)
+        if data_set_number == UECPCommandDataSetNumber.ALL_EXCEPT_CURRENT_DATA_SET:
+            return sorted(known - {self.active_data_set})
+        return [data_set_number]
+
+    def apply(self, command: UECPCommand) -> bool:
+        """\
+        Take over the settings of a command, returns False for commands not
+        part of the state.
+        """
+        now = time.monotonic()
+        spec = self.SLOTS_BY_ELEMENT_CODE.get(command.ELEMENT_CODE)
+        if spec is not None:
+            for field, value in spec.values(command).items():
+                setattr(self, field, value)
+            self.confirmed_at[(command.ELEMENT_CODE, None, None)] = now
+            return True
+        if command.ELEMENT_CODE not in ProgrammeServiceState.SLOTS_BY_ELEMENT_CODE:
+            return False
+        psn = getattr(command, "programme_service_number")
+        for dsn in self._resolve_data_set_number(getattr(command, "data_set_number")):
+            self.service(dsn, psn).apply(command)
+            self.confirmed_at[(command.ELEMENT_CODE, dsn, psn)] = now
+        return True
+
+    def slot_keys(self, command: UECPCommand) -> list[SlotKey]:
+        """\
+        Keys of the slots command sets, none for commands not part of the state.
+        """
+        if command.ELEMENT_CODE in self.SLOTS_BY_ELEMENT_CODE:
+            return [(command.ELEMENT_CODE, None, None)]
+        if command.ELEMENT_CODE not in ProgrammeServiceState.SLOTS_BY_ELEMENT_CODE:
+            return []
+        psn = getattr(command, "programme_service_number")
+        return [
+            (command.ELEMENT_CODE, dsn, psn)
+            for dsn in self._resolve_data_set_number(
+                getattr(command, "data_set_number")
+            )
+        ]
+
+    @classmethod
+    def init_slots(cls) -> list[SlotKey]:
+        """\
+        Keys requested to learn the state of a device, the programme service
+        settings of the current data set.
+        """
+        keys: list[SlotKey] = [
+            (spec.command_type.ELEMENT_CODE, None, None)
+            for spec in (cls.DATA_SET_SELECT,) + cls.SLOTS
+        ]
+        keys += [
+            (element_code, UECPCommandDataSetNumber.CURRENT_DATA_SET, 0)
+            for element_code in ProgrammeServiceState.SLOTS_BY_ELEMENT_CODE
+        ]
+        return keys
+
+    @classmethod
+    async def query_device(
+        cls,
+        proto: UECPSerialProtocol,
+        keys: typing.Optional[typing.Iterable[SlotKey]] = None,
+        timeout: typing.Optional[float] = 5.0,
+        settle: float = 0.1,
+    ) -> "DeviceQueryResult":
+        """\
+        Request the slots of keys, by default init_slots, batched into as few
+        frames as possible and wait for the answers. Devices don't answer
+        requests for unset settings, hence once all frames are acknowledged
+        answers are awaited only for settle seconds. Returns the state, if
+        the active data set was answered, and the status of every slot.
+        """
+        keys = list(cls.init_slots() if keys is None else keys)
+        frames = cls.request_frames(keys)
+        frame_keys = [
+            [
+                (
+                    command.element_code,
+                    command.data_set_number,
+                    command.programme_service_number,
+                )
+                for command in frame.commands
+                if isinstance(command, RequestCommand)
+            ]
+            for frame in frames
+        ]
+        status = dict.fromkeys(keys, SlotStatus.TIMEOUT)
+        answers: dict[SlotKey, UECPCommand] = {}
+        changed = asyncio.Event()
+        connected = asyncio.Event()
+        acks = AcknowledgementTracker.for_protocol(proto)
+        loop = asyncio.get_running_loop()
+        waiters: list[asyncio.Future[ResponseCode]] = [
+            loop.create_future() for _ in frames
+        ]
+
+        def acknowledged(
+            requested: list[SlotKey], waiter: asyncio.Future[ResponseCode]
+        ):
+            if waiter.cancelled():
+                return
+            code = waiter.result()
+            for key in requested:
+                if status[key] is SlotStatus.TIMEOUT:
+                    status[key] = (
+                        SlotStatus.UNANSWERED
+                        if code is ResponseCode.OK
+                        else SlotStatus.REJECTED
+                    )
+            changed.set()
+
+        def answer_received(command: UECPCommand):
+            element_code, dsn, psn = slot_key(command)
+            for key in keys:
+                if (
+                    key not in answers
+                    and key[0] == element_code
+                    and key[2] == psn
+                    and key[1] in (dsn, UECPCommandDataSetNumber.CURRENT_DATA_SET)
+                ):
+                    answers[key] = command
+                    status[key] = SlotStatus.ANSWERED
+            changed.set()
+
+        async def collect():
+            if not proto.connected:
+                await connected.wait()
+            for frame, waiter in zip(frames, waiters):
+                acks.write(frame, waiter, timeout)
+            while len(answers) < len(keys):
+                changed.clear()
+                if not all(waiter.done() for waiter in waiters):
+                    await changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), settle)
+                except asyncio.TimeoutError:
+                    return
+
+        for requested, waiter in zip(frame_keys, waiters):
+            waiter.add_done_callback(functools.partial(acknowledged, requested))
+        answered_types = {UECPCommand.ELEMENT_CODE_MAP[key[0]] for key in keys}
+        proto.connection_made_callbacks.append(connected.set)
+        for command_type in answered_types:
+            proto.subscribe(command_type, answer_received)
+        try:
+            await asyncio.wait_for(collect(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            proto.connection_made_callbacks.remove(connected.set)
+            for command_type in answered_types:
+                proto.unsubscribe(command_type, answer_received)
+            for waiter in waiters:
+                waiter.cancel()
+
+        state = None
+        select = answers.get((DataSetSelectCommand.ELEMENT_CODE, None, None))
+        if isinstance(select, DataSetSelectCommand):
+            state = cls(active_data_set=select.select_data_set_number)
+            for command in answers.values():
+                state.apply(command)
+        return DeviceQueryResult(state=state, status=status)
 
     @classmethod
     async def init_from_device(
-        cls, proto: UECPSerialProtocol
+        cls, proto: UECPSerialProtocol, timeout: typing.Optional[float] = 5.0
     ) -> "GenericRDSEncoderState":
-        logger = logging.getLogger(cls.__qualname__)
-
-        event_connection_made = asyncio.Event()
-        event_all_data_received = asyncio.Event()
-        proto.connection_made_callbacks.append(event_connection_made.set)
-
-        state_dict = {}
-
-        def frame_callback(received_frame: UECPFrame):
-            for cmd in received_frame.commands:
-                if isinstance(cmd, MessageAcknowledgementCommand):
-                    if cmd.code is ResponseCode.OK:
-                        logger.info("Last frame / cmd successfully transmitted")
-                    else:
-                        raise Exception(
-                            "Error received as response from rds encoder", cmd
-                        )
-                elif isinstance(cmd, DataSetSelectCommand):
-                    logger.info(f"DataSetSelectCommand received {cmd}")
-                    state_dict["active_data_set"] = cmd.select_data_set_number
-                elif isinstance(cmd, RDSEnabledSetCommand):
-                    logger.info(f"RDSEnabledSetCommand received {cmd}")
-                    state_dict["rds_enabled"] = cmd.enable
-                else:
-                    logger.warning("Unknown cmd received {cmd}")
-
-            if state_dict.keys() == attr.fields_dict(cls).keys():
-                event_all_data_received.set()
-
-        proto.received_frame_callbacks.append(frame_callback)
-
-        frame = UECPFrame(
-            commands=[
-                RequestCommand(command=DataSetSelectCommand),
-                RequestCommand(command=RDSEnabledSetCommand),
-            ]
+        """\
+        State of the device, raises TimeoutError if the REQUIRED_FIELDS are not
+        answered.
+        """
+        result = await cls.query_device(proto, timeout=timeout)
+        missing = sorted(
+            field
+            for field in cls.REQUIRED_FIELDS
+            if result.status.get(
+                (cls.SLOTS_BY_FIELD[field].command_type.ELEMENT_CODE, None, None)
+            )
+            is not SlotStatus.ANSWERED
         )
-        if not proto.connected:
-            await event_connection_made.wait()
-        proto.connection_made_callbacks.remove(event_connection_made.set)
-        proto.write(frame)
-        await event_all_data_received.wait()
-        proto.received_frame_callbacks.remove(frame_callback)
-        current = GenericRDSEncoderState(**state_dict)
+        if result.state is None or missing:
+            raise TimeoutError(f"Device did not answer {missing}")
+        return result.state
 
-        return current
+    def known_slots(self) -> set[SlotKey]:
+        """\
+        Keys of the active data set, RDS enabled and every known slot.
+        """
+        keys: set[SlotKey] = {
+            (DataSetSelectCommand.ELEMENT_CODE, None, None),
+            (RDSEnabledSetCommand.ELEMENT_CODE, None, None),
+        }
+        keys.update(self.slots())
+        return keys
+
+    def expired_slots(
+        self, max_age: float, now: typing.Optional[float] = None
+    ) -> set[SlotKey]:
+        """\
+        Known slots not confirmed by the device within max_age seconds.
+        """
+        if now is None:
+            now = time.monotonic()
+        return {
+            key
+            for key in self.known_slots()
+            if now - self.confirmed_at.get(key, -float("inf")) > max_age
+        }
 
     @property
     def refresh_frames(self) -> list[UECPFrame]:
-        frame = UECPFrame(
-            commands=[
-                RequestCommand(command=DataSetSelectCommand),
-                RequestCommand(command=RDSEnabledSetCommand),
-            ]
-        )
+        """\
+        Requests for the active data set, RDS enabled and every known slot.
+        """
+        return self.request_frames(self.known_slots())
 
-        return [frame]
+    @staticmethod
+    def request_frames(keys: typing.Iterable[SlotKey]) -> list[UECPFrame]:
+        requests = [
+            RequestCommand(
+                element_code=element_code,
+                data_set_number=dsn,
+                programme_service_number=psn,
+            )
+            for element_code, dsn, psn in sorted(
+                keys, key=lambda key: (key[0], key[1] or 0, key[2] or 0)
+            )
+        ]
+        return pack_frames(requests)
 
     def receive_frame_callback(self, received_frame: UECPFrame):
+        """\
+        Deprecated, subscribe dispatches the commands of received frames.
+        """
+        warnings.warn(
+            "receive_frame_callback is deprecated, use subscribe",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         for cmd in received_frame.commands:
             if isinstance(cmd, MessageAcknowledgementCommand):
-                if cmd.code is ResponseCode.OK:
-                    self.logger.info("Last frame / cmd successfully transmitted")
-                else:
-                    raise Exception("Error received as response from rds encoder", cmd)
-            elif isinstance(cmd, DataSetSelectCommand):
-                self.logger.info(f"DataSetSelectCommand received {cmd}")
-                self.active_data_set = cmd.select_data_set_number
-            elif isinstance(cmd, RDSEnabledSetCommand):
-                self.logger.info(f"RDSEnabledSetCommand received {cmd}")
-                self.rds_enabled = cmd.enable
-            else:
-                self.logger.warning("Unknown cmd received {cmd}")
+                self.receive_ack_callback(cmd)
+            elif not self.apply(cmd):
+                self.logger.warning(f"Unknown cmd received {cmd}")
+
+    def receive_ack_callback(self, cmd: MessageAcknowledgementCommand):
+        if cmd.code is ResponseCode.OK:
+            self.logger.info("Last frame / cmd successfully transmitted")
+        else:
+            # rejected settings are not taken over, the link stays usable
+            self.logger.warning(f"Error received as response from rds encoder {cmd}")
+
+    def receive_data_set_select_callback(self, cmd: DataSetSelectCommand):
+        self.logger.info(f"DataSetSelectCommand received {cmd}")
+        self.apply(cmd)
+
+    def receive_rds_enabled_callback(self, cmd: RDSEnabledSetCommand):
+        """\
+        Deprecated, subscribe dispatches RDSEnabledSetCommand to
+        receive_command_callback.
+        """
+        warnings.warn(
+            "receive_rds_enabled_callback is deprecated, use subscribe",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        self.apply(cmd)
+
+    def receive_command_callback(self, cmd: UECPCommand):
+        self.apply(cmd)
+
+    def _applied_command_types(self) -> typing.Iterator[type[UECPCommand]]:
+        for spec in self.SLOTS + tuple(ProgrammeServiceState.SLOTS):
+            yield spec.command_type
+
+    def subscribe(self, proto: UECPSerialProtocol):
+        proto.subscribe(MessageAcknowledgementCommand, self.receive_ack_callback)
+        proto.subscribe(DataSetSelectCommand, self.receive_data_set_select_callback)
+        for command_type in self._applied_command_types():
+            proto.subscribe(command_type, self.receive_command_callback)
+
+    def unsubscribe(self, proto: UECPSerialProtocol):
+        proto.unsubscribe(MessageAcknowledgementCommand, self.receive_ack_callback)
+        proto.unsubscribe(DataSetSelectCommand, self.receive_data_set_select_callback)
+        for command_type in self._applied_command_types():
+            proto.unsubscribe(command_type, self.receive_command_callback)
 
     @staticmethod
     def compare_and_generate(
-        current: "GenericRDSEncoderState", target: "GenericRDSEncoderState"
+        current: "GenericRDSEncoderState",
+        target: "GenericRDSEncoderState",
+        keys: typing.Optional[typing.Iterable[SlotKey]] = None,
     ) -> list[UECPFrame]:
-        cmds: list[UECPCommand] = []
-        if current == target:
-            return []
-
-        if current.active_data_set != target.active_data_set:
-            cmds.append(
-                DataSetSelectCommand(select_data_set_number=target.active_data_set)
+        """\
+        Frames with the commands of all slots, or only the given ones, differing
+        between current and target, a data set switch comes last after the
+        data set content.
+        """
+        if keys is None:
+            if current == target:
+                return []
+            commands = slot_diff(current.slots(), target.slots())
+        else:
+            commands = slot_diff(
+                {
+                    key: command
+                    for key in keys
+                    if (command := current.slot(key)) is not None
+                },
+                {
+                    key: command
+                    for key in sorted(keys, key=lambda k: (k[0], k[1] or 0, k[2] or 0))
+                    if (command := target.slot(key)) is not None
+                },
             )
-        if current.rds_enabled != target.rds_enabled:
-            cmds.append(RDSEnabledSetCommand(enable=target.rds_enabled))
+        select = [cmd for cmd in commands if isinstance(cmd, DataSetSelectCommand)]
+        content = [cmd for cmd in commands if not isinstance(cmd, DataSetSelectCommand)]
+        return pack_frames(content, last=select)
 
-        frames: list[UECPFrame] = []
-        current_frame = UECPFrame()
-        for cmd in cmds:
-            try:
-                current_frame.add_command(cmd)
-            except OverflowError:
-                frames.append(current_frame)
-                current_frame = UECPFrame()
-                current_frame.add_command(cmd)
 
-        if len(current_frame.commands) > 0:
-            frames.append(current_frame)
+class EncoderRejectedError(Exception):
+    def __init__(self, frame: UECPFrame, code: ResponseCode):
+        super().__init__(f"Encoder rejected {frame!r} with {code!r}")
+        self.frame = frame
+        self.code = code
 
-        return frames
+
+@enum.unique
+class SlotStatus(enum.Enum):
+    ANSWERED = "answered"
+    # acknowledged without an answer, e.g. not set on the device
+    UNANSWERED = "unanswered"
+    REJECTED = "rejected"
+    TIMEOUT = "timeout"
+
+
+@attr.s(auto_detect=True, repr=True, kw_only=True)
+class DeviceQueryResult:
+    state: typing.Optional[GenericRDSEncoderState] = attr.ib()
+    status: dict[SlotKey, SlotStatus] = attr.ib()
+
+    @property
+    def complete(self) -> bool:
+        return all(status is SlotStatus.ANSWERED for status in self.status.values())
+
+
+async def query_devices(
+    protocols: typing.Mapping[T, UECPSerialProtocol],
+    concurrency: int = 16,
+    **kwargs,
+) -> dict[T, typing.Union[DeviceQueryResult, BaseException]]:
+    """\
+    Query many devices concurrently, at most concurrency at once, see
+    GenericRDSEncoderState.query_device. Failures are returned, not raised.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def query(proto: UECPSerialProtocol) -> DeviceQueryResult:
+        async with semaphore:
+            return await GenericRDSEncoderState.query_device(proto, **kwargs)
+
+    results = await asyncio.gather(
+        *(query(proto) for proto in protocols.values()), return_exceptions=True
+    )
+    return dict(zip(protocols.keys(), results))
 
 
 class GenericRDSEncoder:
-    def __init__(self, protocol: UECPSerialProtocol, current: GenericRDSEncoderState):
+    def __init__(
+        self,
+        protocol: UECPSerialProtocol,
+        current: GenericRDSEncoderState,
+        confidence_period: typing.Optional[float] = 60.0,
+        scheduler: typing.Optional[SendScheduler] = None,
+    ):
+        """\
+        The current state shadows the device. It is updated from responses and
+        from frames acknowledged on the protocol, and only polled for slots not
+        confirmed within the confidence_period, None to always poll everything.
+        Frames are written through the AcknowledgementTracker of the protocol,
+        others writing to it have to use the tracker as well. With a started
+        scheduler of the protocol, commands are sent through it instead, except
+        for hot frames. It has to be kept running while the encoder is used.
+        """
+        if scheduler is not None:
+            if scheduler.protocol is not protocol:
+                raise ValueError("Scheduler sends on another protocol")
+            if not scheduler.running:
+                # frames would be queued without ever being sent
+                raise ValueError("Scheduler not started")
         self.logger = logging.getLogger(self.__class__.__qualname__)
         self._active_data_set: int = 0
         self._protocol: UECPSerialProtocol = protocol
+        self.confidence_period = confidence_period
+        self._scheduler = scheduler
 
         self._current = current
-        self._target = attr.evolve(current)
-        self._protocol.received_frame_callbacks.append(
-            self._current.receive_frame_callback
+        self._target = current.copy()
+        self._current.clear_dirty()
+        self._target.clear_dirty()
+        self._current.subscribe(self._protocol)
+
+        self.debounce = 0.2
+        self.max_frame_rate: typing.Optional[float] = None
+        self.ack_timeout: typing.Optional[float] = 1.0
+        self._reconciler: typing.Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._current.change_callbacks.append(self._changed.set)
+        self._target.change_callbacks.append(self._changed.set)
+
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+        self._acks.acknowledged_callbacks.append(self._frame_acknowledged)
+        self._acks.uncertain_callbacks.append(self._frame_uncertain)
+
+        # data sets available for staged programmes
+        self.data_set_numbers: typing.Sequence[int] = range(1, 9)
+        # staged programmes with their data set, least recently used first
+        self._programmes: collections.OrderedDict[typing.Hashable, int] = (
+            collections.OrderedDict()
         )
+        self._select_frames: dict[int, UECPFrame] = {}
+        # slots being sent by stage_programme or switch_programme, left out by
+        # ensure_current and the reconciler meanwhile
+        self._staging: set[SlotKey] = set()
+
+        self.hot_frames = HotFrameRegistry(protocol)
+        self.hot_frames.fired_callbacks.append(self._hot_frame_fired)
 
     @classmethod
-    async def create(cls, port: str, baudrate: int) -> "GenericRDSEncoder":
+    async def create(
+        cls, port: str, baudrate: int, timeout: typing.Optional[float] = 5.0
+    ) -> "GenericRDSEncoder":
         proto = await open_serial_protocol(port, baudrate)
-        current = await GenericRDSEncoderState.init_from_device(proto)
+        return await cls.create_from_protocol(proto, timeout)
+
+    @classmethod
+    async def create_from_protocol(
+        cls,
+        proto: UECPSerialProtocol,
+        timeout: typing.Optional[float] = 5.0,
+        scheduler: typing.Optional[SendScheduler] = None,
+    ) -> "GenericRDSEncoder":
+        current = await GenericRDSEncoderState.init_from_device(proto, timeout)
 
-        self = cls(proto, current)
+        self = cls(proto, current, scheduler=scheduler)
 
         return self
 
+    @classmethod
+    def create_from_snapshot(
+        cls, proto: UECPSerialProtocol, restored: GenericRDSEncoderState
+    ) -> "GenericRDSEncoder":
+        """\
+        Start from a restored state without waiting for the device, to be
+        checked by verify.
+        """
+        restored.confirmed_at.clear()
+        return cls(proto, restored)
+
+    @property
+    def protocol(self) -> UECPSerialProtocol:
+        return self._protocol
+
+    @property
+    def scheduler(self) -> typing.Optional[SendScheduler]:
+        return self._scheduler
+
+    def close(self):
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            self._reconciler = None
+        self._acks.acknowledged_callbacks.remove(self._frame_acknowledged)
+        self._acks.uncertain_callbacks.remove(self._frame_uncertain)
+        self._current.unsubscribe(self._protocol)
+        self._current.change_callbacks.remove(self._changed.set)
+        self._target.change_callbacks.remove(self._changed.set)
+
     @property
     def state(self) -> GenericRDSEncoderState:
         return self._target
 
     @state.setter
     def state(self, value: GenericRDSEncoderState):
-        self._target = value
+        """\
+        Assign a copy of value as target, later changes to value itself are not
+        followed. The same state can be assigned to several encoders.
+        """
+        self._target.change_callbacks.remove(self._changed.set)
+        self._target = value.copy()
+        self._target.change_callbacks.append(self._changed.set)
+        self._target.mark_all_dirty()
+
+    @property
+    def shadow(self) -> GenericRDSEncoderState:
+        """\
+        State of the device as far as known, to be read but not assigned.
+        """
+        return self._current
 
     def ensure_current(self):
+        """\
+        Send the slots assigned in the target or updated from the device since
+        the last call and differing, everything after a resync.
+        """
+        for frame in self._pending_frames():
+            self._write(frame)
+
+    def _pending_frames(self) -> list[UECPFrame]:
+        target_dirty = self._target.dirty_slots
+        current_dirty = self._current.dirty_slots
+        keys: typing.Optional[typing.AbstractSet[SlotKey]] = None
+        if target_dirty is not None and current_dirty is not None:
+            keys = target_dirty | current_dirty
+        if self._staging:
+            if keys is None:
+                keys = self._current.known_slots() | self._target.known_slots()
+            keys = keys - self._staging
         frames = GenericRDSEncoderState.compare_and_generate(
-            self._current, self._target
+            self._current, self._target, keys
         )
-        if len(frames) > 0:
-            for frame in frames:
-                self._protocol.write(frame)
+        self._target.clear_dirty()
+        self._current.clear_dirty()
+        return frames
+
+    @property
+    def reconciling(self) -> bool:
+        return self._reconciler is not None
+
+    def start_reconciler(
+        self,
+        debounce: float = 0.2,
+        max_frame_rate: typing.Optional[float] = None,
+        ack_timeout: typing.Optional[float] = 1.0,
+    ):
+        """\
+        Send changes of the target state in the background instead of on
+        ensure_current. Changes within debounce seconds are sent together, at
+        most max_frame_rate frames are sent per second and, unless ack_timeout
+        is None, every frame awaits its acknowledgement before the next one.
+        Unacknowledged frames are sent again, rejected ones are not.
+        """
+        if self._reconciler is not None:
+            raise ValueError("Reconciler already started")
+        if max_frame_rate is not None and max_frame_rate <= 0:
+            raise ValueError("Frame rate must be positive")
+        self.debounce = float(debounce)
+        self.max_frame_rate = max_frame_rate
+        self.ack_timeout = ack_timeout
+        # reconcile what changed before
+        self._changed.set()
+        self._reconciler = asyncio.get_running_loop().create_task(self._reconcile())
+
+    async def stop_reconciler(self):
+        task = self._reconciler
+        if task is None:
+            return
+        self._reconciler = None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _reconcile(self):
+        loop = asyncio.get_running_loop()
+        next_send = loop.time()
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(self.debounce)
+            self._changed.clear()
+            if not self._protocol.connected:
+                # dirty slots are kept for the next change or resync
+                continue
+
+            frames = self._pending_frames()
+            for index, frame in enumerate(frames):
+                if self.max_frame_rate:
+                    delay = next_send - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_send = max(next_send, loop.time()) + 1 / self.max_frame_rate
+                if self._target.dirty_slots != frozenset():
+                    # newer changes supersede the remaining frames
+                    self._mark_frames_dirty(frames[index:])
+                    break
+                code = await self._send_confirmed(frame, self.ack_timeout)
+                if code is None:
+                    self.logger.warning(
+                        f"No acknowledgement for {frame!r}, sending again"
+                    )
+                    self._mark_frames_dirty([frame])
+                elif code is not ResponseCode.OK:
+                    self.logger.warning(f"{frame!r} rejected with {code!r}")
+
+    async def _send_confirmed(
+        self, frame: UECPFrame, timeout: typing.Optional[float]
+    ) -> typing.Optional[ResponseCode]:
+        """\
+        Write frame and wait for its acknowledgement, None if not acknowledged
+        within timeout. Without timeout the frame is taken as accepted.
+        """
+        if timeout is None:
+            self._write(frame)
+            return ResponseCode.OK
+        if self._scheduler is not None:
+            try:
+                return await asyncio.wait_for(
+                    self._scheduler.send(*frame.commands), timeout
+                )
+            except asyncio.TimeoutError:
+                return None
+        waiter: asyncio.Future[ResponseCode] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._write(frame, waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _write(
+        self,
+        frame: UECPFrame,
+        waiter: typing.Optional[asyncio.Future[ResponseCode]] = None,
+    ):
+        if self._scheduler is not None and waiter is None:
+            self._scheduler.submit(*frame.commands)
+            return
+        self._acks.write(frame, waiter, self.ack_timeout)
+
+    def _frame_acknowledged(self, frame: UECPFrame, code: ResponseCode):
+        if code is ResponseCode.OK:
+            # write through, the device took over the sent settings
+            for command in frame.commands:
+                self._current.apply(command)
+
+    def _frame_uncertain(self, frame: UECPFrame):
+        # the settings may not have been taken over, ask instead of assuming
+        keys = [
+            key
+            for command in frame.commands
+            for key in self._current.slot_keys(command)
+        ]
+        for key in keys:
+            self._current.confirmed_at.pop(key, None)
+        for request in GenericRDSEncoderState.request_frames(keys):
+            self._write(request)
+
+    def _mark_frames_dirty(self, frames: typing.Iterable[UECPFrame]):
+        for frame in frames:
+            for command in frame.commands:
+                self._target._mark_dirty(slot_key(command))
+
+    def resync(self):
+        """\
+        Poll the whole device and compare the whole state on the next
+        ensure_current.
+        """
+        self._current.mark_all_dirty()
+        self.poll(full=True)
+
+    async def verify(self, timeout: float = 5.0) -> set[SlotKey]:
+        """\
+        Poll all known slots and wait up to timeout for the answers. Returns the
+        slots the device reported differently than assumed. For these the
+        target takes over the reported setting, unless changed meanwhile, so
+        a stale assumption is never sent to the device.
+        """
+        assumed = self._current.copy()
+        keys = self._current.known_slots()
+        answered = asyncio.Event()
+        started = time.monotonic()
+
+        def unanswered() -> set[SlotKey]:
+            return {
+                key
+                for key in keys
+                if self._current.confirmed_at.get(key, -float("inf")) < started
+            }
+
+        self._current.change_callbacks.append(answered.set)
+        try:
+            self.poll(full=True)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while unanswered() and loop.time() < deadline:
+                answered.clear()
+                try:
+                    await asyncio.wait_for(answered.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._current.change_callbacks.remove(answered.set)
+
+        missing = unanswered()
+        if missing:
+            self.logger.warning(f"No answer verifying {sorted(missing, key=str)}")
+        mismatched = set()
+        for key in keys - missing:
+            reported = self._current.slot(key)
+            expected = assumed.slot(key)
+            if reported is None or (
+                expected is not None and expected.encode() == reported.encode()
+            ):
+                continue
+            mismatched.add(key)
+            targeted = self._target.slot(key)
+            if (
+                expected is not None
+                and targeted is not None
+                and targeted.encode() == expected.encode()
+            ):
+                self._target.apply(reported)
+        if mismatched:
+            self.logger.warning(f"Device deviates from assumed state in {mismatched}")
+        return mismatched
+
+    @property
+    def programmes(self) -> dict[typing.Hashable, int]:
+        """\
+        Data set numbers of the staged programmes.
+        """
+        return dict(self._programmes)
+
+    async def stage_programme(
+        self,
+        name: typing.Hashable,
+        services: typing.Mapping[int, ProgrammeServiceState],
+        timeout: float = 1.0,
+    ) -> int:
+        """\
+        Write programme services, by programme service number, into a data set
+        not on air and keep them staged under name for switch_programme.
+        Returns the data set number. Staging a name again reuses its data set
+        unless on air and only sends changed settings. Raises TimeoutError or
+        EncoderRejectedError if the device did not take the programme.
+        """
+        dsn = self._programmes.pop(name, None)
+        if dsn is None or dsn == self._target.active_data_set:
+            dsn = self._spare_data_set()
+
+        stale = [
+            key
+            for key in self._target.services
+            if key[0] == dsn and key[1] not in services
+        ]
+        for key in stale:
+            del self._target.services[key]
+        keys = {
+            slot_key(command)
+            for psn, service in services.items()
+            for command in service.commands(dsn, psn)
+        }
+        async with self._staged(keys):
+            for psn, service in services.items():
+                self._target.services[(dsn, psn)] = service.copy()
+            for frame in GenericRDSEncoderState.compare_and_generate(
+                self._current, self._target, keys
+            ):
+                code = await self._send_confirmed(frame, timeout)
+                if code is None:
+                    raise TimeoutError(f"Staging {name!r} not acknowledged")
+                if code is not ResponseCode.OK:
+                    raise EncoderRejectedError(frame, code)
+        self._programmes[name] = dsn
+        return dsn
+
+    async def switch_programme(self, name: typing.Hashable, timeout: float = 1.0):
+        """\
+        Put a staged programme on air with a single data set select.
+        """
+        dsn = self._programmes[name]
+        self._programmes.move_to_end(name)
+        frame = self._select_frames.get(dsn)
+        if frame is None:
+            frame = UECPFrame(
+                commands=[DataSetSelectCommand(select_data_set_number=dsn)]
+            )
+            self._select_frames[dsn] = frame
+        async with self._staged({slot_key(frame.commands[0])}):
+            self._target.active_data_set = dsn
+            code = await self._send_confirmed(frame, timeout)
+            if code is None:
+                raise TimeoutError(f"Switching to {name!r} not acknowledged")
+            if code is not ResponseCode.OK:
+                raise EncoderRejectedError(frame, code)
+
+    @contextlib.asynccontextmanager
+    async def _staged(self, keys: set[SlotKey]) -> typing.AsyncIterator[None]:
+        """\
+        Send the given slots directly, keeping the reconciler from sending them
+        as well. They are left to it again if not taken by the device.
+        """
+        if keys & self._staging:
+            raise ValueError("Programme already being staged")
+        self._staging |= keys
+        try:
+            yield
+        except BaseException:
+            for key in keys:
+                self._target._mark_dirty(key)
+            raise
+        else:
+            self._target.clear_dirty(keys)
+        finally:
+            self._staging -= keys
+
+    def _spare_data_set(self) -> int:
+        active = self._target.active_data_set
+        used = set(self._programmes.values())
+        for dsn in self.data_set_numbers:
+            if dsn != active and dsn not in used:
+                return dsn
+        for name, dsn in self._programmes.items():
+            if dsn != active:
+                # the least recently used programme gives up its data set
+                del self._programmes[name]
+                return dsn
+        raise ValueError("No data set left for staging")
+
+    def arm_traffic_announcement(
+        self, data_set_number: int, programme_service_number: int = 0
+    ) -> tuple[typing.Hashable, typing.Hashable]:
+        """\
+        Arm hot frames switching the traffic announcement on and off, with the
+        traffic programme flag set. Returns their names for fire.
+        """
+        names = (
+            ("ta_on", data_set_number, programme_service_number),
+            ("ta_off", data_set_number, programme_service_number),
+        )
+        for name, announcement in zip(names, (True, False)):
+            self.hot_frames.arm(
+                name,
+                [
+                    TrafficAnnouncementProgrammeSetCommand(
+                        announcement=announcement,
+                        programme=True,
+                        data_set_number=data_set_number,
+                        programme_service_number=programme_service_number,
+                    )
+                ],
+            )
+        return names
+
+    def arm_alarm(
+        self,
+        data_set_number: int,
+        programme_service_number: int = 0,
+        restore: typing.Optional[ProgrammeType] = None,
+    ) -> tuple[typing.Hashable, typing.Hashable]:
+        """\
+        Arm hot frames switching the programme type to alarm and back to
+        restore, by default the programme type of the target state. Returns
+        their names for fire.
+        """
+        if restore is None:
+            service = self._target.services.get(
+                (data_set_number, programme_service_number)
+            )
+            restore = ProgrammeType.UNDEFINED
+            if service is not None and service.pty is not None:
+                restore = service.pty
+        names = (
+            ("alarm_on", data_set_number, programme_service_number),
+            ("alarm_off", data_set_number, programme_service_number),
+        )
+        for name, programme_type in zip(names, (ProgrammeType.ALARM, restore)):
+            self.hot_frames.arm(
+                name,
+                [
+                    ProgrammeTypeSetCommand(
+                        programme_type=programme_type,
+                        data_set_number=data_set_number,
+                        programme_service_number=programme_service_number,
+                    )
+                ],
+            )
+        return names
+
+    def fire(
+        self, name: typing.Hashable, triggered_at: typing.Optional[float] = None
+    ) -> float:
+        """\
+        Write an armed hot frame right away, ahead of frames held back by the
+        reconciler. Returns the trigger to wire latency, see
+        HotFrameRegistry.fire.
+        """
+        return self.hot_frames.fire(name, triggered_at)
+
+    def _hot_frame_fired(self, frame: UECPFrame):
+        # keep the reconciler from reverting the fired settings
+        for command in frame.commands:
+            self._target.apply(command)
+
+    def poll(self, full: bool = False):
+        """\
+        Request the slots not confirmed within the confidence period, all known
+        slots with full.
+        """
+        if full or self.confidence_period is None:
+            keys = self._current.known_slots()
+        else:
+            keys = self._current.expired_slots(self.confidence_period)
+        for frame in GenericRDSEncoderState.request_frames(keys):
+            self._write(frame)
+
+    def sync_clock(self, timestamp: typing.Optional[datetime.datetime] = None):
+        self._write(UECPFrame(commands=[RealTimeClockSetCommand(timestamp=timestamp)]))
@@ -0,0 +1,47 @@
+import typing
+
+from uecp.commands.base import T_UECPCommand, UECPCommand
+from uecp.frame import UECPFrame
+
+CommandHandler = typing.Callable[[T_UECPCommand], None]
+
+
+class UECPCommandDispatcher:
+    def __init__(self) -> None:
+        self._handlers: dict[int, list[typing.Callable[[typing.Any], None]]] = {}
+
+    def subscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        mec = int(command_type.ELEMENT_CODE)
+        if UECPCommand.ELEMENT_CODE_MAP.get(mec) is not command_type:
+            raise ValueError(f"{command_type!r} is not a registered command type")
+        self._handlers.setdefault(mec, []).append(handler)
+
+    def unsubscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        mec = int(command_type.ELEMENT_CODE)
+        handlers = self._handlers.get(mec)
+        if handlers is None or handler not in handlers:
+            raise ValueError(f"{handler!r} not subscribed to {command_type!r}")
+        handlers.remove(handler)
+        if not handlers:
+            del self._handlers[mec]
+
+    def has_subscribers(self) -> bool:
+        return len(self._handlers) > 0
+
+    def dispatch(self, frame: UECPFrame):
+        handlers_by_mec = self._handlers
+        for command in frame.commands:
+            handlers = handlers_by_mec.get(command.ELEMENT_CODE)
+            if handlers is None:
+                continue
+            # copy to allow handlers to unsubscribe themselves
+            for handler in tuple(handlers):
+                handler(command)
@@ -0,0 +1,176 @@
+"""\
+Dynamic programme service name, a long text shown as a sequence of PS.
+
+    engine = DynamicPSEngine(protocol, data_set_number=1)
+    engine.start("NOW PLAYING: SOME ARTIST - SOME TITLE", SegmentationMode.WORD)
+
+The frames of the whole sequence are encoded once by start. Each tick writes
+the next encoded frame, ticks are scheduled at fixed offsets from the start of
+the sequence so they don't drift with the load of the event loop. Starting
+another text or stopping takes effect at once, no frame of the previous text
+follows.
+
+Frames are written through the AcknowledgementTracker of the protocol, so the
+engine can share the link with a GenericRDSEncoder. The PS of the programme
+service should be left unmanaged, i.e. None, in the target state of the
+encoder, otherwise the reconciler restores it.
+"""
+
+import asyncio
+import enum
+import logging
+import typing
+
+from uecp.commands import ProgrammeServiceNameSetCommand
+from uecp.frame import UECPFrame
+from uecp.metrics import Metric
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+PS_LENGTH = 8
+
+
+@enum.unique
+class SegmentationMode(enum.Enum):
+    # one word per PS, centered, longer words are split
+    WORD = "word"
+    # the text moves through the PS character by character
+    SCROLL = "scroll"
+
+
+def segment(text: str, mode: SegmentationMode, step: int = 1) -> list[str]:
+    words = text.split()
+    if not words:
+        return [""]
+    if mode is SegmentationMode.WORD:
+        segments = []
+        for word in words:
+            for start in range(0, len(word), PS_LENGTH):
+                segments.append(word[start : start + PS_LENGTH].center(PS_LENGTH))
+        return segments
+    if step < 1:
+        raise ValueError("Scroll step must be positive")
+    padded = " ".join(words).center(len(" ".join(words)) + 2 * PS_LENGTH)
+    return [
+        padded[start : start + PS_LENGTH]
+        for start in range(0, len(padded) - PS_LENGTH + 1, step)
+    ]
+
+
+class DynamicPSEngine:
+    def __init__(
+        self,
+        protocol: UECPSerialProtocol,
+        data_set_number: int = 0,
+        programme_service_number: int = 0,
+    ):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._protocol = protocol
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+        self.data_set_number = data_set_number
+        self.programme_service_number = programme_service_number
+
+        self._frames: tuple[tuple[bytes, UECPFrame], ...] = ()
+        self._segments: tuple[str, ...] = ()
+        self._interval = 0.0
+        self._repeat = True
+        self._started_at = 0.0
+        self._index = 0
+        self._handle: typing.Optional[asyncio.TimerHandle] = None
+
+        self.frames_sent = 0
+        # ticks dropped as the loop fell behind by more than an interval
+        self.ticks_skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._handle is not None
+
+    @property
+    def segments(self) -> tuple[str, ...]:
+        return self._segments
+
+    def encode(
+        self, text: str, mode: SegmentationMode, step: int = 1
+    ) -> tuple[tuple[str, ...], tuple[tuple[bytes, UECPFrame], ...]]:
+        segments = tuple(segment(text, mode, step))
+        frames = tuple(
+            UECPFrame(
+                commands=[
+                    ProgrammeServiceNameSetCommand(
+                        ps=ps,
+                        data_set_number=self.data_set_number,
+                        programme_service_number=self.programme_service_number,
+                    )
+                ],
+                sequence_counter=self._acks.next_sequence_counter(),
+            )
+            for ps in segments
+        )
+        return segments, tuple((frame.encode(), frame) for frame in frames)
+
+    def start(
+        self,
+        text: str,
+        mode: SegmentationMode = SegmentationMode.WORD,
+        interval: float = 1.0,
+        step: int = 1,
+        repeat: bool = True,
+    ):
+        """\
+        Show text, replacing a running sequence. The first segment is sent
+        immediately, the following every interval seconds. Without repeat the
+        last segment stays.
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        # encode before touching the running sequence, a failure keeps it
+        segments, frames = self.encode(text, mode, step)
+        self.stop()
+        loop = asyncio.get_running_loop()
+        self._segments, self._frames = segments, frames
+        self._interval = interval
+        self._repeat = repeat
+        self._index = 0
+        self._started_at = loop.time()
+        self._handle = loop.call_at(self._started_at, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        data, frame = self._frames[self._index % len(self._frames)]
+        self._acks.write_raw(data, frame)
+        self.frames_sent += 1
+        self._index += 1
+        if not self._repeat and self._index >= len(self._frames):
+            self._handle = None
+            return
+        loop = asyncio.get_running_loop()
+        deadline = self._started_at + self._index * self._interval
+        now = loop.time()
+        if now >= deadline + self._interval:
+            # keep the grid instead of catching up with a burst of frames
+            behind = int((now - deadline) // self._interval)
+            self._index += behind
+            self.ticks_skipped += behind
+            deadline += behind * self._interval
+            if not self._repeat and self._index >= len(self._frames):
+                self._index = len(self._frames) - 1
+        self._handle = loop.call_at(deadline, self._tick)
+
+    def collect_metrics(self) -> typing.Iterator[Metric]:
+        yield Metric(
+            "uecp_dynamic_ps_frames_sent_total",
+            "counter",
+            "Frames of dynamic PS sequences sent",
+            self.frames_sent,
+        )
+        yield Metric(
+            "uecp_dynamic_ps_ticks_skipped_total",
+            "counter",
+            "Dynamic PS ticks skipped as the event loop fell behind",
+            self.ticks_skipped,
+        )
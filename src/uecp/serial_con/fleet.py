@@ -0,0 +1,381 @@
+import asyncio
+import datetime
+import enum
+import functools
+import logging
+import typing
+
+import attr
+
+from uecp.commands import ProgrammeIdentificationSetCommand
+from uecp.ip_con.protocol import open_tcp_protocol
+from uecp.serial_con.device import GenericRDSEncoder, GenericRDSEncoderState
+from uecp.serial_con.protocol import UECPSerialProtocol, open_serial_protocol
+from uecp.serial_con.snapshot import StateSnapshotStore, device_identity
+
+T = typing.TypeVar("T")
+
+ProtocolOpener = typing.Callable[[], typing.Awaitable[UECPSerialProtocol]]
+
+
+@enum.unique
+class EncoderHealthStatus(enum.Enum):
+    PENDING = "pending"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    FAILED = "failed"
+    STOPPED = "stopped"
+
+
+@attr.s(auto_detect=True, repr=True, kw_only=True)
+class EncoderHealth:
+    status: EncoderHealthStatus = attr.ib(default=EncoderHealthStatus.PENDING)
+    connect_attempts: int = attr.ib(default=0)
+    consecutive_failures: int = attr.ib(default=0)
+    last_error: typing.Optional[BaseException] = attr.ib(default=None)
+    connected_since: typing.Optional[float] = attr.ib(default=None)
+
+    @property
+    def healthy(self) -> bool:
+        return self.status is EncoderHealthStatus.CONNECTED
+
+
+class _FleetMember:
+    def __init__(self, name: str, endpoint: typing.Hashable, opener: ProtocolOpener):
+        self.name = name
+        self.endpoint = endpoint
+        self.opener = opener
+        self.health = EncoderHealth()
+        self.encoder: typing.Optional[GenericRDSEncoder] = None
+        self.protocol: typing.Optional[UECPSerialProtocol] = None
+        self.first_attempt_done = asyncio.Event()
+        self.task: typing.Optional[asyncio.Task] = None
+        self.verify_task: typing.Optional[asyncio.Task] = None
+
+    @property
+    def identity(self) -> str:
+        return device_identity(self.name, self.endpoint)
+
+
+class EncoderFleet:
+    def __init__(
+        self,
+        concurrency: int = 16,
+        init_timeout: float = 10.0,
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 60.0,
+        snapshot: typing.Optional[StateSnapshotStore] = None,
+        snapshot_interval: typing.Optional[float] = None,
+    ):
+        """\
+        With a snapshot, encoders start from their state saved on the last stop,
+        or every snapshot_interval seconds, verified in the background instead
+        of being initialised from the device.
+        """
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self.concurrency = int(concurrency)
+        self.init_timeout = float(init_timeout)
+        self.restart_delay = float(restart_delay)
+        self.max_restart_delay = float(max_restart_delay)
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval
+
+        self._members: dict[str, _FleetMember] = {}
+        self._endpoints: set[typing.Hashable] = set()
+        self._connect_semaphore = asyncio.Semaphore(self.concurrency)
+        self._started = False
+        # restored states by device identity, until used
+        self._restored: dict[str, GenericRDSEncoderState] = {}
+        self._snapshot_task: typing.Optional[asyncio.Task] = None
+
+    def add(self, name: str, endpoint: typing.Hashable, opener: ProtocolOpener):
+        if name in self._members:
+            raise ValueError(f"Encoder {name!r} already added")
+        if endpoint in self._endpoints:
+            raise ValueError(f"Endpoint {endpoint!r} already in use")
+        member = _FleetMember(name, endpoint, opener)
+        self._members[name] = member
+        self._endpoints.add(endpoint)
+        if self._started:
+            member.task = asyncio.get_running_loop().create_task(
+                self._supervise(member)
+            )
+
+    def add_serial(self, name: str, port: str, baudrate: int):
+        self.add(name, ("serial", port), lambda: open_serial_protocol(port, baudrate))
+
+    def add_tcp(self, name: str, host: str, port: int, **kwargs):
+        self.add(
+            name, ("tcp", host, port), lambda: open_tcp_protocol(host, port, **kwargs)
+        )
+
+    async def remove(self, name: str):
+        member = self._members.pop(name)
+        self._endpoints.discard(member.endpoint)
+        await self._stop_member(member)
+
+    @property
+    def health(self) -> dict[str, EncoderHealth]:
+        return {name: attr.evolve(m.health) for name, m in self._members.items()}
+
+    @property
+    def encoders(self) -> dict[str, GenericRDSEncoder]:
+        return {
+            name: m.encoder
+            for name, m in self._members.items()
+            if m.encoder is not None
+        }
+
+    async def start(self, wait: bool = True):
+        """\
+        Connect all encoders concurrently, bounded by the fleet concurrency. With
+        wait, return after every encoder had its first connection attempt.
+        """
+        if self._started:
+            raise ValueError("Fleet already started")
+        self._started = True
+        loop = asyncio.get_running_loop()
+        if self.snapshot is not None:
+            try:
+                self._restored = self.snapshot.load()
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Loading snapshot failed: {e!r}")
+            if self.snapshot_interval:
+                self._snapshot_task = loop.create_task(self._save_periodically())
+        for member in self._members.values():
+            member.task = loop.create_task(self._supervise(member))
+        if wait:
+            await asyncio.gather(
+                *(m.first_attempt_done.wait() for m in self._members.values())
+            )
+
+    async def stop(self):
+        self._started = False
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self.snapshot is not None:
+            self.save_snapshot()
+        await asyncio.gather(*(self._stop_member(m) for m in self._members.values()))
+
+    def save_snapshot(self):
+        """\
+        Save the states of connected encoders, restored states not used yet are
+        kept.
+        """
+        if self.snapshot is None:
+            raise ValueError("Fleet has no snapshot")
+        states = dict(self._restored)
+        for member in self._members.values():
+            if member.encoder is not None:
+                states[member.identity] = member.encoder.shadow
+        self.snapshot.save(states)
+
+    async def _save_periodically(self):
+        assert self.snapshot_interval
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                self.save_snapshot()
+            except OSError as e:
+                self.logger.warning(f"Saving snapshot failed: {e!r}")
+
+    async def fan_out(
+        self,
+        operation: typing.Callable[[GenericRDSEncoder], typing.Awaitable[T]],
+        concurrency: typing.Optional[int] = None,
+        names: typing.Optional[typing.Iterable[str]] = None,
+    ) -> dict[str, typing.Union[T, BaseException]]:
+        """\
+        Run operation for every connected encoder with at most concurrency
+        operations at once. Failures are returned instead of raised.
+        """
+        encoders = self.encoders
+        if names is not None:
+            encoders = {name: encoders[name] for name in names if name in encoders}
+        return await self._gather_bounded(
+            {
+                name: functools.partial(operation, encoder)
+                for name, encoder in encoders.items()
+            },
+            concurrency,
+        )
+
+    async def apply_state(
+        self,
+        states: typing.Mapping[str, GenericRDSEncoderState],
+        concurrency: typing.Optional[int] = None,
+    ) -> dict[str, typing.Union[None, BaseException]]:
+        encoders = self.encoders
+
+        async def apply(encoder: GenericRDSEncoder, state: GenericRDSEncoderState):
+            encoder.state = state
+            encoder.ensure_current()
+
+        return await self._gather_bounded(
+            {
+                name: functools.partial(apply, encoders[name], state)
+                for name, state in states.items()
+                if name in encoders
+            },
+            concurrency,
+        )
+
+    async def _gather_bounded(
+        self,
+        calls: dict[str, typing.Callable[[], typing.Awaitable[T]]],
+        concurrency: typing.Optional[int],
+    ) -> dict[str, typing.Union[T, BaseException]]:
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def run(call: typing.Callable[[], typing.Awaitable[T]]) -> T:
+            async with semaphore:
+                return await call()
+
+        results = await asyncio.gather(
+            *(run(call) for call in calls.values()), return_exceptions=True
+        )
+        return dict(zip(calls.keys(), results))
+
+    async def sync_clock(
+        self,
+        timestamp: typing.Optional[datetime.datetime] = None,
+        concurrency: typing.Optional[int] = None,
+    ) -> dict[str, typing.Union[None, BaseException]]:
+        async def sync(encoder: GenericRDSEncoder):
+            encoder.sync_clock(timestamp)
+
+        return await self.fan_out(sync, concurrency=concurrency)
+
+    async def poll(
+        self, concurrency: typing.Optional[int] = None
+    ) -> dict[str, typing.Union[None, BaseException]]:
+        async def poll(encoder: GenericRDSEncoder):
+            encoder.poll()
+
+        return await self.fan_out(poll, concurrency=concurrency)
+
+    async def _stop_member(self, member: _FleetMember):
+        self._cancel_verification(member)
+        if member.task is not None:
+            member.task.cancel()
+            try:
+                await member.task
+            except asyncio.CancelledError:
+                pass
+            member.task = None
+        if member.encoder is not None:
+            member.encoder.close()
+            member.encoder = None
+        if member.protocol is not None and member.protocol.transport is not None:
+            member.protocol.transport.close()
+        member.protocol = None
+        member.health.status = EncoderHealthStatus.STOPPED
+        member.health.connected_since = None
+
+    async def _connect(self, member: _FleetMember) -> GenericRDSEncoder:
+        # reuse a still open transport, e.g. after a failed initialisation
+        if member.protocol is None or not member.protocol.connected:
+            member.protocol = await member.opener()
+        restored = self._restored.pop(member.identity, None)
+        if restored is not None:
+            encoder = GenericRDSEncoder.create_from_snapshot(member.protocol, restored)
+            member.verify_task = asyncio.get_running_loop().create_task(
+                self._verify(member, encoder)
+            )
+            return encoder
+        return await GenericRDSEncoder.create_from_protocol(
+            member.protocol, self.init_timeout
+        )
+
+    async def _verify(self, member: _FleetMember, encoder: GenericRDSEncoder):
+        mismatched = await encoder.verify(self.init_timeout)
+        if not mismatched:
+            return
+        self.logger.warning(
+            f"Encoder {member.name!r} deviated from its snapshot in "
+            f"{len(mismatched)} slots"
+        )
+        if all(
+            key[0] != ProgrammeIdentificationSetCommand.ELEMENT_CODE
+            for key in mismatched
+        ):
+            return
+        # the snapshot is keyed by the endpoint, a different programme
+        # identification most likely means another unit was connected there,
+        # none of the assumed settings can be trusted
+        self.logger.warning(
+            f"Encoder {member.name!r} is not the unit of its snapshot, "
+            "initialising from the device"
+        )
+        assert member.protocol is not None
+        try:
+            replacement = await GenericRDSEncoder.create_from_protocol(
+                member.protocol, self.init_timeout
+            )
+        except TimeoutError as e:
+            self.logger.warning(f"Initialising {member.name!r} failed: {e!r}")
+            return
+        if member.encoder is encoder:
+            member.encoder = replacement
+            encoder.close()
+        else:
+            replacement.close()
+
+    def _cancel_verification(self, member: _FleetMember):
+        if member.verify_task is not None:
+            member.verify_task.cancel()
+            member.verify_task = None
+
+    async def _supervise(self, member: _FleetMember):
+        loop = asyncio.get_running_loop()
+        health = member.health
+        delay = self.restart_delay
+        while True:
+            try:
+                async with self._connect_semaphore:
+                    health.status = EncoderHealthStatus.CONNECTING
+                    health.connect_attempts += 1
+                    encoder = await self._connect(member)
+            except Exception as e:
+                self.logger.warning(f"Connecting {member.name!r} failed: {e!r}")
+                health.status = EncoderHealthStatus.FAILED
+                health.consecutive_failures += 1
+                health.last_error = e
+                member.first_attempt_done.set()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_restart_delay)
+                continue
+
+            protocol = member.protocol
+            assert protocol is not None
+            connection_lost = loop.create_future()
+
+            def lost(exc: typing.Optional[Exception], future=connection_lost):
+                if not future.done():
+                    future.set_result(exc)
+
+            protocol.connection_lost_callbacks.append(lost)
+            try:
+                member.encoder = encoder
+                health.status = EncoderHealthStatus.CONNECTED
+                health.consecutive_failures = 0
+                health.connected_since = loop.time()
+                member.first_attempt_done.set()
+                delay = self.restart_delay
+                self.logger.info(f"Encoder {member.name!r} connected")
+
+                exc = await connection_lost
+            finally:
+                protocol.connection_lost_callbacks.remove(lost)
+            self.logger.warning(f"Encoder {member.name!r} lost connection: {exc!r}")
+            self._cancel_verification(member)
+            if member.encoder is not None:
+                member.encoder.close()
+            member.encoder = None
+            member.protocol = None
+            health.status = EncoderHealthStatus.FAILED
+            health.consecutive_failures += 1
+            health.last_error = exc
+            health.connected_since = None
+            await asyncio.sleep(delay)
@@ -0,0 +1,84 @@
+"""\
+Frames encoded ahead of time for latency critical switching, e.g. traffic
+announcements and alarms.
+
+    hot = HotFrameRegistry(protocol)
+    hot.arm("ta_on", [TrafficAnnouncementProgrammeSetCommand(announcement=True, programme=True)])
+    hot.fire("ta_on", triggered_at=time.perf_counter())
+
+Firing looks up the encoded bytes and writes them to the transport, nothing is
+constructed or encoded and no queue is passed. The frames are written through
+the AcknowledgementTracker of the protocol.
+"""
+
+import time
+import typing
+
+from uecp.commands import UECPCommand
+from uecp.frame import UECPFrame
+from uecp.metrics import Histogram, Metric
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+
+class HotFrameRegistry:
+    def __init__(self, protocol: UECPSerialProtocol):
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+        self._frames: dict[typing.Hashable, tuple[bytes, UECPFrame]] = {}
+        # called with every fired frame after it was written
+        self.fired_callbacks: list[typing.Callable[[UECPFrame], None]] = []
+        # seconds from trigger to the frame handed to the transport
+        self.latency = Histogram()
+        self.frames_fired = 0
+
+    def __contains__(self, name: typing.Hashable) -> bool:
+        return name in self._frames
+
+    @property
+    def names(self) -> list[typing.Hashable]:
+        return list(self._frames)
+
+    def arm(
+        self,
+        name: typing.Hashable,
+        frame: typing.Union[UECPFrame, typing.Iterable[UECPCommand]],
+    ):
+        if not isinstance(frame, UECPFrame):
+            frame = UECPFrame(commands=list(frame))
+        frame.sequence_counter = self._acks.next_sequence_counter()
+        self._frames[name] = frame.encode(), frame
+
+    def disarm(self, name: typing.Hashable):
+        del self._frames[name]
+
+    def fire(
+        self, name: typing.Hashable, triggered_at: typing.Optional[float] = None
+    ) -> float:
+        """\
+        Write the frame armed as name, returns the seconds since triggered_at,
+        a time.perf_counter value taken by the trigger, or since the call.
+        """
+        if triggered_at is None:
+            triggered_at = time.perf_counter()
+        data, frame = self._frames[name]
+        self._acks.write_raw(data, frame)
+        latency = time.perf_counter() - triggered_at
+        self.latency.observe(latency)
+        self.frames_fired += 1
+        for callback in self.fired_callbacks:
+            callback(frame)
+        return latency
+
+    def collect_metrics(self) -> typing.Iterator[Metric]:
+        yield Metric(
+            "uecp_hot_frames_fired_total",
+            "counter",
+            "Frames encoded ahead and fired",
+            self.frames_fired,
+        )
+        yield Metric(
+            "uecp_hot_frame_latency_seconds",
+            "histogram",
+            "Time from trigger to a hot frame handed to the transport",
+            self.latency.snapshot(),
+        )
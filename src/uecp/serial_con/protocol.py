@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 import typing
 from asyncio import transports
 from typing import Optional
@@ -7,18 +8,54 @@ from typing import Optional
 import serial  # type: ignore
 import serial_asyncio  # type: ignore
 
-from uecp.frame import UECPFrame, UECPFrameDecoder
+from uecp.capture import CaptureWriter, Direction
+from uecp.commands.base import T_UECPCommand
+from uecp.frame import UECPAddressFilter, UECPFrame, UECPFrameDecoder
+from uecp.metrics import Histogram, Metric
+from uecp.serial_con.dispatch import CommandHandler, UECPCommandDispatcher
+from uecp.wire_trace import WireTrace
 
 
 class UECPSerialProtocol(asyncio.Protocol):
-    def __init__(self) -> None:
+    def __init__(self, address_filter: Optional[UECPAddressFilter] = None) -> None:
         self.logger = logging.getLogger(self.__class__.__qualname__)
         self._transport: Optional[serial_asyncio.SerialTransport] = None
 
-        self._uecp_frame_decoder = UECPFrameDecoder()
+        self._uecp_frame_decoder = UECPFrameDecoder(address_filter=address_filter)
 
         self.connection_made_callbacks: list[typing.Callable[[], None]] = []
+        self.connection_lost_callbacks: list[
+            typing.Callable[[Optional[Exception]], None]
+        ] = []
         self.received_frame_callbacks: list[typing.Callable[[UECPFrame], None]] = []
+        self._command_dispatcher = UECPCommandDispatcher()
+
+        # raw link traffic is recorded here when set
+        self.capture_writer: Optional[CaptureWriter] = None
+        # recent raw traffic is kept here when set and logged on errors
+        self.wire_trace: Optional[WireTrace] = None
+
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        self.decode_time = Histogram()
+        self.callback_time = Histogram()
+
+    @property
+    def address_filter(self) -> Optional[UECPAddressFilter]:
+        return self._uecp_frame_decoder.address_filter
+
+    @address_filter.setter
+    def address_filter(self, value: Optional[UECPAddressFilter]):
+        self._uecp_frame_decoder.address_filter = value
+
+    @property
+    def filtered_frames(self) -> int:
+        return self._uecp_frame_decoder.filtered_frames
+
+    @property
+    def transport(self) -> Optional[transports.BaseTransport]:
+        return self._transport
 
     @property
     def connected(self) -> bool:
@@ -26,6 +63,20 @@ class UECPSerialProtocol(asyncio.Protocol):
             return not self._transport.is_closing()
         return False
 
+    def subscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        self._command_dispatcher.subscribe(command_type, handler)
+
+    def unsubscribe(
+        self,
+        command_type: type[T_UECPCommand],
+        handler: CommandHandler[T_UECPCommand],
+    ):
+        self._command_dispatcher.unsubscribe(command_type, handler)
+
     def connection_made(self, transport: transports.BaseTransport):
         self.logger.debug(f"Connection made {transport}")
         if self._transport is not None:
@@ -36,21 +87,44 @@ class UECPSerialProtocol(asyncio.Protocol):
 
     def connection_lost(self, exc: Optional[Exception]):
         self._transport = None
+        for callback in self.connection_lost_callbacks:
+            callback(exc)
         if exc is None:
             if not self._uecp_frame_decoder.empty:
+                self._log_wire_trace("Connection lost within a frame")
                 raise Exception("Interrupted within decoding a frame")
             return
+        self._log_wire_trace(f"Connection lost {exc!r}")
         raise exc
 
     def data_received(self, data: bytes):
-        self.logger.debug(f"Data received {data.hex()}")
-
-        frame, remaining_data = self._uecp_frame_decoder.decode(data)
-        while frame is not None:
-            if frame:
-                for callback in self.received_frame_callbacks:
-                    callback(frame)
-            frame, remaining_data = self._uecp_frame_decoder.decode(remaining_data)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Data received %s", data.hex())
+        if self.capture_writer is not None:
+            self.capture_writer.write(Direction.RX, data)
+        if self.wire_trace is not None:
+            self.wire_trace.record(Direction.RX, data)
+
+        self.bytes_received += len(data)
+
+        perf_counter = time.perf_counter
+        decode = self._uecp_frame_decoder.decode
+        try:
+            started = perf_counter()
+            frame, remaining_data = decode(data)
+            while frame is not None:
+                decoded = perf_counter()
+                self.decode_time.observe(decoded - started)
+                if frame:
+                    for callback in self.received_frame_callbacks:
+                        callback(frame)
+                    self._command_dispatcher.dispatch(frame)
+                started = perf_counter()
+                self.callback_time.observe(started - decoded)
+                frame, remaining_data = decode(remaining_data)
+        except Exception as e:
+            self._log_wire_trace(f"Handling received data failed {e!r}")
+            raise
         if len(remaining_data) > 0:
             raise Exception(
                 f"not all received bytes could be decoded, should never happen, {remaining_data!r}"
@@ -58,14 +132,91 @@ class UECPSerialProtocol(asyncio.Protocol):
 
     def write(self, frame: UECPFrame):
         if self._transport:
-            data = frame.encode()
-            self.logger.debug(f"Writing {data.hex()}")
-            self._transport.write(data)
+            self.write_raw(frame.encode())
+        else:
+            self.logger.error("No transport opened yet")
+
+    def write_raw(self, data: bytes):
+        """\
+        Write an encoded frame, e.g. one encoded ahead for low latency.
+        """
+        if self._transport:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Writing %s", data.hex())
+            if self.capture_writer is not None:
+                self.capture_writer.write(Direction.TX, data)
+            if self.wire_trace is not None:
+                self.wire_trace.record(Direction.TX, data)
+            self.bytes_sent += len(data)
+            self.frames_sent += 1
+            self._write_data(data)
         else:
             self.logger.error("No transport opened yet")
 
+    def _write_data(self, data: bytes):
+        assert self._transport is not None
+        self._transport.write(data)
+
+    def _log_wire_trace(self, reason: str):
+        if self.wire_trace is not None:
+            self.logger.error("%s, recent traffic:\n%s", reason, self.wire_trace.dump())
+
+    def collect_metrics(self) -> typing.Iterator[Metric]:
+        decoder = self._uecp_frame_decoder
+        for name, value, help_text in (
+            ("uecp_bytes_received_total", self.bytes_received, "Bytes received"),
+            ("uecp_bytes_sent_total", self.bytes_sent, "Bytes sent"),
+            ("uecp_frames_sent_total", self.frames_sent, "Frames encoded and sent"),
+            ("uecp_frames_decoded_total", decoder.frames_decoded, "Frames decoded"),
+            (
+                "uecp_frames_filtered_total",
+                decoder.filtered_frames,
+                "Frames dropped by the address filter",
+            ),
+            ("uecp_crc_errors_total", decoder.crc_errors, "Frames failing the CRC"),
+            (
+                "uecp_framing_errors_total",
+                decoder.framing_errors,
+                "Frames with invalid delimiters, length or byte stuffing",
+            ),
+            (
+                "uecp_command_errors_total",
+                decoder.command_errors,
+                "Frames with undecodable commands",
+            ),
+            (
+                "uecp_resyncs_total",
+                decoder.resyncs,
+                "Partial frames discarded on a start byte",
+            ),
+        ):
+            yield Metric(name, "counter", help_text, value)
+        yield Metric(
+            "uecp_decode_seconds",
+            "histogram",
+            "Time spent decoding a frame",
+            self.decode_time.snapshot(),
+        )
+        yield Metric(
+            "uecp_callback_seconds",
+            "histogram",
+            "Time spent in callbacks and handlers of a received frame",
+            self.callback_time.snapshot(),
+        )
+        write_buffer_size = getattr(self._transport, "get_write_buffer_size", None)
+        yield Metric(
+            "uecp_write_buffer_bytes",
+            "gauge",
+            "Bytes queued in the transport for sending",
+            write_buffer_size() if write_buffer_size is not None else 0,
+        )
+
 
-async def open_serial_protocol(port: str, baudrate: int) -> UECPSerialProtocol:
+async def open_serial_protocol(
+    port: str,
+    baudrate: int,
+    address_filter: Optional[UECPAddressFilter] = None,
+) -> UECPSerialProtocol:
     con = serial.Serial(
         port=port,
         baudrate=baudrate,
@@ -78,6 +229,8 @@ async def open_serial_protocol(port: str, baudrate: int) -> UECPSerialProtocol:
     )
 
     _, protocol = await serial_asyncio.connection_for_serial(
-        asyncio.get_running_loop(), UECPSerialProtocol, con
+        asyncio.get_running_loop(),
+        lambda: UECPSerialProtocol(address_filter=address_filter),
+        con,
     )
     return protocol
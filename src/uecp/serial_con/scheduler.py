@@ -0,0 +1,324 @@
+"""\
+Priority aware sending of commands over one link.
+
+Commands are queued by priority class and sent highest class first, packed
+into frames of one class. A queued command is superseded by a newer one for the
+same slot, keyed by (MEC, DSN, PSN), hence a radio text replaced before it was
+sent is never transmitted. Frames are sent one at a time, paced by the
+transmission time at baudrate and/or the acknowledgement of the previous frame,
+so commands wait in the queue instead of the transport buffer. Frames are
+written through the AcknowledgementTracker of the link, so the scheduler can
+share it with an encoder or other writers.
+"""
+
+import asyncio
+import collections
+import enum
+import itertools
+import logging
+import typing
+
+from uecp.commands import (
+    ProgrammeType,
+    ProgrammeTypeSetCommand,
+    RadioTextBufferConfiguration,
+    RadioTextSetCommand,
+    RequestCommand,
+    ResponseCode,
+    TrafficAnnouncementProgrammeSetCommand,
+    UECPCommand,
+)
+from uecp.frame import UECPFrame
+from uecp.metrics import Metric
+from uecp.serial_con.acks import DEFAULT_TIMEOUT, AcknowledgementTracker
+from uecp.serial_con.protocol import UECPSerialProtocol
+from uecp.serial_con.state import ProgrammeServiceState, slot_key
+
+BITS_PER_BYTE = 10
+
+
+@enum.unique
+class Priority(enum.IntEnum):
+    ALARM = 0
+    CONTROL = 1
+    CONTENT = 2
+    POLL = 3
+
+
+def classify(command: UECPCommand) -> Priority:
+    """\
+    Traffic announcements and alarms first, then encoder control, programme
+    service content and requests last.
+    """
+    if isinstance(command, TrafficAnnouncementProgrammeSetCommand):
+        return Priority.ALARM
+    if isinstance(command, ProgrammeTypeSetCommand) and command.programme_type in (
+        ProgrammeType.ALARM,
+        ProgrammeType.ALARM_TEST,
+    ):
+        return Priority.ALARM
+    if isinstance(command, RequestCommand):
+        return Priority.POLL
+    if command.ELEMENT_CODE in ProgrammeServiceState.SLOTS_BY_ELEMENT_CODE:
+        return Priority.CONTENT
+    return Priority.CONTROL
+
+
+def supersession_key(command: UECPCommand) -> typing.Optional[typing.Hashable]:
+    """\
+    Key of the slot set by command, None for commands adding to what was sent
+    before, like radio texts appended to the buffer.
+    """
+    if isinstance(command, RequestCommand):
+        return (
+            command.ELEMENT_CODE,
+            command.element_code,
+            command.data_set_number,
+            command.programme_service_number,
+        )
+    if (
+        isinstance(command, RadioTextSetCommand)
+        and command.buffer_configuration is RadioTextBufferConfiguration.APPEND
+    ):
+        return None
+    return slot_key(command)
+
+
+class SendScheduler:
+    def __init__(
+        self,
+        protocol: UECPSerialProtocol,
+        baudrate: typing.Optional[int] = None,
+        ack_timeout: typing.Optional[float] = None,
+    ):
+        """\
+        With baudrate, the next frame is sent once the previous one left the
+        link, with ack_timeout once it is acknowledged or the timeout passed.
+        """
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self._protocol = protocol
+        self.baudrate = baudrate
+        self.ack_timeout = ack_timeout
+
+        self._queues: dict[
+            Priority, collections.OrderedDict[typing.Hashable, UECPCommand]
+        ] = {priority: collections.OrderedDict() for priority in Priority}
+        self._priorities: dict[typing.Hashable, Priority] = {}
+        # keys for commands not superseding others
+        self._unique_keys = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+        # waiters of send by the key of the queued command
+        self._waiters: dict[
+            typing.Hashable, list[asyncio.Future[typing.Optional[ResponseCode]]]
+        ] = {}
+        self._acks = AcknowledgementTracker.for_protocol(protocol)
+
+        self.frames_sent = 0
+        self.commands_sent = 0
+        self.commands_superseded = 0
+
+        self._protocol.connection_made_callbacks.append(self._wake)
+
+    @property
+    def protocol(self) -> UECPSerialProtocol:
+        return self._protocol
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def queue_depth(self, priority: typing.Optional[Priority] = None) -> int:
+        if priority is not None:
+            return len(self._queues[priority])
+        return len(self._priorities)
+
+    def submit(
+        self, *commands: UECPCommand, priority: typing.Optional[Priority] = None
+    ):
+        """\
+        Queue commands with the given priority, by default classify decides.
+        A queued command for the same slot is replaced, keeping its place if
+        the priority is the same.
+        """
+        for command in commands:
+            self._enqueue(command, priority)
+        self._wake()
+
+    async def send(
+        self, *commands: UECPCommand, priority: typing.Optional[Priority] = None
+    ) -> typing.Optional[ResponseCode]:
+        """\
+        Like submit, returning once the commands, or the commands superseding
+        them, were sent. Returns the first response code other than OK, None if
+        a frame was not acknowledged within ack_timeout or the scheduler was
+        stopped before. Without ack_timeout the commands are taken as accepted
+        once written.
+        """
+        if self._task is None:
+            raise ValueError("Scheduler not started")
+        loop = asyncio.get_running_loop()
+        waiters = []
+        for command in commands:
+            waiter: asyncio.Future[typing.Optional[ResponseCode]] = loop.create_future()
+            self._waiters.setdefault(self._enqueue(command, priority), []).append(
+                waiter
+            )
+            waiters.append(waiter)
+        self._wake()
+        codes = await asyncio.gather(*waiters)
+        if None in codes:
+            return None
+        for code in codes:
+            if code is not ResponseCode.OK:
+                return code
+        return ResponseCode.OK
+
+    def _enqueue(
+        self, command: UECPCommand, priority: typing.Optional[Priority]
+    ) -> typing.Hashable:
+        key = supersession_key(command)
+        if key is None:
+            key = ("unique", next(self._unique_keys))
+        command_priority = classify(command) if priority is None else priority
+        previous = self._priorities.get(key)
+        if previous is not None:
+            self.commands_superseded += 1
+            if previous is not command_priority:
+                del self._queues[previous][key]
+        self._queues[command_priority][key] = command
+        self._priorities[key] = command_priority
+        return key
+
+    def start(self):
+        if self._task is not None:
+            raise ValueError("Scheduler already started")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """\
+        Stop sending, queued commands are kept for the next start but those
+        waited for by send are taken as not acknowledged.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        self._waiters.clear()
+
+    def close(self):
+        self._protocol.connection_made_callbacks.remove(self._wake)
+        for queue in self._queues.values():
+            queue.clear()
+        self._priorities.clear()
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                waiter.cancel()
+        self._waiters.clear()
+
+    def collect_metrics(self) -> typing.Iterator[Metric]:
+        yield Metric(
+            "uecp_scheduler_frames_sent_total",
+            "counter",
+            "Frames sent by the scheduler",
+            self.frames_sent,
+        )
+        yield Metric(
+            "uecp_scheduler_superseded_total",
+            "counter",
+            "Queued commands replaced before being sent",
+            self.commands_superseded,
+        )
+        for priority, queue in self._queues.items():
+            yield Metric(
+                "uecp_scheduler_queue_depth",
+                "gauge",
+                "Commands queued for sending",
+                len(queue),
+                {"priority": priority.name.lower()},
+            )
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def _next_frame(
+        self,
+    ) -> typing.Optional[
+        tuple[UECPFrame, list[asyncio.Future[typing.Optional[ResponseCode]]]]
+    ]:
+        for queue in self._queues.values():
+            if not queue:
+                continue
+            frame = UECPFrame()
+            waiters: list[asyncio.Future[typing.Optional[ResponseCode]]] = []
+            while queue:
+                key, command = next(iter(queue.items()))
+                try:
+                    frame.add_command(command)
+                except OverflowError:
+                    if not frame.commands:
+                        raise
+                    break
+                del queue[key]
+                del self._priorities[key]
+                waiters.extend(self._waiters.pop(key, ()))
+            return frame, waiters
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._protocol.connected:
+                entry = self._next_frame()
+                if entry is None:
+                    break
+                frame, waiters = entry
+                # stopped while sending, taken as not acknowledged
+                code: typing.Optional[ResponseCode] = None
+                try:
+                    code = await self._send(loop, frame)
+                finally:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(code)
+
+    async def _send(
+        self, loop: asyncio.AbstractEventLoop, frame: UECPFrame
+    ) -> typing.Optional[ResponseCode]:
+        frame.sequence_counter = self._acks.next_sequence_counter()
+        data = frame.encode()
+        transmission = len(data) * BITS_PER_BYTE / self.baudrate if self.baudrate else 0
+        ack_waiter: typing.Optional[asyncio.Future[ResponseCode]] = None
+        if self.ack_timeout is not None:
+            ack_waiter = loop.create_future()
+        self._acks.write_raw(
+            data,
+            frame,
+            ack_waiter,
+            transmission
+            + (DEFAULT_TIMEOUT if self.ack_timeout is None else self.ack_timeout),
+        )
+        self.frames_sent += 1
+        self.commands_sent += len(frame.commands)
+        if transmission:
+            await asyncio.sleep(transmission)
+        if ack_waiter is None:
+            return ResponseCode.OK
+        try:
+            code = await asyncio.wait_for(ack_waiter, self.ack_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"No acknowledgement for {frame!r}")
+            return None
+        if code is not ResponseCode.OK:
+            self.logger.warning(f"{frame!r} rejected with {code!r}")
+        return code
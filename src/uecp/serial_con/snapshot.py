@@ -0,0 +1,129 @@
+"""\
+Snapshots of encoder states for a warm start without polling every encoder.
+
+    store = StateSnapshotStore("encoders.json")
+    store.save({device_identity(name, endpoint): encoder.shadow})
+    states = store.load()
+
+A state is stored as the hex encoded commands of its slots, keyed by device
+identity. Restored states are unconfirmed until verified against the device,
+see GenericRDSEncoder.verify. EncoderFleet initialises an encoder from the
+device instead when verifying reveals another programme identification, i.e.
+another unit connected to the endpoint.
+"""
+
+import datetime
+import json
+import logging
+import os
+import tempfile
+import typing
+
+from uecp.commands import DataSetSelectCommand, UECPCommand
+from uecp.commands.base import UECPCommandException
+from uecp.serial_con.device import GenericRDSEncoderState
+
+SNAPSHOT_VERSION = 1
+
+
+def device_identity(name: str, endpoint: typing.Hashable) -> str:
+    """\
+    Key of a device, its name and where it is connected. It identifies the
+    connection, not the unit: UECP defines no serial number or other unit
+    identifier to read from the device, and anything reported is only known
+    after polling, which the snapshot is meant to spare. A unit swapped on the
+    same endpoint gets the snapshot of its predecessor and has to be told apart
+    by verifying the restored state, EncoderFleet goes by the programme
+    identification. A replacement configured with the same programme
+    identification is taken for its predecessor, only its deviating slots are
+    corrected.
+    """
+    if isinstance(endpoint, tuple):
+        endpoint = ":".join(map(str, endpoint))
+    return f"{name}@{endpoint}"
+
+
+def encode_state(state: GenericRDSEncoderState) -> list[str]:
+    return [bytes(command.encode()).hex() for command in state.slots().values()]
+
+
+def decode_state(commands: typing.Iterable[str]) -> GenericRDSEncoderState:
+    decoded = [
+        command
+        for text in commands
+        for command in UECPCommand.decode_commands(bytes.fromhex(text))
+    ]
+    select = next(
+        (command for command in decoded if isinstance(command, DataSetSelectCommand)),
+        None,
+    )
+    if select is None:
+        raise ValueError("State without active data set")
+    state = GenericRDSEncoderState(active_data_set=select.select_data_set_number)
+    for command in decoded:
+        state.apply(command)
+    # nothing is confirmed by the device yet
+    state.confirmed_at.clear()
+    return state
+
+
+class StateSnapshotStore:
+    def __init__(self, path: typing.Union[str, os.PathLike]):
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+        self.path = os.fspath(path)
+
+    def save(self, states: typing.Mapping[str, GenericRDSEncoderState]):
+        """\
+        Replace the snapshot atomically, readers see the old or the new one.
+        """
+        document = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "encoders": {
+                identity: encode_state(state) for identity, state in states.items()
+            },
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(document, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def load(self) -> dict[str, GenericRDSEncoderState]:
+        """\
+        States of the snapshot, none if there is no snapshot yet. States which
+        can't be decoded are skipped, a snapshot which can't be read at all
+        raises ValueError.
+        """
+        try:
+            with open(self.path) as file:
+                document = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Snapshot is not valid JSON: {e}") from e
+        if not isinstance(document, dict):
+            raise ValueError("Snapshot is not a JSON object")
+        version = document.get("version")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version!r}")
+        encoders = document.get("encoders")
+        if not isinstance(encoders, dict):
+            raise ValueError("Snapshot without encoders")
+        states = {}
+        for identity, commands in encoders.items():
+            try:
+                if not isinstance(commands, list) or not all(
+                    isinstance(text, str) for text in commands
+                ):
+                    raise ValueError("State is not a list of commands")
+                states[identity] = decode_state(commands)
+            except (ValueError, UECPCommandException) as e:
+                self.logger.warning(f"Skipping snapshot of {identity!r}: {e!r}")
+        return states
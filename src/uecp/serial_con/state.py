@@ -0,0 +1,317 @@
+"""\
+Generic pieces of the encoder state model.
+
+Every setting maps to a command slot keyed by (MEC, DSN, PSN), DSN and PSN are
+None for commands without them. Two states are compared slot by slot on the
+encoded commands, so a diff only holds commands whose encoding changed.
+
+Assignments are tracked: a ProgrammeServiceState within a ServiceMap reports
+the keys of the slots it touched to the owner of the map, allowing a
+reconciliation to visit only those slots.
+"""
+
+import typing
+
+import attr
+
+from uecp.commands import (
+    DecoderInformationSetCommand,
+    ProgrammeIdentificationSetCommand,
+    ProgrammeServiceNameSetCommand,
+    ProgrammeType,
+    ProgrammeTypeNameSetCommand,
+    ProgrammeTypeSetCommand,
+    RadioText,
+    RadioTextSetCommand,
+    TrafficAnnouncementProgrammeSetCommand,
+    UECPCommand,
+)
+from uecp.frame import UECPFrame
+
+SlotKey = tuple[int, typing.Optional[int], typing.Optional[int]]
+ServiceKey = tuple[int, int]
+
+MAX_FRAME_PAYLOAD = 255
+
+
+@attr.s(auto_detect=True, frozen=True, slots=True)
+class SlotSpec:
+    """\
+    Maps state fields to the keyword arguments, which are also the property
+    names, of the command setting them. A slot is only generated if all of
+    its fields are known, i.e. not None.
+    """
+
+    command_type: type[UECPCommand] = attr.ib()
+    fields: dict[str, str] = attr.ib()
+    constants: dict[str, typing.Any] = attr.ib(factory=dict)
+
+    def create(self, state: typing.Any, **kwargs) -> typing.Optional[UECPCommand]:
+        for field, argument in self.fields.items():
+            value = getattr(state, field)
+            if value is None:
+                return None
+            kwargs[argument] = value
+        return self.command_type(**self.constants, **kwargs)
+
+    def values(self, command: UECPCommand) -> dict[str, typing.Any]:
+        return {
+            field: getattr(command, argument) for field, argument in self.fields.items()
+        }
+
+
+def slot_key(command: UECPCommand) -> SlotKey:
+    return (
+        command.ELEMENT_CODE,
+        getattr(command, "data_set_number", None),
+        getattr(command, "programme_service_number", None),
+    )
+
+
+def _track_change(
+    instance: "ProgrammeServiceState", attribute: attr.Attribute, value: typing.Any
+) -> typing.Any:
+    owner = instance._owner
+    if owner is not None:
+        mark_dirty, dsn, psn = owner
+        mark_dirty((instance.ELEMENT_CODES_BY_FIELD[attribute.name], dsn, psn))
+    return value
+
+
+def _radio_text(
+    value: typing.Union[None, str, RadioText]
+) -> typing.Optional[RadioText]:
+    if value is None or isinstance(value, RadioText):
+        return value
+    return RadioText(text=value)
+
+
+@attr.s(
+    auto_detect=True,
+    kw_only=True,
+    on_setattr=[attr.setters.convert, attr.setters.validate, _track_change],
+)
+class ProgrammeServiceState:
+    """\
+    Settings of one programme service within a data set, None for settings
+    not known or not to be managed.
+    """
+
+    pi: typing.Optional[int] = attr.ib(
+        default=None, converter=attr.converters.optional(int)
+    )
+    ps: typing.Optional[str] = attr.ib(default=None)
+    pty: typing.Optional[ProgrammeType] = attr.ib(
+        default=None, converter=attr.converters.optional(ProgrammeType)
+    )
+    ptyn: typing.Optional[str] = attr.ib(default=None)
+    ta: typing.Optional[bool] = attr.ib(
+        default=None, converter=attr.converters.optional(bool)
+    )
+    tp: typing.Optional[bool] = attr.ib(
+        default=None, converter=attr.converters.optional(bool)
+    )
+    stereo: typing.Optional[bool] = attr.ib(
+        default=None, converter=attr.converters.optional(bool)
+    )
+    dynamic_pty: typing.Optional[bool] = attr.ib(
+        default=None, converter=attr.converters.optional(bool)
+    )
+    rt: typing.Optional[RadioText] = attr.ib(default=None, converter=_radio_text)
+
+    SLOTS: typing.ClassVar[tuple[SlotSpec, ...]] = (
+        SlotSpec(ProgrammeIdentificationSetCommand, {"pi": "pi"}),
+        SlotSpec(ProgrammeServiceNameSetCommand, {"ps": "ps"}),
+        SlotSpec(ProgrammeTypeSetCommand, {"pty": "programme_type"}),
+        SlotSpec(ProgrammeTypeNameSetCommand, {"ptyn": "programme_type_name"}),
+        SlotSpec(
+            TrafficAnnouncementProgrammeSetCommand,
+            {"ta": "announcement", "tp": "programme"},
+        ),
+        SlotSpec(
+            DecoderInformationSetCommand,
+            {"stereo": "stereo", "dynamic_pty": "dynamic_pty"},
+        ),
+        SlotSpec(RadioTextSetCommand, {"rt": "radiotext"}),
+    )
+    SLOTS_BY_ELEMENT_CODE: typing.ClassVar[dict[int, SlotSpec]] = {
+        spec.command_type.ELEMENT_CODE: spec for spec in SLOTS
+    }
+    ELEMENT_CODES_BY_FIELD: typing.ClassVar[dict[str, int]] = {
+        field: spec.command_type.ELEMENT_CODE for spec in SLOTS for field in spec.fields
+    }
+
+    def __attrs_post_init__(self) -> None:
+        # dirty slot callback, data set and programme service number of the owner
+        self._owner: typing.Optional[
+            tuple[typing.Callable[[SlotKey], None], int, int]
+        ] = None
+
+    def copy(self) -> "ProgrammeServiceState":
+        return attr.evolve(
+            self, rt=attr.evolve(self.rt) if self.rt is not None else None
+        )
+
+    def command(
+        self, element_code: int, data_set_number: int, programme_service_number: int
+    ) -> typing.Optional[UECPCommand]:
+        return self.SLOTS_BY_ELEMENT_CODE[element_code].create(
+            self,
+            data_set_number=data_set_number,
+            programme_service_number=programme_service_number,
+        )
+
+    def commands(
+        self, data_set_number: int, programme_service_number: int
+    ) -> typing.Iterator[UECPCommand]:
+        for spec in self.SLOTS:
+            command = spec.create(
+                self,
+                data_set_number=data_set_number,
+                programme_service_number=programme_service_number,
+            )
+            if command is not None:
+                yield command
+
+    def apply(self, command: UECPCommand) -> bool:
+        """\
+        Take over the settings of a received or sent command, returns whether
+        the command belongs to a programme service.
+        """
+        spec = self.SLOTS_BY_ELEMENT_CODE.get(command.ELEMENT_CODE)
+        if spec is None:
+            return False
+        for field, value in spec.values(command).items():
+            if attr.has(type(value)):
+                # commands hold mutable attrs values like RadioText
+                value = attr.evolve(value)
+            setattr(self, field, value)
+        return True
+
+
+class ServiceMap(dict[ServiceKey, ProgrammeServiceState]):
+    """\
+    Programme services by (data set number, programme service number). Added
+    services and later assignments to them are reported to mark_dirty by slot
+    key. A service can only belong to one map.
+    """
+
+    def __init__(
+        self,
+        mark_dirty: typing.Callable[[SlotKey], None],
+        services: typing.Optional[
+            typing.Mapping[ServiceKey, ProgrammeServiceState]
+        ] = None,
+    ):
+        super().__init__()
+        self._mark_dirty = mark_dirty
+        if services is not None:
+            self.update(services)
+
+    def __setitem__(self, key: ServiceKey, service: ProgrammeServiceState):
+        super().__setitem__(key, service)
+        dsn, psn = key
+        service._owner = self._mark_dirty, dsn, psn
+        for element_code in ProgrammeServiceState.SLOTS_BY_ELEMENT_CODE:
+            self._mark_dirty((element_code, dsn, psn))
+
+    def __delitem__(self, key: ServiceKey):
+        self.pop(key)
+
+    def pop(self, key: ServiceKey, *default):  # type: ignore[override]
+        if key not in self and default:
+            return default[0]
+        service = super().pop(key)
+        service._owner = None
+        return service
+
+    def popitem(self) -> tuple[ServiceKey, ProgrammeServiceState]:
+        key, service = super().popitem()
+        service._owner = None
+        return key, service
+
+    def clear(self):
+        for key in list(self):
+            self.pop(key)
+
+    def update(self, *args, **kwargs):
+        for key, service in dict(*args, **kwargs).items():
+            self[key] = service
+
+    def setdefault(  # type: ignore[override]
+        self, key: ServiceKey, default: ProgrammeServiceState
+    ) -> ProgrammeServiceState:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+def slot_diff(
+    current: typing.Mapping[SlotKey, UECPCommand],
+    target: typing.Mapping[SlotKey, UECPCommand],
+) -> list[UECPCommand]:
+    """\
+    Commands of the target slots missing or encoded differently in current.
+    Slots only present in current are left alone.
+    """
+    commands = []
+    for key, command in target.items():
+        existing = current.get(key)
+        if existing is None or existing.encode() != command.encode():
+            commands.append(command)
+    return commands
+
+
+def pack_frames(
+    commands: typing.Iterable[UECPCommand],
+    last: typing.Sequence[UECPCommand] = (),
+    frame_factory: typing.Callable[[], UECPFrame] = UECPFrame,
+) -> list[UECPFrame]:
+    """\
+    Pack commands into as few frames as possible by first fit decreasing. The
+    commands of last are sent after all others, in order, e.g. a data set
+    select after the data set content.
+    """
+    entries = sorted(
+        (
+            (len(command.encode()), index, command)
+            for index, command in enumerate(commands)
+        ),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+    used: list[int] = []
+    groups: list[list[tuple[int, UECPCommand]]] = []
+    for length, index, command in entries:
+        if length > MAX_FRAME_PAYLOAD:
+            raise OverflowError(f"Command {command!r} exceeds a frame")
+        for position, size in enumerate(used):
+            if size + length <= MAX_FRAME_PAYLOAD:
+                used[position] += length
+                groups[position].append((index, command))
+                break
+        else:
+            used.append(length)
+            groups.append([(index, command)])
+
+    if last:
+        length = sum(len(command.encode()) for command in last)
+        tail = [(len(entries) + index, command) for index, command in enumerate(last)]
+        fitting = [
+            position
+            for position, size in enumerate(used)
+            if size + length <= MAX_FRAME_PAYLOAD
+        ]
+        if fitting:
+            groups.append(groups.pop(fitting[-1]) + tail)
+        else:
+            groups.append(tail)
+
+    frames = []
+    for group in groups:
+        frame = frame_factory()
+        # within a frame the given order is kept
+        frame.add_command(
+            *(command for _, command in sorted(group, key=lambda e: e[0]))
+        )
+        frames.append(frame)
+    return frames
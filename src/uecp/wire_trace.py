@@ -0,0 +1,79 @@
+"""\
+Bounded in-memory trace of raw link traffic, dumped when something goes wrong.
+
+Recording only appends references to the received and written chunks, no
+formatting happens until the trace is dumped.
+"""
+
+import collections
+import datetime
+import time
+import typing
+
+from uecp.capture import CaptureWriter, Direction
+
+TraceEntry = tuple[int, Direction, bytes]
+
+
+class WireTrace:
+    def __init__(
+        self,
+        capacity: int = 1 << 16,
+        clock: typing.Callable[[], int] = time.time_ns,
+    ):
+        """\
+        Keep the most recent traffic up to capacity bytes.
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        self.capacity = int(capacity)
+        self._clock = clock
+        self._entries: collections.deque[TraceEntry] = collections.deque()
+        self._size = 0
+        self.dropped_bytes = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def record(self, direction: Direction, data: bytes):
+        if len(data) > self.capacity:
+            self.dropped_bytes += len(data) - self.capacity
+            data = data[-self.capacity :]
+        self._entries.append((self._clock(), direction, data))
+        self._size += len(data)
+        while self._size > self.capacity:
+            _, _, dropped = self._entries.popleft()
+            self._size -= len(dropped)
+            self.dropped_bytes += len(dropped)
+
+    def entries(self) -> list[TraceEntry]:
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def dump(self) -> str:
+        """\
+        Traced chunks as lines of UTC time, direction and hex bytes.
+        """
+        lines = []
+        if self.dropped_bytes:
+            lines.append(f"... {self.dropped_bytes} older bytes dropped")
+        for timestamp_ns, direction, data in self._entries:
+            timestamp = datetime.datetime.fromtimestamp(
+                timestamp_ns / 1e9, datetime.timezone.utc
+            )
+            lines.append(
+                f"{timestamp.isoformat(timespec='microseconds')} "
+                f"{direction.name} {data.hex(' ')}"
+            )
+        return "\n".join(lines)
+
+    def write_capture(self, writer: CaptureWriter):
+        """\
+        Append the traced chunks to a capture for the capture tooling.
+        """
+        for timestamp_ns, direction, data in self._entries:
+            writer.write(direction, data, timestamp_ns)
@@ -45,6 +45,14 @@ class TestRealTimeClockSetCommand:
         cmd = RealTimeClockSetCommand(timestamp=ts)
         assert cmd.encode() == [0x0D, 0x02, 0x09, 0x0C, 0x0A, 0x12, 0x21, 0x0F, 0x02]
 
+    def test_round_trip_end_of_second(self):
+        ts = datetime(2024, 1, 1, 12, 0, 59, microsecond=999_999, tzinfo=timezone.utc)
+        data = RealTimeClockSetCommand(timestamp=ts).encode()
+        assert data[7] == 99
+        cmd, consumed_bytes = RealTimeClockSetCommand.create_from(data + [0x18, 0x00])
+        assert consumed_bytes == 9
+        assert cmd.timestamp == ts.replace(microsecond=990_000)
+
 
 class TestRealTimeClockCorrectionSetCommand:
     def test_create_from(self):
@@ -0,0 +1,56 @@
+import asyncio
+import typing
+
+import pytest
+
+from uecp.emulator import UECPEncoderEmulator
+from uecp.ip_con.protocol import open_tcp_protocol
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+T = typing.TypeVar("T")
+
+
+class EmulatorLink:
+    """\
+    An emulator served on TCP and a protocol connected to it, both living on
+    one event loop which coroutines of the test are run on.
+    """
+
+    def __init__(self):
+        self._runner = asyncio.Runner()
+        self.emulator = UECPEncoderEmulator()
+        self.port = self.run(self.emulator.start_tcp())
+        self._protocols: list[UECPSerialProtocol] = []
+        self.protocol = self.run(self.connect())
+
+    def run(self, coroutine: typing.Coroutine[typing.Any, typing.Any, T]) -> T:
+        return self._runner.run(coroutine)
+
+    async def connect(self) -> UECPSerialProtocol:
+        """\
+        Another protocol connected to the emulator, closed with the link.
+        """
+        protocol = await open_tcp_protocol("127.0.0.1", self.port)
+        self._protocols.append(protocol)
+        return protocol
+
+    def close(self):
+        async def close():
+            for protocol in self._protocols:
+                if protocol.transport is not None:
+                    protocol.transport.close()
+            await self.emulator.close()
+
+        try:
+            self.run(close())
+        finally:
+            self._runner.close()
+
+
+@pytest.fixture
+def emulator_link() -> typing.Iterator[EmulatorLink]:
+    link = EmulatorLink()
+    try:
+        yield link
+    finally:
+        link.close()
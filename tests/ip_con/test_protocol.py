@@ -0,0 +1,80 @@
+import asyncio
+import socket
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    ResponseCode,
+)
+from uecp.frame import UECPFrame
+from uecp.ip_con.protocol import (
+    open_tcp_protocol,
+    open_udp_protocol,
+    start_tcp_server,
+    start_udp_server,
+)
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+
+def acknowledging(protocol: UECPSerialProtocol, received: list[int]):
+    def handler(cmd: DataSetSelectCommand):
+        received.append(cmd.select_data_set_number)
+        protocol.write(
+            UECPFrame(commands=[MessageAcknowledgementCommand(code=ResponseCode.OK)])
+        )
+
+    protocol.subscribe(DataSetSelectCommand, handler)
+
+
+def test_tcp_round_trip():
+    async def main():
+        received: list[int] = []
+        server_protocols: list[UECPSerialProtocol] = []
+
+        def client_connected(protocol: UECPSerialProtocol):
+            server_protocols.append(protocol)
+            acknowledging(protocol, received)
+
+        server = await start_tcp_server("127.0.0.1", 0, client_connected)
+        port = server.sockets[0].getsockname()[1]
+
+        client = await open_tcp_protocol("127.0.0.1", port, keepalive_idle=30)
+        sock = client.transport.get_extra_info("socket")
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) != 0
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE) != 0
+
+        acks = asyncio.Queue()
+        client.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+        client.write(UECPFrame(commands=[DataSetSelectCommand(3)]))
+        ack = await asyncio.wait_for(acks.get(), 5)
+        assert ack.code is ResponseCode.OK
+        assert received == [3]
+        assert len(server_protocols) == 1
+
+        client.transport.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_udp_round_trip():
+    async def main():
+        received: list[int] = []
+        server = await start_udp_server("127.0.0.1", 0)
+        acknowledging(server, received)
+        port = server.transport.get_extra_info("sockname")[1]
+
+        client = await open_udp_protocol("127.0.0.1", port)
+        acks = asyncio.Queue()
+        client.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+        client.write(UECPFrame(commands=[DataSetSelectCommand(5)]))
+        ack = await asyncio.wait_for(acks.get(), 5)
+        assert ack.code is ResponseCode.OK
+        assert received == [5]
+        assert server.peer == client.transport.get_extra_info("sockname")
+
+        client.transport.close()
+        server.transport.close()
+
+    asyncio.run(main())
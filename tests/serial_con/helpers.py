@@ -0,0 +1,21 @@
+from uecp.serial_con.device import GenericRDSEncoderState
+from uecp.serial_con.state import ProgrammeServiceState
+
+
+def full_state(active_data_set=1) -> GenericRDSEncoderState:
+    state = GenericRDSEncoderState(
+        active_data_set=active_data_set, rds_level=1000, rds_phase=900
+    )
+    for dsn in (1, 2):
+        state.services[(dsn, 0)] = ProgrammeServiceState(
+            pi=0xD300 + dsn,
+            ps=f"RADIO {dsn}",
+            pty=1,
+            ptyn="NEWS",
+            ta=False,
+            tp=True,
+            stereo=True,
+            dynamic_pty=False,
+            rt=f"DATA SET {dsn}\r",
+        )
+    return state
@@ -0,0 +1,165 @@
+import asyncio
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    ProgrammeServiceNameSetCommand,
+    ResponseCode,
+    TrafficAnnouncementProgrammeSetCommand,
+)
+from uecp.frame import UECPFrame
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.device import GenericRDSEncoder
+
+
+def _frame(ps: str) -> UECPFrame:
+    return UECPFrame(commands=[ProgrammeServiceNameSetCommand(ps=ps)])
+
+
+def test_shared_per_protocol(emulator_link):
+    async def main():
+        acks = AcknowledgementTracker.for_protocol(emulator_link.protocol)
+        assert AcknowledgementTracker.for_protocol(emulator_link.protocol) is acks
+        other = await emulator_link.connect()
+        assert AcknowledgementTracker.for_protocol(other) is not acks
+
+    emulator_link.run(main())
+
+
+def test_matched_in_order(emulator_link):
+    proto = emulator_link.protocol
+
+    async def main():
+        acks = AcknowledgementTracker.for_protocol(proto)
+        acknowledged = []
+        acks.acknowledged_callbacks.append(
+            lambda frame, code: acknowledged.append((frame, code))
+        )
+        loop = asyncio.get_running_loop()
+        frames = [
+            _frame("FIRST"),
+            UECPFrame(commands=[DataSetSelectCommand(select_data_set_number=200)]),
+            _frame("THIRD"),
+        ]
+        waiters = [loop.create_future() for _ in frames]
+        for frame, waiter in zip(frames, waiters):
+            acks.write(frame, waiter)
+        assert acks.pending == 3
+        codes = await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        assert codes == [ResponseCode.OK, ResponseCode.DSN_ERROR, ResponseCode.OK]
+        assert acknowledged == list(zip(frames, codes))
+        assert acks.pending == 0
+        assert acks.frames_acknowledged == 3
+
+    emulator_link.run(main())
+
+
+def test_lost_frames(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        acks = AcknowledgementTracker.for_protocol(proto)
+        loop = asyncio.get_running_loop()
+        emulator.drop_rate = 1.0
+        acks.write(_frame("LOST"), timeout=0.05)
+        await asyncio.sleep(0.1)
+        emulator.drop_rate = 0.0
+        waiter = loop.create_future()
+        acks.write(_frame("SECOND"), waiter)
+        assert await asyncio.wait_for(waiter, 1) is ResponseCode.OK
+        assert acks.frames_lost == 1
+        assert acks.unexpected_acknowledgements == 0
+
+    emulator_link.run(main())
+
+
+def test_encoder_with_hot_frames_on_shared_link(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        ta_on, _ = encoder.arm_traffic_announcement(1)
+        emulator.ack_latency = 0.02
+        emulator.data_set_count = 1
+
+        # rejected by the device, the hot frame in between is accepted
+        encoder.state.active_data_set = 2
+        encoder.ensure_current()
+        encoder.fire(ta_on)
+        encoder.state.service(1).ps = "RADIO"
+        encoder.ensure_current()
+        await asyncio.sleep(0.2)
+
+        assert emulator.get(TrafficAnnouncementProgrammeSetCommand, 1, 0).announcement
+        assert encoder.shadow.active_data_set == 1
+        assert encoder.shadow.service(1).ta
+        assert encoder.shadow.service(1).ps == "RADIO"
+        assert AcknowledgementTracker.for_protocol(proto).pending == 0
+        encoder.close()
+
+    emulator_link.run(main())
+
+
+def test_late_acknowledgement_is_uncertain(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        acks = AcknowledgementTracker.for_protocol(proto)
+        acknowledged, uncertain = [], []
+        acks.acknowledged_callbacks.append(
+            lambda frame, code: acknowledged.append(frame)
+        )
+        acks.uncertain_callbacks.append(uncertain.append)
+        emulator.ack_latency = 0.1
+        acks.write(_frame("LATE"), timeout=0.05)
+        await asyncio.sleep(0.07)
+        second = _frame("SECOND")
+        acks.write(second)
+        await asyncio.sleep(0.2)
+        # the late acknowledgement of the first frame was taken for the second
+        assert acknowledged == []
+        assert uncertain == [second]
+        assert acks.unexpected_acknowledgements == 0
+
+        # an error acknowledgement carries the counter and resolves the doubt
+        emulator.ack_latency = 0.0
+        emulator.data_set_count = 1
+        rejected = UECPFrame(commands=[DataSetSelectCommand(select_data_set_number=2)])
+        emulator.drop_rate = 1.0
+        acks.write(_frame("LOST"), timeout=0.0)
+        await asyncio.sleep(0.01)
+        emulator.drop_rate = 0.0
+        acks.write(rejected)
+        await asyncio.sleep(0.05)
+        acks.write(second)
+        await asyncio.sleep(0.05)
+        assert acknowledged == [rejected, second]
+        assert acks.pending == 0
+
+    emulator_link.run(main())
+
+
+def test_encoder_polls_uncertain_slots(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        encoder.ack_timeout = 0.05
+        emulator.ack_latency = 0.1
+        encoder.state.service(1).ps = "FIRST"
+        encoder.ensure_current()
+        await asyncio.sleep(0.07)
+        # still awaiting the late acknowledgement of the first frame
+        emulator.drop_rate = 1.0
+        encoder.state.service(1).ps = "DROPPED"
+        encoder.ensure_current()
+        await asyncio.sleep(0.01)
+        emulator.drop_rate = 0.0
+        await asyncio.sleep(0.4)
+
+        # not written through, polled and answered with the setting of the device
+        assert AcknowledgementTracker.for_protocol(proto).uncertain_acknowledgements
+        assert encoder.shadow.service(1).ps == "FIRST"
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "FIRST"
+        encoder.close()
+
+    emulator_link.run(main())
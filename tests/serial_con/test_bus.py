@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    ProgrammeServiceNameSetCommand,
+    ResponseCode,
+)
+from uecp.emulator import UECPEncoderEmulator
+from uecp.frame import UECPFrame, UECPFrameDecoder
+from uecp.ip_con.protocol import open_tcp_protocol
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.bus import UECPBus
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.frames: list[UECPFrame] = []
+        self._decoder = UECPFrameDecoder()
+
+    def write(self, data: bytes):
+        frame, remaining_data = self._decoder.decode(data)
+        assert frame is not None and len(remaining_data) == 0
+        self.frames.append(frame)
+
+    def is_closing(self) -> bool:
+        return False
+
+
+def ack(proto: UECPSerialProtocol, site_address: int, encoder_address: int):
+    proto.data_received(
+        UECPFrame(
+            site_address=site_address,
+            encoder_address=encoder_address,
+            commands=[MessageAcknowledgementCommand(code=ResponseCode.OK)],
+        ).encode()
+    )
+
+
+def create_bus(ack_timeout: float = 1.0):
+    proto = UECPSerialProtocol()
+    transport = RecordingTransport()
+    proto.connection_made(transport)
+    return proto, transport, UECPBus(proto, ack_timeout=ack_timeout)
+
+
+def test_routing_by_address():
+    async def main():
+        proto, _, bus = create_bus()
+        first = bus.add_device(1, 1)
+        second = bus.add_device(1, 2)
+        first_received, second_received = [], []
+        first.subscribe(DataSetSelectCommand, first_received.append)
+        second.received_frame_callbacks.append(second_received.append)
+
+        proto.data_received(
+            UECPFrame(
+                site_address=1,
+                encoder_address=2,
+                commands=[DataSetSelectCommand(select_data_set_number=4)],
+            ).encode()
+        )
+        proto.data_received(UECPFrame(site_address=1, encoder_address=3).encode())
+
+        assert first_received == []
+        assert len(second_received) == 1
+        assert bus.unrouted_frames == 1
+
+        with pytest.raises(ValueError):
+            bus.add_device(1, 2)
+
+    asyncio.run(main())
+
+
+def test_round_robin_with_sequence_counter_per_device():
+    async def main():
+        proto, transport, bus = create_bus()
+        first = bus.add_device(1, 1, expect_ack=False)
+        second = bus.add_device(1, 2, expect_ack=False)
+        futures = [first.send(UECPFrame()) for _ in range(3)]
+        futures += [second.send(UECPFrame()) for _ in range(3)]
+
+        bus.start()
+        await asyncio.gather(*futures)
+        await bus.stop()
+
+        assert [
+            (frame.encoder_address, frame.sequence_counter)
+            for frame in transport.frames
+        ] == [(1, 1), (2, 1), (1, 2), (2, 2), (1, 3), (2, 3)]
+
+    asyncio.run(main())
+
+
+def test_slow_device_does_not_block_others():
+    async def main():
+        proto, transport, bus = create_bus(ack_timeout=0.2)
+        slow = bus.add_device(1, 1)
+        fast = bus.add_device(1, 2)
+        slow_futures = [slow.send(UECPFrame()) for _ in range(2)]
+        fast_futures = [fast.send(UECPFrame()) for _ in range(3)]
+
+        def fast_ack(frame: UECPFrame):
+            if frame.encoder_address == 2:
+                asyncio.get_running_loop().call_soon(ack, proto, 1, 2)
+
+        original_write = transport.write
+
+        def write(data: bytes):
+            original_write(data)
+            fast_ack(transport.frames[-1])
+
+        transport.write = write
+
+        bus.start()
+        results = await asyncio.gather(*fast_futures)
+        assert all(result is not None for result in results)
+        assert [frame.encoder_address for frame in transport.frames] == [1, 2, 2, 2]
+        assert slow.in_flight is not None
+        assert slow.queue_depth == 1
+
+        with pytest.raises(TimeoutError):
+            await slow_futures[0]
+        ack(proto, 1, 1)
+        assert await slow_futures[1] is not None
+        await bus.stop()
+
+    asyncio.run(main())
+
+
+def test_queue_depth_metrics():
+    async def main():
+        _, _, bus = create_bus()
+        device = bus.add_device(1, 1)
+        device.send(UECPFrame())
+        device.send(UECPFrame())
+        metrics = {
+            (metric.name, metric.labels.get("encoder")): metric.value
+            for metric in bus.collect_metrics()
+        }
+        assert metrics[("uecp_bus_queue_depth", "1")] == 2
+        assert metrics[("uecp_bus_in_flight", "1")] == 0
+        assert metrics[("uecp_bus_unrouted_frames_total", None)] == 0
+        device.clear()
+
+    asyncio.run(main())
+
+
+def test_shared_with_encoder():
+    async def main():
+        emulator = UECPEncoderEmulator(site_address=1, encoder_address=1)
+        proto = await open_tcp_protocol("127.0.0.1", await emulator.start_tcp())
+        try:
+            encoder = await GenericRDSEncoder.create_from_protocol(proto)
+            bus = UECPBus(proto)
+            device = bus.add_device(1, 1)
+            bus.start()
+            emulator.ack_latency = 0.02
+            emulator.data_set_count = 1
+
+            # rejected by the device, the frame sent by the bus is accepted
+            encoder.state.active_data_set = 2
+            encoder.ensure_current()
+            sent = device.send(
+                UECPFrame(commands=[ProgrammeServiceNameSetCommand(ps="BUS")])
+            )
+            assert await asyncio.wait_for(sent, 1) is ResponseCode.OK
+            await asyncio.sleep(0.02)
+
+            assert encoder.shadow.active_data_set == 1
+            # acknowledged through the shared tracker, written through as well
+            assert encoder.shadow.service(1).ps == "BUS"
+            acks = AcknowledgementTracker.for_protocol(proto)
+            assert acks.pending == 0
+            assert acks.unexpected_acknowledgements == 0
+
+            await bus.stop()
+            bus.close()
+            encoder.close()
+        finally:
+            proto.transport.close()
+            await emulator.close()
+
+    asyncio.run(main())
@@ -0,0 +1,474 @@
+import asyncio
+
+import pytest
+
+from tests.serial_con.helpers import full_state
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    ProgrammeServiceNameSetCommand,
+    RadioTextSetCommand,
+    RDSEnabledSetCommand,
+    RDSLevelSetCommand,
+    RealTimeClockEnabledSetCommand,
+    ResponseCode,
+)
+from uecp.frame import UECPFrame
+from uecp.ip_con.protocol import open_tcp_protocol, start_tcp_server
+from uecp.serial_con.device import (
+    EncoderRejectedError,
+    GenericRDSEncoder,
+    GenericRDSEncoderState,
+    SlotStatus,
+    query_devices,
+)
+from uecp.serial_con.state import ProgrammeServiceState
+
+
+def test_deprecated_frame_callbacks():
+    state = full_state()
+    with pytest.deprecated_call():
+        state.receive_frame_callback(
+            UECPFrame(
+                commands=[
+                    MessageAcknowledgementCommand(ResponseCode.OK),
+                    ProgrammeServiceNameSetCommand(ps="OLD API", data_set_number=1),
+                ]
+            )
+        )
+    assert state.service(1).ps == "OLD API"
+    with pytest.deprecated_call():
+        state.receive_rds_enabled_callback(RDSEnabledSetCommand(enable=False))
+    assert not state.rds_enabled
+
+
+def test_compare_and_generate_only_changed_slots():
+    current = full_state()
+    target = full_state(active_data_set=2)
+    target.service(2).ps = "OTHER"
+    target.service(2).rt = "NEW TEXT\r"
+
+    (frame,) = GenericRDSEncoderState.compare_and_generate(current, target)
+    assert [type(command) for command in frame.commands] == [
+        ProgrammeServiceNameSetCommand,
+        RadioTextSetCommand,
+        DataSetSelectCommand,
+    ]
+    assert frame.commands[0].data_set_number == 2
+    assert GenericRDSEncoderState.compare_and_generate(target, target) == []
+
+
+def test_unknown_slots_not_generated():
+    current = full_state()
+    target = GenericRDSEncoderState(active_data_set=1, rds_level=2000)
+    (frame,) = GenericRDSEncoderState.compare_and_generate(current, target)
+    assert [type(command) for command in frame.commands] == [RDSLevelSetCommand]
+
+
+def test_apply_resolves_data_set_number():
+    state = GenericRDSEncoderState(active_data_set=3)
+    state.apply(ProgrammeServiceNameSetCommand(ps="CURRENT", data_set_number=0))
+    assert state.services[(3, 0)].ps == "CURRENT"
+    state.service(5)
+    state.apply(ProgrammeServiceNameSetCommand(ps="ALL", data_set_number=0xFF))
+    assert {key: s.ps for key, s in state.services.items()} == {
+        (3, 0): "ALL",
+        (5, 0): "ALL",
+    }
+    state.apply(ProgrammeServiceNameSetCommand(ps="OTHERS", data_set_number=0xFE))
+    assert state.services[(3, 0)].ps == "ALL"
+    assert state.services[(5, 0)].ps == "OTHERS"
+    assert state.apply(DataSetSelectCommand(select_data_set_number=5))
+    assert state.active_data_set == 5
+
+
+def test_full_state_against_emulator(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        acks: asyncio.Queue = asyncio.Queue()
+        proto.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+
+        target = full_state(active_data_set=2)
+        encoder.state = target
+        frames = GenericRDSEncoderState.compare_and_generate(encoder._current, target)
+        encoder.ensure_current()
+        for _ in frames:
+            await asyncio.wait_for(acks.get(), 1)
+        assert emulator.active_data_set == 2
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "RADIO 1"
+
+        # polling every known slot brings the current state up to date
+        encoder._current.services = {
+            key: ProgrammeServiceState() for key in target.services
+        }
+        encoder._current.services[(1, 0)].ps = ""
+        encoder.poll(full=True)
+        await asyncio.sleep(0.1)
+        assert encoder._current.services[(1, 0)].ps == "RADIO 1"
+
+    emulator_link.run(main())
+
+
+def test_dirty_slots():
+    state = full_state()
+    assert state.dirty_slots is None
+    state.clear_dirty()
+    assert state.dirty_slots == frozenset()
+
+    state.rds_level = 2000
+    state.service(2).ps = "OTHER"
+    assert state.dirty_slots == {
+        (RDSLevelSetCommand.ELEMENT_CODE, None, None),
+        (ProgrammeServiceNameSetCommand.ELEMENT_CODE, 2, 0),
+    }
+
+    state.clear_dirty()
+    state.services = {}
+    assert state.dirty_slots is None
+
+
+class Protocol:
+    connected = True
+
+    def __init__(self):
+        self.frames = []
+        self.received_frame_callbacks = []
+
+    def subscribe(self, command_type, callback):
+        pass
+
+    def unsubscribe(self, command_type, callback):
+        pass
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+
+def test_ensure_current_visits_only_dirty_slots(monkeypatch):
+    protocol = Protocol()
+    encoder = GenericRDSEncoder(protocol, full_state())
+    encoder.ensure_current()
+    assert protocol.frames == []
+
+    def no_full_compare(self):
+        raise AssertionError("Full compare")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(GenericRDSEncoderState, "slots", no_full_compare)
+        encoder.state.service(1).ps = "OTHER"
+        encoder.state.service(2).ps = "RADIO 2"
+        encoder.ensure_current()
+        (frame,) = protocol.frames
+        assert [(type(c), c.data_set_number) for c in frame.commands] == [
+            (ProgrammeServiceNameSetCommand, 1)
+        ]
+        # sent slots are not visited again until changed or resynced
+        encoder.ensure_current()
+        assert len(protocol.frames) == 1
+        # the device reporting a deviating value brings it back
+        encoder._current.apply(
+            ProgrammeServiceNameSetCommand(ps="DEVICE", data_set_number=2)
+        )
+        encoder.ensure_current()
+        assert protocol.frames[-1].commands[0].ps == "RADIO 2"
+
+    protocol.frames.clear()
+    encoder.resync()
+    assert protocol.frames
+    protocol.frames.clear()
+    encoder.ensure_current()
+    # a full compare sends PS 1, not yet confirmed by the device
+    (frame,) = protocol.frames
+    assert [c.ps for c in frame.commands] == ["OTHER", "RADIO 2"]
+
+
+def test_state_shared_by_encoders():
+    protocols = Protocol(), Protocol()
+    encoders = [GenericRDSEncoder(protocol, full_state()) for protocol in protocols]
+    state = full_state()
+    state.service(1).ps = "SHARED"
+    for encoder in encoders:
+        encoder.state = state
+    assert encoders[0].state is not encoders[1].state
+
+    # sending by one encoder leaves the other one's target dirty
+    encoders[0].ensure_current()
+    encoders[1].ensure_current()
+    assert [
+        [command.ps for frame in protocol.frames for command in frame.commands]
+        for protocol in protocols
+    ] == [["SHARED"], ["SHARED"]]
+
+    encoders[0].state.service(1).ps = "FIRST"
+    state.service(1).ps = "IGNORED"
+    assert encoders[1].state.service(1).ps == "SHARED"
+    encoders[0].close()
+    encoders[1].state.service(1).ps = "SECOND"
+    encoders[1].ensure_current()
+    assert protocols[1].frames[-1].commands[0].ps == "SECOND"
+
+
+async def _reconciling_encoder(proto, **kwargs):
+    encoder = await GenericRDSEncoder.create_from_protocol(proto)
+    encoder.start_reconciler(**kwargs)
+    return encoder
+
+
+async def _close(encoder):
+    await encoder.stop_reconciler()
+    encoder.close()
+
+
+def test_reconciler_debounces_bursts(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await _reconciling_encoder(proto, debounce=0.05)
+        frames_before = emulator.frames_received
+        for n in range(20):
+            encoder.state.service(1).rt = f"UPDATE {n}\r"
+        await asyncio.sleep(0.2)
+        assert emulator.frames_received == frames_before + 1
+        assert emulator.get(RadioTextSetCommand, 1, 0).text == "UPDATE 19\r"
+        await _close(encoder)
+
+    emulator_link.run(main())
+
+
+def test_reconciler_rate_limit(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await _reconciling_encoder(
+            proto, debounce=0, max_frame_rate=20, ack_timeout=None
+        )
+        frames_before = emulator.frames_received
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for n in range(5):
+            encoder.state.service(1).ps = f"PS {n}"
+            # wait for the frame to be sent before the next change
+            while emulator.frames_received < frames_before + n + 1:
+                await asyncio.sleep(0.001)
+        assert loop.time() - start >= 4 / 20
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "PS 4"
+        await _close(encoder)
+
+    emulator_link.run(main())
+
+
+def test_reconciler_resends_unacknowledged_frames(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await _reconciling_encoder(proto, debounce=0, ack_timeout=0.05)
+        emulator.drop_rate = 1.0
+        encoder.state = full_state()
+        await asyncio.sleep(0.2)
+        assert emulator.get(ProgrammeServiceNameSetCommand, 2, 0) is None
+        emulator.drop_rate = 0.0
+        await asyncio.sleep(0.3)
+        assert emulator.get(ProgrammeServiceNameSetCommand, 2, 0).ps == "RADIO 2"
+        assert emulator.get(RadioTextSetCommand, 1, 0).text == "DATA SET 1\r"
+        await _close(encoder)
+
+    emulator_link.run(main())
+
+
+def test_shadow_state_write_through(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        acks: asyncio.Queue = asyncio.Queue()
+        proto.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+
+        encoder.state.service(1).ps = "RADIO"
+        encoder.state.rds_level = 500
+        encoder.ensure_current()
+        await asyncio.wait_for(acks.get(), 1)
+        assert encoder.shadow.service(1).ps == "RADIO"
+        assert encoder.shadow.rds_level == 500
+
+        # everything is confirmed, nothing to poll
+        frames_received = emulator.frames_received
+        encoder.poll()
+        await asyncio.sleep(0.05)
+        assert emulator.frames_received == frames_received
+
+        encoder.confidence_period = 0
+        encoder.poll()
+        await asyncio.wait_for(acks.get(), 1)
+        assert emulator.frames_received == frames_received + 1
+
+        # rejected frames are not written through
+        emulator.error_rate = 1.0
+        encoder.state.service(1).ps = "OTHER"
+        encoder.ensure_current()
+        await asyncio.wait_for(acks.get(), 1)
+        assert encoder.shadow.service(1).ps == "RADIO"
+
+        encoder.close()
+
+    emulator_link.run(main())
+
+
+def test_expired_slots():
+    state = GenericRDSEncoderState(active_data_set=1)
+    state.apply(ProgrammeServiceNameSetCommand(ps="RADIO", data_set_number=1))
+    ps_key = (ProgrammeServiceNameSetCommand.ELEMENT_CODE, 1, 0)
+    confirmed = state.confirmed_at[ps_key]
+    assert state.expired_slots(10, now=confirmed + 5) == {
+        (DataSetSelectCommand.ELEMENT_CODE, None, None),
+        (RDSEnabledSetCommand.ELEMENT_CODE, None, None),
+    }
+    assert ps_key in state.expired_slots(10, now=confirmed + 11)
+
+
+def test_query_device_partial_results(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        for command in full_state().slots().values():
+            emulator.store(command)
+        result = await GenericRDSEncoderState.query_device(proto, timeout=1)
+        # all requests batched into one frame
+        assert emulator.frames_received == 1
+        assert not result.complete
+        assert result.status[(RDSLevelSetCommand.ELEMENT_CODE, None, None)] is (
+            SlotStatus.ANSWERED
+        )
+        assert result.status[
+            (RealTimeClockEnabledSetCommand.ELEMENT_CODE, None, None)
+        ] is (SlotStatus.UNANSWERED)
+        assert result.state.rds_level == 1000
+        assert result.state.service(1).ps == "RADIO 1"
+
+        emulator.error_rate = 1.0
+        result = await GenericRDSEncoderState.query_device(proto, timeout=1)
+        assert result.state is None
+        assert set(result.status.values()) == {SlotStatus.REJECTED}
+
+    emulator_link.run(main())
+
+
+def test_query_device_alongside_encoder(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        emulator.ack_latency = 0.02
+        emulator.data_set_count = 1
+        # the rejection of the encoder's frame is not taken for the query's
+        encoder.state.active_data_set = 2
+        encoder.ensure_current()
+        result = await GenericRDSEncoderState.query_device(proto, timeout=1)
+        assert SlotStatus.REJECTED not in result.status.values()
+        assert result.state.active_data_set == 1
+        await asyncio.sleep(0.05)
+        assert encoder.shadow.active_data_set == 1
+        encoder.close()
+
+    emulator_link.run(main())
+
+
+def test_query_devices_with_dead_device(emulator_link):
+    async def main():
+        silent = await start_tcp_server("127.0.0.1", 0, lambda protocol: None)
+        dead = await open_tcp_protocol("127.0.0.1", silent.sockets[0].getsockname()[1])
+        protocols = {"live": emulator_link.protocol, "dead": dead}
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await query_devices(protocols, concurrency=2, timeout=0.3)
+            assert loop.time() - started < 1
+            assert results["live"].state.active_data_set == 1
+            assert results["dead"].state is None
+            assert set(results["dead"].status.values()) == {SlotStatus.TIMEOUT}
+
+            with pytest.raises(TimeoutError):
+                await GenericRDSEncoderState.init_from_device(dead, 0.1)
+        finally:
+            dead.transport.close()
+            silent.close()
+
+    emulator_link.run(main())
+
+
+def test_double_buffered_programme_switch(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    def programme(name):
+        return {0: ProgrammeServiceState(pi=0xD3C2, ps=name, pty=1, rt=f"{name}\r")}
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        encoder.data_set_numbers = range(1, 4)
+
+        assert await encoder.stage_programme("news", programme("NEWS")) == 2
+        assert emulator.active_data_set == 1
+        assert emulator.get(ProgrammeServiceNameSetCommand, 2, 0).ps == "NEWS"
+
+        frames_received = emulator.frames_received
+        await encoder.switch_programme("news")
+        assert emulator.frames_received == frames_received + 1
+        assert emulator.active_data_set == 2
+        assert encoder.shadow.active_data_set == 2
+
+        assert await encoder.stage_programme("music", programme("MUSIC")) == 1
+        await encoder.switch_programme("music")
+        # switching back needs no staging, the data set is kept
+        frames_received = emulator.frames_received
+        await encoder.switch_programme("news")
+        assert emulator.frames_received == frames_received + 1
+        assert emulator.active_data_set == 2
+        assert await encoder.stage_programme("music", programme("MUSIC")) == 1
+        assert emulator.frames_received == frames_received + 1
+
+        # the least recently used programme not on air gives up its data set
+        assert await encoder.stage_programme("sport", programme("SPORT")) == 3
+        assert await encoder.stage_programme("talk", programme("TALK")) == 1
+        assert encoder.programmes == {"news": 2, "sport": 3, "talk": 1}
+
+        # an on air programme is staged into another data set
+        assert await encoder.stage_programme("news", programme("NEWS 2")) == 3
+        assert emulator.get(ProgrammeServiceNameSetCommand, 2, 0).ps == "NEWS"
+
+        emulator.error_rate = 1.0
+        with pytest.raises(EncoderRejectedError):
+            await encoder.switch_programme("talk")
+
+        encoder.close()
+
+    emulator_link.run(main())
+
+
+def test_programme_switch_while_reconciling(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+    programme = {0: ProgrammeServiceState(pi=0xD3C2, ps="NEWS", rt="NEWS\r")}
+
+    async def main():
+        encoder = await _reconciling_encoder(proto, debounce=0.01)
+        # the reconciler wakes up while the staging awaits acknowledgements
+        emulator.ack_latency = 0.05
+        frames_received = emulator.frames_received
+        assert await encoder.stage_programme("news", programme) == 2
+        await encoder.switch_programme("news")
+        # a frame with the programme and the data set select, nothing sent
+        # again by the reconciler
+        await asyncio.sleep(0.1)
+        assert emulator.frames_received == frames_received + 2
+        assert emulator.active_data_set == 2
+        assert emulator.get(ProgrammeServiceNameSetCommand, 2, 0).ps == "NEWS"
+
+        # changes next to a staging are still reconciled
+        encoder.state.service(2).rt = "ON AIR\r"
+        assert await encoder.stage_programme("news", programme) == 1
+        await asyncio.sleep(0.1)
+        assert emulator.get(RadioTextSetCommand, 2, 0).text == "ON AIR\r"
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "NEWS"
+        await _close(encoder)
+
+    emulator_link.run(main())
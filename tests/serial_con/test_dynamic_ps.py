@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from uecp.commands import (
+    InvalidProgrammeServiceName,
+    ProgrammeServiceNameSetCommand,
+    RDSLevelSetCommand,
+)
+from uecp.frame import UECPFrameDecoder
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.dynamic_ps import DynamicPSEngine, SegmentationMode, segment
+
+
+class Protocol:
+    connected = True
+
+    def __init__(self):
+        self.written = []
+        self.received_frame_callbacks = []
+
+    def write_raw(self, data):
+        self.written.append((asyncio.get_running_loop().time(), data))
+
+    @property
+    def ps(self) -> list[str]:
+        return [
+            UECPFrameDecoder().decode(data)[0].commands[0].ps
+            for _, data in self.written
+        ]
+
+
+def test_segment():
+    assert segment("NOW PLAYING  EXTRAORDINARILY", SegmentationMode.WORD) == [
+        "  NOW   ",
+        "PLAYING ",
+        "EXTRAORD",
+        "INARILY ",
+    ]
+    scrolled = segment("RADIO ONE", SegmentationMode.SCROLL)
+    assert scrolled[0] == " " * 8
+    assert scrolled[8] == "RADIO ON"
+    assert scrolled[-1] == " " * 8
+    assert len(scrolled) == 9 + 8 + 1
+    assert segment("RADIO ONE", SegmentationMode.SCROLL, step=3)[1] == "     RAD"
+    assert segment("", SegmentationMode.WORD) == [""]
+    with pytest.raises(ValueError):
+        segment("RADIO", SegmentationMode.SCROLL, step=0)
+
+
+def test_sequence_and_replacement():
+    protocol = Protocol()
+    engine = DynamicPSEngine(protocol, data_set_number=1)
+
+    async def main():
+        engine.start("ONE TWO THREE", interval=0.05)
+        assert engine.running
+        await asyncio.sleep(0.175)
+        # replaced before the next tick, nothing of the old text follows
+        engine.start("FOUR FIVE", interval=0.05, repeat=False)
+        await asyncio.sleep(0.2)
+        assert not engine.running
+
+    asyncio.run(main())
+    assert [ps.strip() for ps in protocol.ps] == [
+        "ONE",
+        "TWO",
+        "THREE",
+        "ONE",
+        "FOUR",
+        "FIVE",
+    ]
+    assert engine.frames_sent == 6
+
+
+def test_ticks_keep_schedule():
+    protocol = Protocol()
+    engine = DynamicPSEngine(protocol)
+
+    async def main():
+        engine.start("A B C D", mode=SegmentationMode.WORD, interval=0.05)
+        started = asyncio.get_running_loop().time()
+        await asyncio.sleep(0.02)
+        # block the loop for more than two intervals
+        deadline = asyncio.get_running_loop().time() + 0.17
+        while asyncio.get_running_loop().time() < deadline:
+            pass
+        await asyncio.sleep(0.1)
+        engine.stop()
+        return started
+
+    started = asyncio.run(main())
+    assert not engine.running
+    assert engine.ticks_skipped >= 1
+    # ticks stay on the grid of the start instead of drifting
+    for at, _ in protocol.written[3:]:
+        offset = (at - started) % 0.05
+        assert min(offset, 0.05 - offset) < 0.02
+
+
+def test_invalid_text_keeps_running_sequence():
+    protocol = Protocol()
+    engine = DynamicPSEngine(protocol)
+
+    async def main():
+        engine.start("RADIO", interval=1)
+        with pytest.raises(ValueError):
+            engine.start("RADIO", interval=0)
+        with pytest.raises(InvalidProgrammeServiceName):
+            engine.start("UNICODE ✓", interval=1)
+        assert engine.segments == ("RADIO".center(8),)
+        assert engine.running
+        engine.stop()
+
+    asyncio.run(main())
+
+
+def test_emulator(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        engine = DynamicPSEngine(proto, data_set_number=1)
+        engine.start("HELLO WORLD", interval=0.05, repeat=False)
+        await asyncio.sleep(0.1)
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == " WORLD"
+        assert proto.frames_sent == 2
+
+    emulator_link.run(main())
+
+
+def test_shared_link_with_encoder(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        engine = DynamicPSEngine(proto, data_set_number=1)
+        emulator.ack_latency = 0.02
+        emulator.data_set_count = 1
+
+        engine.start("ONE TWO THREE", interval=0.03, repeat=False)
+        # rejected by the device while the PS frames are acknowledged
+        encoder.state.active_data_set = 2
+        encoder.ensure_current()
+        await asyncio.sleep(0.01)
+        encoder.state.rds_level = 500
+        encoder.ensure_current()
+        await asyncio.sleep(0.15)
+
+        assert engine.frames_sent == 3
+        assert emulator.get(RDSLevelSetCommand).level == 500
+        assert encoder.shadow.active_data_set == 1
+        assert encoder.shadow.rds_level == 500
+        # written through from the acknowledged frames of the engine
+        assert encoder.shadow.service(1).ps.strip() == "THREE"
+        acks = AcknowledgementTracker.for_protocol(proto)
+        assert acks.pending == 0
+        assert acks.unexpected_acknowledgements == 0
+        encoder.close()
+
+    emulator_link.run(main())
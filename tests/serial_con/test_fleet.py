@@ -0,0 +1,138 @@
+import asyncio
+import socket
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    RDSEnabledSetCommand,
+    RealTimeClockSetCommand,
+    RequestCommand,
+    ResponseCode,
+)
+from uecp.frame import UECPFrame
+from uecp.ip_con.protocol import open_tcp_protocol, start_tcp_server
+from uecp.serial_con.device import GenericRDSEncoderState
+from uecp.serial_con.fleet import EncoderFleet, EncoderHealthStatus
+from uecp.serial_con.protocol import UECPSerialProtocol
+
+
+class StandIn:
+    def __init__(self):
+        self.protocols: list[UECPSerialProtocol] = []
+        self.received: list[int] = []
+
+    def client_connected(self, protocol: UECPSerialProtocol):
+        self.protocols.append(protocol)
+        protocol.received_frame_callbacks.append(
+            lambda frame: self.frame_received(protocol, frame)
+        )
+
+    def frame_received(self, protocol: UECPSerialProtocol, frame: UECPFrame):
+        responses = [MessageAcknowledgementCommand(code=ResponseCode.OK)]
+        for cmd in frame.commands:
+            self.received.append(cmd.ELEMENT_CODE)
+            if isinstance(cmd, RequestCommand):
+                if cmd.element_code == DataSetSelectCommand.ELEMENT_CODE:
+                    responses.append(DataSetSelectCommand(select_data_set_number=2))
+                elif cmd.element_code == RDSEnabledSetCommand.ELEMENT_CODE:
+                    responses.append(RDSEnabledSetCommand(enable=True))
+        protocol.write(UECPFrame(commands=responses))
+
+
+async def wait_until(predicate, timeout: float = 2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    assert predicate()
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_fleet():
+    async def main():
+        stand_in = StandIn()
+        server = await start_tcp_server("127.0.0.1", 0, stand_in.client_connected)
+        port = server.sockets[0].getsockname()[1]
+
+        fleet = EncoderFleet(concurrency=2, init_timeout=2, restart_delay=0.05)
+        for i in range(4):
+            fleet.add(
+                f"encoder-{i}",
+                ("tcp", "127.0.0.1", port, i),
+                lambda: open_tcp_protocol("127.0.0.1", port),
+            )
+        fleet.add_tcp("dead", "127.0.0.1", unused_port())
+        await fleet.start()
+
+        health = fleet.health
+        assert health["dead"].status is EncoderHealthStatus.FAILED
+        assert health["dead"].last_error is not None
+        assert all(health[f"encoder-{i}"].healthy for i in range(4))
+        assert len(fleet.encoders) == 4
+        assert fleet.encoders["encoder-0"].state.active_data_set == 2
+
+        stand_in.received.clear()
+        results = await fleet.sync_clock()
+        assert set(results) == {f"encoder-{i}" for i in range(4)}
+        assert all(result is None for result in results.values())
+        await wait_until(
+            lambda: stand_in.received.count(RealTimeClockSetCommand.ELEMENT_CODE) == 4
+        )
+
+        target = GenericRDSEncoderState(active_data_set=5)
+        await fleet.apply_state({"encoder-1": target, "dead": target})
+        await wait_until(
+            lambda: stand_in.received.count(DataSetSelectCommand.ELEMENT_CODE) == 1
+        )
+
+        # server side drop, the fleet reconnects in the background
+        stand_in.protocols[0].transport.close()
+
+        def reconnected() -> bool:
+            health = fleet.health
+            live = [health[f"encoder-{i}"] for i in range(4)]
+            return sum(h.connect_attempts for h in live) == 5 and all(
+                h.healthy for h in live
+            )
+
+        await wait_until(reconnected)
+
+        await fleet.stop()
+        assert all(
+            h.status is EncoderHealthStatus.STOPPED for h in fleet.health.values()
+        )
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_fleet_releases_lost_connections():
+    async def main():
+        stand_in = StandIn()
+        server = await start_tcp_server("127.0.0.1", 0, stand_in.client_connected)
+        port = server.sockets[0].getsockname()[1]
+
+        fleet = EncoderFleet(init_timeout=2, restart_delay=0.05)
+        fleet.add_tcp("encoder", "127.0.0.1", port)
+        await fleet.start()
+        dropped = fleet.encoders["encoder"].protocol
+        callbacks = list(dropped.connection_lost_callbacks)
+        stand_in.protocols[0].transport.close()
+        await wait_until(lambda: fleet.health["encoder"].connect_attempts == 2)
+        await wait_until(lambda: fleet.health["encoder"].healthy)
+        assert len(dropped.connection_lost_callbacks) == len(callbacks) - 1
+
+        stopped = fleet.encoders["encoder"].protocol
+        callbacks = list(stopped.connection_lost_callbacks)
+        await fleet.stop()
+        assert len(stopped.connection_lost_callbacks) == len(callbacks) - 1
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
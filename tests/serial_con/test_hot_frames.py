@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+from uecp.commands import (
+    MessageAcknowledgementCommand,
+    ProgrammeType,
+    ProgrammeTypeSetCommand,
+    TrafficAnnouncementProgrammeSetCommand,
+)
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.hot_frames import HotFrameRegistry
+from uecp.serial_con.state import ProgrammeServiceState
+
+
+def test_registry(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        acks: asyncio.Queue = asyncio.Queue()
+        proto.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+
+        hot = HotFrameRegistry(proto)
+        fired = []
+        hot.fired_callbacks.append(fired.append)
+        hot.arm(
+            "ta_on",
+            [TrafficAnnouncementProgrammeSetCommand(announcement=True, programme=True)],
+        )
+        assert "ta_on" in hot
+
+        latency = hot.fire("ta_on", triggered_at=time.perf_counter() - 0.5)
+        await asyncio.wait_for(acks.get(), 1)
+        assert latency >= 0.5
+        assert emulator.get(TrafficAnnouncementProgrammeSetCommand, 1, 0).announcement
+        assert len(fired) == 1
+        assert proto.frames_sent == 1
+        assert hot.latency.snapshot().count == 1
+        metrics = {metric.name: metric.value for metric in hot.collect_metrics()}
+        assert metrics["uecp_hot_frames_fired_total"] == 1
+
+        hot.disarm("ta_on")
+        with pytest.raises(KeyError):
+            hot.fire("ta_on")
+
+    emulator_link.run(main())
+
+
+def test_encoder_hot_frames_bypass_reconciler(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        encoder = await GenericRDSEncoder.create_from_protocol(proto)
+        encoder.state.services[(1, 0)] = ProgrammeServiceState(
+            ps="RADIO", pty=ProgrammeType.NEWS, ta=False, tp=True
+        )
+        ta_on, ta_off = encoder.arm_traffic_announcement(1)
+        alarm_on, alarm_off = encoder.arm_alarm(1)
+        # the reconciler holds back changes for a long time
+        encoder.start_reconciler(debounce=10)
+
+        encoder.fire(ta_on)
+        encoder.fire(alarm_on)
+        await asyncio.sleep(0.05)
+        assert emulator.get(TrafficAnnouncementProgrammeSetCommand, 1, 0).announcement
+        assert emulator.get(ProgrammeTypeSetCommand, 1, 0).programme_type is (
+            ProgrammeType.ALARM
+        )
+        # fired settings are taken over by target and, once acknowledged, shadow
+        assert encoder.state.service(1).ta
+        assert encoder.shadow.service(1).ta
+        assert encoder.shadow.service(1).pty is ProgrammeType.ALARM
+
+        encoder.fire(alarm_off)
+        encoder.fire(ta_off)
+        await asyncio.sleep(0.05)
+        assert emulator.get(ProgrammeTypeSetCommand, 1, 0).programme_type is (
+            ProgrammeType.NEWS
+        )
+        assert not encoder.state.service(1).ta
+        assert encoder.hot_frames.frames_fired == 4
+
+        await encoder.stop_reconciler()
+        encoder.close()
+
+    emulator_link.run(main())
@@ -0,0 +1,171 @@
+import pytest
+
+from uecp.capture import CaptureReader, CaptureWriter, Direction
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    RDSEnabledSetCommand,
+    ResponseCode,
+)
+from uecp.frame import UECPAddressFilter, UECPFrame
+from uecp.serial_con.protocol import UECPSerialProtocol
+from uecp.wire_trace import WireTrace
+
+
+class TestSubscribe:
+    def test_dispatch_by_type(self):
+        proto = UECPSerialProtocol()
+        acks = []
+        data_sets = []
+        proto.subscribe(MessageAcknowledgementCommand, acks.append)
+        proto.subscribe(DataSetSelectCommand, data_sets.append)
+
+        proto.data_received(
+            bytes.fromhex("fe 00 00 c5 02 18 00 1a b4 ff fe 00 00 c6 02 1c 02 6d ee ff")
+        )
+
+        assert len(acks) == 1
+        assert acks[0].code is ResponseCode.OK
+        assert len(data_sets) == 1
+        assert data_sets[0].select_data_set_number == 2
+
+    def test_frame_with_multiple_commands(self):
+        proto = UECPSerialProtocol()
+        received = []
+        proto.subscribe(RDSEnabledSetCommand, received.append)
+        frame = UECPFrame(
+            commands=[
+                DataSetSelectCommand(select_data_set_number=3),
+                RDSEnabledSetCommand(enable=False),
+                RDSEnabledSetCommand(enable=True),
+            ]
+        )
+
+        proto.data_received(frame.encode())
+
+        assert [cmd.enable for cmd in received] == [False, True]
+
+    def test_unsubscribe(self):
+        proto = UECPSerialProtocol()
+        received = []
+        proto.subscribe(DataSetSelectCommand, received.append)
+        proto.unsubscribe(DataSetSelectCommand, received.append)
+
+        proto.data_received(bytes.fromhex("FE00002B021C02D082FF"))
+        assert received == []
+
+        with pytest.raises(ValueError):
+            proto.unsubscribe(DataSetSelectCommand, received.append)
+
+    def test_unsubscribe_within_handler(self):
+        proto = UECPSerialProtocol()
+        received = []
+
+        def handler(cmd):
+            received.append(cmd)
+            proto.unsubscribe(DataSetSelectCommand, handler)
+
+        proto.subscribe(DataSetSelectCommand, handler)
+        proto.data_received(bytes.fromhex("FE00002B021C02D082FF" * 2))
+        assert len(received) == 1
+
+
+class TestAddressFilter:
+    def test_foreign_frames_not_dispatched(self):
+        proto = UECPSerialProtocol(
+            address_filter=UECPAddressFilter(site_addresses={1}, encoder_addresses={7})
+        )
+        received = []
+        proto.received_frame_callbacks.append(received.append)
+
+        data = b"".join(
+            UECPFrame(site_address=1, encoder_address=encoder_address).encode()
+            for encoder_address in (6, 7, UECPFrame.ALL_ENCODERS)
+        )
+        proto.data_received(data)
+
+        assert [frame.encoder_address for frame in received] == [
+            7,
+            UECPFrame.ALL_ENCODERS,
+        ]
+        assert proto.filtered_frames == 1
+
+
+class TestCapture:
+    def test_rx_and_tx_recorded(self, tmp_path):
+        class Transport:
+            def __init__(self):
+                self.written = []
+
+            def write(self, data):
+                self.written.append(data)
+
+        path = tmp_path / "link.cap"
+        proto = UECPSerialProtocol()
+        proto._transport = Transport()
+        received = bytes.fromhex("FE00002B021C02D082FF")
+        with CaptureWriter(path) as writer:
+            proto.capture_writer = writer
+            proto.data_received(received)
+            proto.write(UECPFrame(commands=[RDSEnabledSetCommand(enable=True)]))
+
+        with CaptureReader(path) as reader:
+            records = list(reader)
+        assert [record.direction for record in records] == [Direction.RX, Direction.TX]
+        assert records[0].data == received
+        assert records[1].data == proto._transport.written[0]
+
+
+class TestMetrics:
+    def test_counters_and_histograms(self):
+        class Transport:
+            def write(self, data):
+                pass
+
+            def get_write_buffer_size(self):
+                return 42
+
+        proto = UECPSerialProtocol()
+        proto._transport = Transport()
+        received = bytes.fromhex("FE00002B021C02D082FF")
+        proto.data_received(received * 2)
+        proto.write(UECPFrame(commands=[RDSEnabledSetCommand(enable=True)]))
+        with pytest.raises(ValueError, match="CRC error"):
+            proto.data_received(bytes.fromhex("FE00002B021C02D083FF"))
+
+        metrics = {metric.name: metric.value for metric in proto.collect_metrics()}
+        assert metrics["uecp_bytes_received_total"] == 3 * len(received)
+        assert metrics["uecp_frames_decoded_total"] == 2
+        assert metrics["uecp_frames_sent_total"] == 1
+        assert metrics["uecp_bytes_sent_total"] == proto.bytes_sent > 0
+        assert metrics["uecp_crc_errors_total"] == 1
+        assert metrics["uecp_write_buffer_bytes"] == 42
+        assert metrics["uecp_decode_seconds"].count == 2
+        assert metrics["uecp_callback_seconds"].count == 2
+
+
+class TestWireTrace:
+    def test_dumped_on_decode_error(self, caplog):
+        class Transport:
+            def write(self, data):
+                pass
+
+        proto = UECPSerialProtocol()
+        proto._transport = Transport()
+        proto.wire_trace = WireTrace()
+        proto.write(UECPFrame(commands=[RDSEnabledSetCommand(enable=True)]))
+        received = bytes.fromhex("FE00002B021C02D083FF")
+        with pytest.raises(ValueError):
+            proto.data_received(received)
+
+        assert [entry[1:] for entry in proto.wire_trace.entries()][1] == (
+            Direction.RX,
+            received,
+        )
+        assert received.hex(" ") in caplog.text
+        assert "Handling received data failed" in caplog.text
+
+    def test_not_recorded_without_trace(self, caplog):
+        proto = UECPSerialProtocol()
+        proto.data_received(bytes.fromhex("FE00002B021C02D082FF"))
+        assert caplog.text == ""
@@ -0,0 +1,261 @@
+import asyncio
+
+import pytest
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    ProgrammeServiceNameSetCommand,
+    ProgrammeType,
+    ProgrammeTypeSetCommand,
+    RadioTextBufferConfiguration,
+    RadioTextSetCommand,
+    RequestCommand,
+    ResponseCode,
+    TrafficAnnouncementProgrammeSetCommand,
+    UECPCommand,
+)
+from uecp.frame import UECPFrameDecoder
+from uecp.serial_con.acks import AcknowledgementTracker
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.scheduler import Priority, SendScheduler, classify
+
+
+class Protocol:
+    connected = True
+
+    def __init__(self):
+        self.data = []
+        self.received_frame_callbacks = []
+        self.connection_made_callbacks = []
+
+    def write_raw(self, data):
+        self.data.append(data)
+
+    @property
+    def frames(self):
+        return [UECPFrameDecoder().decode(data)[0] for data in self.data]
+
+    @property
+    def commands(self) -> list[UECPCommand]:
+        return [command for frame in self.frames for command in frame.commands]
+
+
+def _rt(text, dsn=1, **kwargs):
+    return RadioTextSetCommand(
+        text=text, data_set_number=dsn, programme_service_number=0, **kwargs
+    )
+
+
+def test_classify():
+    assert classify(TrafficAnnouncementProgrammeSetCommand()) is Priority.ALARM
+    assert (
+        classify(ProgrammeTypeSetCommand(programme_type=ProgrammeType.ALARM))
+        is Priority.ALARM
+    )
+    assert (
+        classify(ProgrammeTypeSetCommand(programme_type=ProgrammeType.NEWS))
+        is Priority.CONTENT
+    )
+    assert classify(DataSetSelectCommand(select_data_set_number=1)) is (
+        Priority.CONTROL
+    )
+    assert classify(_rt("TEXT")) is Priority.CONTENT
+    assert classify(RequestCommand(command=DataSetSelectCommand)) is Priority.POLL
+
+
+def test_supersession():
+    protocol = Protocol()
+    scheduler = SendScheduler(protocol)
+    scheduler.submit(_rt("FIRST"), _rt("OTHER SET", dsn=2))
+    scheduler.submit(_rt("SECOND"))
+    # appended texts add to the buffer, nothing is replaced
+    scheduler.submit(
+        _rt("APPENDED", buffer_configuration=RadioTextBufferConfiguration.APPEND),
+        _rt("APPENDED", buffer_configuration=RadioTextBufferConfiguration.APPEND),
+    )
+    assert scheduler.queue_depth() == 4
+    assert scheduler.commands_superseded == 1
+
+    # moved to a higher class when resubmitted with it
+    scheduler.submit(_rt("URGENT", dsn=2), priority=Priority.ALARM)
+    assert scheduler.queue_depth(Priority.ALARM) == 1
+    assert scheduler.queue_depth(Priority.CONTENT) == 3
+
+    async def main():
+        scheduler.start()
+        await asyncio.sleep(0.01)
+        await scheduler.stop()
+
+    asyncio.run(main())
+    texts = [command.radiotext.text.rstrip("\r") for command in protocol.commands]
+    assert texts == ["URGENT", "SECOND", "APPENDED", "APPENDED"]
+    assert scheduler.frames_sent == 2
+    assert scheduler.queue_depth() == 0
+
+
+def test_priority_on_slow_link():
+    protocol = Protocol()
+    # a frame of three radio texts takes about 0.2 s
+    scheduler = SendScheduler(protocol, baudrate=9600)
+
+    async def main():
+        scheduler.start()
+        for psn in range(40):
+            scheduler.submit(
+                RadioTextSetCommand(
+                    text=f"SONG {psn}".ljust(64),
+                    data_set_number=1,
+                    programme_service_number=psn,
+                )
+            )
+        await asyncio.sleep(0.05)
+        scheduler.submit(TrafficAnnouncementProgrammeSetCommand(announcement=True))
+        await asyncio.sleep(0.25)
+        await scheduler.stop()
+
+    asyncio.run(main())
+    frames = protocol.frames
+    # the announcement overtakes the queued radio texts
+    assert isinstance(frames[1].commands[0], TrafficAnnouncementProgrammeSetCommand)
+    radio_texts = len(frames[0].commands) + sum(
+        len(frame.commands) for frame in frames[2:]
+    )
+    metrics = {
+        (metric.name, metric.labels.get("priority")): metric.value
+        for metric in scheduler.collect_metrics()
+    }
+    assert metrics[("uecp_scheduler_frames_sent_total", None)] == len(frames)
+    assert metrics[("uecp_scheduler_queue_depth", "content")] == 40 - radio_texts
+
+
+def test_acknowledged_sending(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        emulator.ack_latency = 0.05
+        acks = []
+        proto.subscribe(MessageAcknowledgementCommand, acks.append)
+
+        scheduler = SendScheduler(proto, ack_timeout=1)
+        scheduler.start()
+        scheduler.submit(ProgrammeServiceNameSetCommand(ps="FIRST", data_set_number=1))
+        await asyncio.sleep(0.01)
+        # the first frame waits for its acknowledgement, these are merged
+        scheduler.submit(ProgrammeServiceNameSetCommand(ps="SECOND", data_set_number=1))
+        scheduler.submit(ProgrammeServiceNameSetCommand(ps="THIRD", data_set_number=1))
+        await asyncio.sleep(0.2)
+
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "THIRD"
+        assert scheduler.frames_sent == 2
+        assert len(acks) == 2
+
+        await scheduler.stop()
+        scheduler.close()
+
+    emulator_link.run(main())
+
+
+def test_send(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        emulator.ack_latency = 0.02
+        emulator.data_set_count = 1
+        scheduler = SendScheduler(proto, ack_timeout=1)
+        scheduler.start()
+        first = asyncio.ensure_future(
+            scheduler.send(
+                ProgrammeServiceNameSetCommand(ps="FIRST", data_set_number=1)
+            )
+        )
+        await asyncio.sleep(0)
+        # superseded before being sent, answered with the command replacing it
+        second = asyncio.ensure_future(
+            scheduler.send(
+                ProgrammeServiceNameSetCommand(ps="SECOND", data_set_number=1)
+            )
+        )
+        replaced = asyncio.ensure_future(
+            scheduler.send(
+                ProgrammeServiceNameSetCommand(ps="THIRD", data_set_number=1)
+            )
+        )
+        assert await asyncio.wait_for(first, 1) is ResponseCode.OK
+        assert await asyncio.wait_for(second, 1) is ResponseCode.OK
+        assert replaced.done()
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "THIRD"
+        assert scheduler.frames_sent == 2
+
+        rejected = scheduler.send(DataSetSelectCommand(select_data_set_number=2))
+        assert await asyncio.wait_for(rejected, 1) is ResponseCode.DSN_ERROR
+
+        await scheduler.stop()
+        scheduler.close()
+
+    emulator_link.run(main())
+
+
+def test_send_requires_running_scheduler(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        scheduler = SendScheduler(proto, ack_timeout=1)
+        with pytest.raises(ValueError):
+            await scheduler.send(_rt("TEXT"))
+        with pytest.raises(ValueError):
+            await GenericRDSEncoder.create_from_protocol(proto, scheduler=scheduler)
+
+        emulator.ack_latency = 0.1
+        scheduler.start()
+        scheduler.submit(_rt("FIRST"))
+        await asyncio.sleep(0.01)
+        # queued behind the first frame when the scheduler stops
+        sent = asyncio.ensure_future(scheduler.send(_rt("SECOND", dsn=2)))
+        await asyncio.sleep(0.01)
+        await scheduler.stop()
+        assert await asyncio.wait_for(sent, 1) is None
+        assert scheduler.queue_depth() == 1
+        scheduler.close()
+
+    emulator_link.run(main())
+
+
+def test_encoder_sends_through_scheduler(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+    async def main():
+        scheduler = SendScheduler(proto, ack_timeout=1)
+        scheduler.start()
+        encoder = await GenericRDSEncoder.create_from_protocol(
+            proto, scheduler=scheduler
+        )
+        emulator.ack_latency = 0.02
+        emulator.data_set_count = 1
+
+        # rejected by the device, the commands queued by others are accepted
+        encoder.state.active_data_set = 2
+        encoder.state.service(1).ps = "RADIO"
+        encoder.ensure_current()
+        scheduler.submit(_rt("TEXT"))
+        await asyncio.sleep(0.2)
+        assert encoder.shadow.active_data_set == 1
+        assert encoder.shadow.service(1).ps == "RADIO"
+        assert encoder.shadow.service(1).rt.text.rstrip("\r") == "TEXT"
+
+        encoder.state.active_data_set = 1
+        encoder.start_reconciler(debounce=0.01)
+        encoder.state.service(1).ps = "NEXT"
+        await asyncio.sleep(0.2)
+        assert emulator.get(ProgrammeServiceNameSetCommand, 1, 0).ps == "NEXT"
+        assert encoder.shadow.service(1).ps == "NEXT"
+
+        assert scheduler.frames_sent == emulator.frames_received - 1
+        assert AcknowledgementTracker.for_protocol(proto).pending == 0
+        assert AcknowledgementTracker.for_protocol(proto).frames_lost == 0
+        await encoder.stop_reconciler()
+        encoder.close()
+        await scheduler.stop()
+        scheduler.close()
+
+    emulator_link.run(main())
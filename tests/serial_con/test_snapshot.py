@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from tests.serial_con.helpers import full_state
+from uecp.commands import ProgrammeServiceNameSetCommand
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.fleet import EncoderFleet
+from uecp.serial_con.snapshot import (
+    StateSnapshotStore,
+    decode_state,
+    device_identity,
+    encode_state,
+)
+
+
+def _encoded_slots(state):
+    return {key: command.encode() for key, command in state.slots().items()}
+
+
+def test_round_trip(tmp_path):
+    state = full_state(active_data_set=2)
+    store = StateSnapshotStore(tmp_path / "snapshot.json")
+    assert store.load() == {}
+    store.save({"a": state, "b": decode_state(encode_state(state))})
+    assert os.listdir(tmp_path) == ["snapshot.json"]
+
+    restored = store.load()
+    assert set(restored) == {"a", "b"}
+    assert _encoded_slots(restored["a"]) == _encoded_slots(state)
+    assert restored["a"].active_data_set == 2
+    assert restored["a"].confirmed_at == {}
+
+
+def test_invalid_snapshots(tmp_path):
+    path = tmp_path / "snapshot.json"
+    store = StateSnapshotStore(path)
+    for text in [
+        json.dumps({"version": 0, "encoders": {}}),
+        json.dumps({"version": 1}),
+        json.dumps({"version": 1, "encoders": []}),
+        json.dumps([1]),
+        '{"version": 1, "enc',
+    ]:
+        path.write_text(text)
+        with pytest.raises(ValueError):
+            store.load()
+
+    path.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "encoders": {
+                    "ok": encode_state(full_state()),
+                    "broken": ["zz"],
+                    "not a list": "00",
+                    "not hex": [1],
+                },
+            }
+        )
+    )
+    assert set(store.load()) == {"ok"}
+
+
+def test_device_identity():
+    assert device_identity("studio", ("tcp", "host", 4001)) == "studio@tcp:host:4001"
+
+
+def _store(emulator, state):
+    for command in state.slots().values():
+        emulator.store(command)
+
+
+def test_verify_restored_state(emulator_link):
+    emulator, proto = emulator_link.emulator, emulator_link.protocol
+    _store(emulator, full_state())
+
+    async def main():
+        restored = full_state()
+        restored.service(2).ps = "STALE"
+        encoder = GenericRDSEncoder.create_from_snapshot(proto, restored)
+        mismatched = await encoder.verify(timeout=1)
+
+        assert mismatched == {(ProgrammeServiceNameSetCommand.ELEMENT_CODE, 2, 0)}
+        assert encoder.shadow.service(2).ps == "RADIO 2"
+        # the stale assumption is not pushed to the device
+        assert encoder.state.service(2).ps == "RADIO 2"
+        frames_received = emulator.frames_received
+        encoder.ensure_current()
+        await asyncio.sleep(0.05)
+        assert emulator.frames_received == frames_received
+
+        encoder.close()
+
+    emulator_link.run(main())
+
+
+def test_fleet_warm_start(tmp_path, emulator_link):
+    emulator = emulator_link.emulator
+    _store(emulator, full_state())
+    store = StateSnapshotStore(tmp_path / "snapshot.json")
+
+    def create_fleet():
+        fleet = EncoderFleet(init_timeout=1, snapshot=store)
+        fleet.add_tcp("encoder", "127.0.0.1", emulator_link.port)
+        return fleet
+
+    async def main():
+        # initialised from the device, saved on stop
+        fleet = create_fleet()
+        await fleet.start()
+        try:
+            assert fleet.encoders["encoder"].shadow.service(1).ps == "RADIO 1"
+        finally:
+            await fleet.stop()
+        emulator.store(ProgrammeServiceNameSetCommand(ps="CHANGED", data_set_number=1))
+        emulator.ack_latency = 0.1
+
+        fleet = create_fleet()
+        await fleet.start()
+        try:
+            encoder = fleet.encoders["encoder"]
+            # available without waiting for the device, verified in the background
+            assert encoder.shadow.service(1).ps == "RADIO 1"
+            await asyncio.sleep(0.5)
+            assert encoder.shadow.service(1).ps == "CHANGED"
+        finally:
+            await fleet.stop()
+
+    emulator_link.run(main())
+
+
+def test_fleet_warm_start_with_swapped_unit(tmp_path, emulator_link):
+    emulator = emulator_link.emulator
+    store = StateSnapshotStore(tmp_path / "snapshot.json")
+    # the snapshot of the unit previously connected to the endpoint
+    previous = full_state()
+    store.save(
+        {device_identity("encoder", ("tcp", "127.0.0.1", emulator_link.port)): previous}
+    )
+    unit = full_state()
+    for service in unit.services.values():
+        service.pi += 0x100
+    del unit.services[(2, 0)]
+    _store(emulator, unit)
+
+    async def main():
+        fleet = EncoderFleet(init_timeout=1, snapshot=store)
+        fleet.add_tcp("encoder", "127.0.0.1", emulator_link.port)
+        await fleet.start()
+        try:
+            restored = fleet.encoders["encoder"]
+            assert restored.shadow.service(2).ps == "RADIO 2"
+            # verifying waits for the slots the unit doesn't answer
+            for _ in range(30):
+                await asyncio.sleep(0.1)
+                encoder = fleet.encoders["encoder"]
+                if encoder is not restored:
+                    break
+            # initialised from the device instead of keeping assumptions
+            assert encoder is not restored
+            assert encoder.shadow.service(1).pi == 0xD401
+            assert (2, 0) not in encoder.shadow.services
+        finally:
+            await fleet.stop()
+
+    emulator_link.run(main())
+
+
+def test_fleet_start_with_unreadable_snapshot(tmp_path, emulator_link):
+    emulator = emulator_link.emulator
+    _store(emulator, full_state())
+    path = tmp_path / "snapshot.json"
+    path.write_text("[]")
+
+    async def main():
+        fleet = EncoderFleet(init_timeout=1, snapshot=StateSnapshotStore(path))
+        fleet.add_tcp("encoder", "127.0.0.1", emulator_link.port)
+        await fleet.start()
+        try:
+            # initialised from the device instead
+            assert fleet.encoders["encoder"].shadow.service(1).ps == "RADIO 1"
+        finally:
+            await fleet.stop()
+
+    emulator_link.run(main())
@@ -0,0 +1,129 @@
+import pytest
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    ProgrammeServiceNameSetCommand,
+    ProgrammeType,
+    RadioText,
+    RadioTextSetCommand,
+    TrafficAnnouncementProgrammeSetCommand,
+)
+from uecp.serial_con.state import (
+    ProgrammeServiceState,
+    ServiceMap,
+    pack_frames,
+    slot_diff,
+    slot_key,
+)
+
+
+def test_commands_need_all_fields():
+    state = ProgrammeServiceState(ps="RADIO", ta=True)
+    commands = list(state.commands(2, 1))
+    assert [type(command) for command in commands] == [ProgrammeServiceNameSetCommand]
+    assert slot_key(commands[0]) == (ProgrammeServiceNameSetCommand.ELEMENT_CODE, 2, 1)
+
+    state.tp = False
+    assert len(list(state.commands(2, 1))) == 2
+
+
+def test_apply_round_trip():
+    source = ProgrammeServiceState(
+        pi=0xD3C2,
+        ps="RADIO",
+        pty=ProgrammeType.NEWS,
+        ptyn="HEADLINE",
+        ta=False,
+        tp=True,
+        stereo=True,
+        dynamic_pty=False,
+        rt="NOW PLAYING\r",
+    )
+    target = ProgrammeServiceState()
+    for command in source.commands(1, 0):
+        assert target.apply(command)
+    assert target == source
+    assert target.rt is not source.rt
+    assert not target.apply(DataSetSelectCommand(select_data_set_number=1))
+
+
+def test_service_map_tracks_changes():
+    dirty: set = set()
+    services = ServiceMap(dirty.add, {(1, 0): ProgrammeServiceState(ps="RADIO")})
+    assert len(dirty) == len(ProgrammeServiceState.SLOTS)
+    dirty.clear()
+
+    services[(1, 0)].ps = "OTHER"
+    services[(1, 0)].tp = True
+    assert dirty == {
+        (ProgrammeServiceNameSetCommand.ELEMENT_CODE, 1, 0),
+        (TrafficAnnouncementProgrammeSetCommand.ELEMENT_CODE, 1, 0),
+    }
+
+    dirty.clear()
+    removed = services.pop((1, 0))
+    removed.ps = "GONE"
+    assert not dirty
+
+
+def test_copy_is_independent():
+    state = ProgrammeServiceState(ps="RADIO", rt="TEXT\r")
+    copy = state.copy()
+    assert copy == state
+    copy.rt.text = "OTHER\r"
+    assert state.rt.text == "TEXT\r"
+
+
+def test_slot_diff_only_changed():
+    current = ProgrammeServiceState(ps="RADIO", rt=RadioText(text="ONE\r"))
+    target = ProgrammeServiceState(ps="RADIO", rt=RadioText(text="TWO\r"), pi=1)
+    diff = slot_diff(
+        {slot_key(c): c for c in current.commands(1, 0)},
+        {slot_key(c): c for c in target.commands(1, 0)},
+    )
+    assert sorted(command.ELEMENT_CODE for command in diff) == [
+        0x01,
+        RadioTextSetCommand.ELEMENT_CODE,
+    ]
+
+
+def test_pack_frames_first_fit_decreasing():
+    def rt(char):
+        return RadioTextSetCommand(text=char * 64)
+
+    def ps(psn):
+        return ProgrammeServiceNameSetCommand(ps="PS", programme_service_number=psn)
+
+    commands = [rt("A"), rt("B"), rt("C"), ps(1), rt("D"), rt("E"), rt("F")]
+    commands += [ps(n) for n in range(2, 7)]
+    frames = pack_frames(commands)
+    assert len(frames) == 2
+    assert sorted(
+        command.encode() for frame in frames for command in frame.commands
+    ) == sorted(command.encode() for command in commands)
+    # the given order is kept within a frame
+    first_commands = frames[0].commands
+    assert [commands.index(c) for c in first_commands] == sorted(
+        commands.index(c) for c in first_commands
+    )
+
+
+def test_pack_frames_last():
+    last = [ProgrammeServiceNameSetCommand(ps="LAST")]
+    frames = pack_frames([RadioTextSetCommand(text="X" * 64)] * 3, last=last)
+    assert len(frames) == 1
+    assert frames[-1].commands[-1] is last[0]
+
+    frames = pack_frames([RadioTextSetCommand(text="X" * 64)] * 4, last=last)
+    assert len(frames) == 2
+    assert frames[-1].commands[-1] is last[0]
+    assert pack_frames([]) == []
+
+
+def test_pack_frames_too_large():
+    class Huge(ProgrammeServiceNameSetCommand):
+        def encode(self):
+            return [0] * 256
+
+    with pytest.raises(OverflowError):
+        pack_frames([Huge()])
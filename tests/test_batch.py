@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from uecp.batch import (
+    DecodeStatistics,
+    EncoderStatistics,
+    capture_shards,
+    decode_capture,
+    decode_dump,
+    dump_shards,
+    main,
+)
+from uecp.capture import CaptureWriter, Direction
+from uecp.commands import MessageAcknowledgementCommand, ResponseCode
+from uecp.corpus import CorpusGenerator
+from uecp.frame import UECPAddressFilter, UECPFrame
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return CorpusGenerator(
+        seed=11,
+        stuffing_density=0.2,
+        garbage_rate=0.02,
+        corrupt_rate=0.02,
+        chunk_size=(1, 48),
+    ).generate(64 * 1024)
+
+
+@pytest.fixture(scope="module")
+def capture_path(corpus, tmp_path_factory):
+    path = tmp_path_factory.mktemp("capture") / "link.cap"
+    with CaptureWriter(path, index_interval=1024) as writer:
+        for i, chunk in enumerate(corpus.chunks()):
+            writer.write(Direction.RX, bytes(chunk), timestamp_ns=i * 1_000_000)
+            # interleave the other direction, with frames spanning records
+            if i % 5 == 0:
+                ack = UECPFrame(
+                    commands=[MessageAcknowledgementCommand(code=ResponseCode.OK)]
+                ).encode()
+                writer.write(Direction.TX, ack[:3], timestamp_ns=i * 1_000_000)
+                writer.write(Direction.TX, ack[3:], timestamp_ns=i * 1_000_000)
+    return path
+
+
+def test_shards_at_record_boundaries(capture_path):
+    shards = capture_shards(capture_path, shard_size=4096)
+    assert len(shards) > 5
+    assert all(
+        end == next_start for (_, end), (next_start, _) in zip(shards, shards[1:])
+    )
+
+
+def test_capture_shards_agree(corpus, capture_path):
+    single = decode_capture(capture_path, workers=1, shard_size=1 << 30)
+    sharded = decode_capture(capture_path, workers=2, shard_size=4096)
+    assert single.shards == 1
+    assert sharded.shards > 5
+    assert sharded.statistics == single.statistics
+
+    statistics = sharded.statistics
+    acks = len(range(0, len(corpus.chunk_lengths), 5))
+    assert statistics.frames == corpus.frames + acks
+    assert statistics.decoded_frames == corpus.valid_frames + acks
+    assert statistics.errors == {"crc": corpus.corrupted_frames}
+    assert statistics.response_codes[ResponseCode.OK] >= acks
+    assert sum(e.frames for e in statistics.encoders.values()) == (
+        statistics.decoded_frames
+    )
+
+
+def test_collect_frames_in_order(capture_path):
+    single = decode_capture(
+        capture_path, workers=1, shard_size=1 << 30, collect_frames=True
+    )
+    sharded = decode_capture(
+        capture_path, workers=2, shard_size=4096, collect_frames=True
+    )
+    assert len(sharded.frames) == sharded.statistics.decoded_frames
+    assert [(ts, d, f.encode()) for ts, d, f in sharded.frames] == [
+        (ts, d, f.encode()) for ts, d, f in single.frames
+    ]
+    timestamps = [ts for ts, _, _ in sharded.frames]
+    assert timestamps == sorted(timestamps)
+
+
+def test_direction_and_address_filter(capture_path):
+    tx = decode_capture(capture_path, workers=1, direction=Direction.TX)
+    assert tx.statistics.errors == {}
+    assert set(tx.statistics.element_codes) == {
+        MessageAcknowledgementCommand.ELEMENT_CODE
+    }
+
+    filtered = decode_capture(
+        capture_path,
+        workers=1,
+        address_filter=UECPAddressFilter(site_addresses={5}, encoder_addresses={5}),
+    )
+    assert all(
+        site_address in (0, 5) and encoder_address in (0, 5)
+        for site_address, encoder_address in filtered.statistics.encoders
+    )
+
+
+def test_dump(corpus, tmp_path):
+    path = tmp_path / "dump.bin"
+    path.write_bytes(corpus.data)
+    shards = dump_shards(path, shard_size=4096)
+    assert all(corpus.data[start] == UECPFrame.STA for start, _ in shards[1:])
+
+    result = decode_dump(path, workers=2, shard_size=4096)
+    assert result.statistics.frames == corpus.frames
+    assert result.statistics.decoded_frames == corpus.valid_frames
+    assert all(
+        encoder.frames_per_second is None
+        for encoder in result.statistics.encoders.values()
+    )
+
+
+def test_merge():
+    first = DecodeStatistics(frames=2, decoded_frames=2)
+    first.encoders[(1, 1)] = EncoderStatistics(
+        frames=2, first_timestamp_ns=0, last_timestamp_ns=1_000_000_000
+    )
+    second = DecodeStatistics(frames=1, decoded_frames=0)
+    second.errors["crc"] += 1
+    second.encoders[(1, 1)] = EncoderStatistics(
+        frames=2, first_timestamp_ns=2_000_000_000, last_timestamp_ns=3_000_000_000
+    )
+    first.merge(second)
+    assert first.frames == 3
+    assert first.errors == {"crc": 1}
+    assert first.encoders[(1, 1)].frames == 4
+    assert first.encoders[(1, 1)].frames_per_second == pytest.approx(4 / 3)
+
+
+def test_main(capture_path, capsys):
+    assert main([str(capture_path), "--workers", "1", "--json"]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["shards"] == 1
+    assert summary["errors"]["crc"] > 0
+    assert summary["response_codes"]["OK"] > 0
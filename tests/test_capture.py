@@ -0,0 +1,199 @@
+import pytest
+
+from uecp.capture import (
+    CaptureReader,
+    CaptureRecord,
+    CaptureWriter,
+    Direction,
+    MappedCaptureReader,
+    build_index,
+    index_path,
+)
+from uecp.frame import UECPAddressFilter, UECPFrame
+
+
+class Clock:
+    def __init__(self, start=1_000_000_000):
+        self.now = start
+
+    def __call__(self):
+        self.now += 1_000
+        return self.now
+
+
+def write_capture(path, count, index_interval=256):
+    clock = Clock()
+    with CaptureWriter(path, index_interval=index_interval, clock=clock) as writer:
+        for i in range(count):
+            writer.write(Direction(i % 2), bytes([0xFE, i % 0xFD, 0xFF]))
+    return clock
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "link.cap"
+    with CaptureWriter(path, clock=Clock()) as writer:
+        writer.write(Direction.TX, b"\xfe\x01\xff")
+        writer.write(Direction.RX, b"\xfe\x02\xff", timestamp_ns=5_000_000_000)
+
+    with CaptureReader(path) as reader:
+        assert list(reader) == [
+            CaptureRecord(1_000_001_000, Direction.TX, b"\xfe\x01\xff"),
+            CaptureRecord(5_000_000_000, Direction.RX, b"\xfe\x02\xff"),
+        ]
+
+
+def test_timestamps_never_decrease(tmp_path):
+    path = tmp_path / "link.cap"
+    with CaptureWriter(path) as writer:
+        writer.write(Direction.RX, b"a", timestamp_ns=20)
+        writer.write(Direction.RX, b"b", timestamp_ns=10)
+    with CaptureReader(path) as reader:
+        assert [record.timestamp_ns for record in reader] == [20, 20]
+
+
+def test_large_data_split(tmp_path):
+    path = tmp_path / "link.cap"
+    data = bytes(range(256)) * 300
+    with CaptureWriter(path) as writer:
+        writer.write(Direction.RX, data)
+        assert writer.records_written == 2
+    with CaptureReader(path) as reader:
+        assert b"".join(record.data for record in reader) == data
+
+
+def test_seek(tmp_path):
+    path = tmp_path / "link.cap"
+    write_capture(path, 1000)
+
+    with CaptureReader(path) as reader:
+        assert len(reader.index) > 10
+        timestamps = [entry[0] for entry in reader.index]
+        assert timestamps == sorted(timestamps)
+
+        target = 1_000_000_000 + 500 * 1_000
+        records = list(reader.records(start_ns=target, end_ns=target + 10_000))
+        assert [record.timestamp_ns for record in records] == [
+            target + i * 1_000 for i in range(10)
+        ]
+        assert reader.offset_for(target) <= records[0].offset
+        assert records[0].offset - reader.offset_for(target) <= 256 + 16
+
+        assert list(reader.records(start_ns=10**18)) == []
+        assert len(list(reader.records(start_ns=0))) == 1000
+
+
+def test_seek_without_index(tmp_path):
+    path = tmp_path / "link.cap"
+    write_capture(path, 100)
+    index_path(path).unlink()
+
+    with CaptureReader(path) as reader:
+        assert reader.index == []
+        assert len(list(reader.records(start_ns=1_000_050_000))) == 51
+
+    build_index(path, index_interval=256)
+    with CaptureReader(path) as reader:
+        assert len(reader.index) > 1
+        assert len(list(reader.records(start_ns=1_000_050_000))) == 51
+
+
+def test_append_and_torn_record(tmp_path):
+    path = tmp_path / "link.cap"
+    clock = write_capture(path, 100)
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    with CaptureReader(path) as reader:
+        assert len(list(reader)) == 100
+
+    with CaptureWriter(path, index_interval=256, clock=clock) as writer:
+        writer.write(Direction.TX, b"\xfe\x00\xff", timestamp_ns=1)
+
+    with CaptureReader(path) as reader:
+        records = list(reader)
+        assert len(records) == 101
+        assert records[-1].data == b"\xfe\x00\xff"
+        assert records[-1].timestamp_ns == records[-2].timestamp_ns
+
+
+def test_torn_record_dropped_from_index(tmp_path):
+    path = tmp_path / "link.cap"
+    clock = write_capture(path, 100, index_interval=1)
+    with CaptureReader(path) as reader:
+        offsets = [entry[1] for entry in reader.index]
+    # crashed while writing the last record, after its index entry
+    with open(path, "r+b") as f:
+        f.truncate(offsets[-1] + 5)
+    with open(index_path(path), "ab") as f:
+        f.write(b"\x01\x02")
+
+    with CaptureWriter(path, index_interval=1, clock=clock) as writer:
+        assert writer.offset == offsets[-1]
+        writer.write(Direction.TX, b"\xfe\x00\xff")
+
+    with CaptureReader(path) as reader:
+        records = list(reader)
+        assert len(records) == 100
+        assert records[-1].data == b"\xfe\x00\xff"
+        assert [entry[1] for entry in reader.index] == [
+            record.offset for record in records
+        ]
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / "link.cap"
+    path.write_bytes(b"something else")
+    with pytest.raises(ValueError):
+        CaptureReader(path)
+
+
+def test_mapped_reader(tmp_path):
+    path = tmp_path / "link.cap"
+    frames = [
+        UECPFrame(
+            site_address=1, encoder_address=i % 3 + 1, sequence_counter=i
+        ).encode()
+        for i in range(60)
+    ]
+    with CaptureWriter(path, index_interval=64) as writer:
+        for i, frame in enumerate(frames):
+            # split every frame over two records, interleaved with the other way
+            writer.write(Direction.TX, frame[:4], timestamp_ns=i * 10)
+            writer.write(Direction.RX, frames[0][:3], timestamp_ns=i * 10 + 1)
+            writer.write(Direction.TX, frame[4:], timestamp_ns=i * 10 + 2)
+            writer.write(Direction.RX, frames[0][3:], timestamp_ns=i * 10 + 3)
+
+    with MappedCaptureReader(path) as reader:
+        assert len(list(reader.records())) == 240
+        tx = list(reader.frames(direction=Direction.TX))
+        assert [frame.raw for frame in tx] == frames
+        assert [frame.timestamp_ns for frame in tx] == [i * 10 + 2 for i in range(60)]
+        assert all(frame.valid for frame in reader.frames())
+        assert len(list(reader.frames(direction=Direction.RX))) == 60
+
+        in_range = list(reader.frames(start_ns=200, end_ns=300))
+        assert [frame.timestamp_ns for frame in in_range] == [
+            ts for i in range(20, 30) for ts in (i * 10 + 2, i * 10 + 3)
+        ]
+        # the first frame starts in a record before the range
+        assert [
+            f.sequence_counter for f in in_range if f.direction is Direction.TX
+        ] == [*range(20, 30)]
+
+        address_filter = UECPAddressFilter(encoder_addresses={2})
+        filtered = list(
+            reader.frames(direction=Direction.TX, address_filter=address_filter)
+        )
+        assert [frame.sequence_counter for frame in filtered] == [*range(1, 60, 3)]
+
+
+def test_mapped_reader_frames_outlive_mapping(tmp_path):
+    path = tmp_path / "link.cap"
+    frames = [UECPFrame(sequence_counter=i).encode() for i in range(3)]
+    with CaptureWriter(path) as writer:
+        for i, frame in enumerate(frames):
+            writer.write(Direction.TX, frame, timestamp_ns=i)
+    with MappedCaptureReader(path) as reader:
+        scanned = list(reader.frames())
+    assert [frame.raw for frame in scanned] == frames
+    assert [frame.decode().sequence_counter for frame in scanned] == [0, 1, 2]
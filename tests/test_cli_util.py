@@ -0,0 +1,17 @@
+import math
+
+from uecp.cli_util import parse_host_port, parse_port_baudrate, percentile
+
+
+def test_parse_targets():
+    assert parse_host_port("192.0.2.10:4001") == ("192.0.2.10", 4001)
+    assert parse_host_port("[::1]:4001") == ("[::1]", 4001)
+    assert parse_port_baudrate("/dev/ttyUSB0:9600") == ("/dev/ttyUSB0", 9600)
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert math.isnan(percentile([], 50))
@@ -0,0 +1,134 @@
+import pytest
+
+from uecp.commands import RadioTextSetCommand, RequestCommand, UECPCommand
+from uecp.corpus import (
+    COMMAND_FACTORIES,
+    CorpusGenerator,
+    UECPCorpus,
+    decode_corpus,
+    main,
+    parse_mix,
+)
+from uecp.frame import UECPFrame, UECPFrameDecoder
+
+
+def test_factories_cover_registered_commands():
+    assert set(COMMAND_FACTORIES) == set(UECPCommand.ELEMENT_CODE_MAP.values())
+
+
+def test_parse_mix():
+    assert parse_mix("RadioTextSetCommand=4,RequestCommand") == {
+        RadioTextSetCommand: 4.0,
+        RequestCommand: 1.0,
+    }
+    with pytest.raises(ValueError):
+        parse_mix("NoSuchCommand=1")
+    with pytest.raises(ValueError):
+        parse_mix("RadioTextSetCommand=0")
+
+
+def test_deterministic():
+    options = dict(stuffing_density=0.3, garbage_rate=0.05, corrupt_rate=0.05)
+    first = CorpusGenerator(seed=7, **options).generate(8192)
+    second = CorpusGenerator(seed=7, **options).generate(8192)
+    other = CorpusGenerator(seed=8, **options).generate(8192)
+    assert first.data == second.data
+    assert first.chunk_lengths == second.chunk_lengths
+    assert first.data != other.data
+
+
+def test_commands_round_trip():
+    generator = CorpusGenerator(seed=1, stuffing_density=0.5)
+    for command_type, factory in COMMAND_FACTORIES.items():
+        for _ in range(20):
+            command = factory(generator)
+            assert isinstance(command, command_type)
+            data = command.encode()
+            (decoded,) = UECPCommand.decode_commands(data)
+            assert decoded.encode() == data
+
+
+def test_stuffing_density():
+    sparse = CorpusGenerator(seed=1).generate(16384)
+    dense = CorpusGenerator(seed=1, stuffing_density=0.8).generate(16384)
+    assert dense.data.count(0xFD) > 4 * sparse.data.count(0xFD)
+
+
+def test_mix():
+    corpus = CorpusGenerator(seed=2, mix={RadioTextSetCommand: 1}).generate(4096)
+    decoder = UECPFrameDecoder()
+    commands = []
+    remaining = corpus.data
+    while remaining:
+        frame, remaining = decoder.decode(remaining)
+        assert frame is not None
+        commands += frame.commands
+    assert commands
+    assert all(isinstance(command, RadioTextSetCommand) for command in commands)
+
+
+def test_chunks():
+    corpus = CorpusGenerator(seed=3, chunk_size=(5, 9)).generate(1000)
+    chunks = list(corpus.chunks())
+    assert b"".join(chunks) == corpus.data
+    assert all(5 <= len(chunk) <= 9 for chunk in chunks[:-1])
+
+
+def test_decode_counts_frames_and_errors():
+    corpus = CorpusGenerator(
+        seed=4, stuffing_density=0.2, garbage_rate=0.05, corrupt_rate=0.05
+    ).generate(32768)
+    assert corpus.corrupted_frames > 0
+    assert corpus.garbage_blocks > 0
+    result = decode_corpus(corpus)
+    assert result.frames == corpus.valid_frames
+    assert result.errors == corpus.corrupted_frames + corpus.garbage_blocks
+    assert result.bytes_decoded == len(corpus.data)
+
+
+def test_garbage_split_by_chunks():
+    generator = CorpusGenerator(seed=6)
+    for _ in range(100):
+        garbage = generator.garbage()
+        assert garbage[-1] == UECPFrame.STP
+        assert max(garbage[:-1]) < 0xFD
+    for seed in range(20):
+        corpus = CorpusGenerator(
+            seed=seed, chunk_size=(1, 16), garbage_rate=0.2, corrupt_rate=0.1
+        ).generate(2048)
+        result = decode_corpus(corpus)
+        assert result.frames == corpus.valid_frames
+        assert result.errors == corpus.corrupted_frames + corpus.garbage_blocks
+
+
+def test_save_load(tmp_path):
+    corpus = CorpusGenerator(seed=5, corrupt_rate=0.1).generate(4096)
+    path = tmp_path / "corpus.bin"
+    corpus.save(path)
+    loaded = UECPCorpus.load(path)
+    assert loaded == corpus
+
+    path.write_bytes(b"NOTACORPUS" + bytes(40))
+    with pytest.raises(ValueError):
+        UECPCorpus.load(path)
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / "corpus.bin"
+    assert (
+        main(
+            [
+                str(path),
+                "--size",
+                "4096",
+                "--garbage-rate",
+                "0.05",
+                "--corrupt-rate",
+                "0.05",
+                "--verify",
+            ]
+        )
+        == 0
+    )
+    assert len(UECPCorpus.load(path).data) >= 4096
+    assert "decoded" in capsys.readouterr().out
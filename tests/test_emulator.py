@@ -0,0 +1,176 @@
+import asyncio
+import os
+
+import pytest
+
+from uecp.commands import (
+    DataSetSelectCommand,
+    MessageAcknowledgementCommand,
+    ProgrammeServiceNameSetCommand,
+    RequestCommand,
+    ResponseCode,
+)
+from uecp.emulator import UECPEncoderEmulator
+from uecp.frame import CRCError, FramingError, UECPFrame
+from uecp.ip_con.protocol import open_tcp_protocol
+from uecp.serial_con.device import GenericRDSEncoder
+from uecp.serial_con.protocol import open_serial_protocol
+
+
+def commands_of(frames: list[UECPFrame]) -> list:
+    return [cmd for frame in frames for cmd in frame.commands]
+
+
+class TestUECPEncoderEmulator:
+    def test_store_and_request(self):
+        emulator = UECPEncoderEmulator()
+        frames = emulator.handle_frame(
+            UECPFrame(
+                commands=[
+                    ProgrammeServiceNameSetCommand(
+                        ps="RADIO", data_set_number=0xFF, programme_service_number=1
+                    ),
+                    DataSetSelectCommand(select_data_set_number=3),
+                    RequestCommand(
+                        command=ProgrammeServiceNameSetCommand,
+                        data_set_number=0,
+                        programme_service_number=1,
+                    ),
+                ]
+            )
+        )
+        ack, response = commands_of(frames)
+        assert isinstance(ack, MessageAcknowledgementCommand)
+        assert ack.code is ResponseCode.OK
+        assert isinstance(response, ProgrammeServiceNameSetCommand)
+        assert response.ps == "RADIO"
+        assert response.data_set_number == 3
+        assert emulator.active_data_set == 3
+        for dsn in range(1, 9):
+            assert emulator.get(ProgrammeServiceNameSetCommand, dsn, 1) is not None
+
+    def test_invalid_data_set(self):
+        emulator = UECPEncoderEmulator(data_set_count=2)
+        frames = emulator.handle_frame(
+            UECPFrame(
+                sequence_counter=7,
+                commands=[DataSetSelectCommand(select_data_set_number=3)],
+            )
+        )
+        (ack,) = commands_of(frames)
+        assert ack.code is ResponseCode.DSN_ERROR
+        assert ack.sequence_counter == 7
+        assert emulator.active_data_set == 1
+
+    def test_request_of_unknown_command(self):
+        class VendorCommand:
+            # not registered with UECPCommand
+            ELEMENT_CODE = 0x7F
+
+        emulator = UECPEncoderEmulator()
+        frames = emulator.handle_frame(
+            UECPFrame(
+                sequence_counter=5,
+                commands=[RequestCommand(command=VendorCommand)],
+            )
+        )
+        (ack,) = commands_of(frames)
+        assert ack.code is ResponseCode.MSG_UNKNOWN
+        assert ack.sequence_counter == 5
+
+    def test_error_injection(self):
+        emulator = UECPEncoderEmulator(error_rate=1.0, seed=1)
+        (ack,) = commands_of(emulator.handle_frame(UECPFrame(sequence_counter=3)))
+        assert ack.code is ResponseCode.MSG_NOT_ACCEPTABLE
+        assert emulator.errors_injected == 1
+
+    def test_crc_error(self, emulator_link):
+        emulator, proto = emulator_link.emulator, emulator_link.protocol
+
+        async def main():
+            acks = asyncio.Queue()
+            proto.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+
+            data = bytearray(UECPFrame(commands=[DataSetSelectCommand(2)]).encode())
+            data[-2] ^= 0xFF
+            proto.transport.write(bytes(data) + UECPFrame().encode())
+
+            assert (await asyncio.wait_for(acks.get(), 2)).code is (
+                ResponseCode.CRC_ERROR
+            )
+            assert (await asyncio.wait_for(acks.get(), 2)).code is ResponseCode.OK
+            assert emulator.decode_errors == 1
+
+        emulator_link.run(main())
+
+    def test_decode_error_codes(self):
+        emulator = UECPEncoderEmulator()
+        for exc, code in (
+            (CRCError("CRC error"), ResponseCode.CRC_ERROR),
+            (FramingError("not enough data"), ResponseCode.UNEXPECTED_END_OF_MSG),
+            (UnicodeError("stuffing"), ResponseCode.BAD_STUFFING),
+            (ValueError("CRC mentioned"), ResponseCode.MSG_UNKNOWN),
+        ):
+            (ack,) = commands_of(emulator.handle_decode_error(exc))
+            assert ack.code is code
+
+    def test_pty_writes_buffered(self):
+        async def main():
+            emulator = UECPEncoderEmulator()
+            path = emulator.open_pty()
+            (_, _, transport) = emulator._ptys[0]
+            data = bytes(range(256)) * 4096
+            # more than the pty takes, nobody reads yet
+            transport.write(data)
+            assert transport.get_write_buffer_size() > 0
+
+            loop = asyncio.get_running_loop()
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            received = bytearray()
+            done = asyncio.Event()
+
+            def readable():
+                received.extend(os.read(fd, 65536))
+                if len(received) == len(data):
+                    done.set()
+
+            loop.add_reader(fd, readable)
+            try:
+                await asyncio.wait_for(done.wait(), 5)
+                assert received == data
+                assert transport.get_write_buffer_size() == 0
+            finally:
+                loop.remove_reader(fd)
+                os.close(fd)
+                await emulator.close()
+
+        asyncio.run(main())
+
+
+@pytest.mark.parametrize("transport", ["tcp", "pty"])
+def test_generic_rds_encoder_against_emulator(transport):
+    async def main():
+        emulator = UECPEncoderEmulator(ack_latency=0.01, baudrate=115200)
+        emulator.store(DataSetSelectCommand(select_data_set_number=4))
+        if transport == "tcp":
+            proto = await open_tcp_protocol("127.0.0.1", await emulator.start_tcp())
+        else:
+            proto = await open_serial_protocol(emulator.open_pty(), 115200)
+        try:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            encoder = await GenericRDSEncoder.create_from_protocol(proto)
+            assert loop.time() - start >= 0.01
+            assert encoder.state.active_data_set == 4
+
+            encoder.state.active_data_set = 2
+            acks = asyncio.Queue()
+            proto.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+            encoder.ensure_current()
+            await asyncio.wait_for(acks.get(), 2)
+            assert emulator.active_data_set == 2
+        finally:
+            proto.transport.close()
+            await emulator.close()
+
+    asyncio.run(main())
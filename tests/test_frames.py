@@ -9,7 +9,7 @@ from uecp.commands import (
     ProgrammeIdentificationSetCommand,
 )
 from uecp.commands.bidirectional import ResponseCode
-from uecp.frame import UECPFrame, UECPFrameDecoder
+from uecp.frame import UECPAddressFilter, UECPFrame, UECPFrameDecoder
 
 
 class TestUECPFrame:
@@ -176,3 +176,76 @@ class TestUECPFrameDecoder:
         command = commands[0]
         assert isinstance(command, DataSetSelectCommand)
         assert command.select_data_set_number == 2
+
+    def test_error_counters(self):
+        decoder = UECPFrameDecoder()
+        with pytest.raises(ValueError, match="no start bit"):
+            decoder.decode(bytes.fromhex("00 ff"))
+        with pytest.raises(ValueError, match="CRC error"):
+            decoder.decode(bytes.fromhex("FE00002B021C02D083FF"))
+        with pytest.raises(UnicodeError):
+            decoder.decode(bytes.fromhex("FE00fd05ff"))
+        assert decoder.framing_errors == 2
+        assert decoder.crc_errors == 1
+        assert decoder.frames_decoded == 0
+
+    def test_resync_on_start_byte(self):
+        decoder = UECPFrameDecoder()
+        # a torn frame followed by a complete one
+        frame, remaining_data = decoder.decode(
+            bytes.fromhex("FE00002B02 FE00002B021C02D082FF")
+        )
+        assert frame is not None
+        assert frame.sequence_counter == 0x2B
+        assert decoder.resyncs == 1
+        assert decoder.frames_decoded == 1
+
+
+class TestUECPAddressFilter:
+    def test_matches(self):
+        address_filter = UECPAddressFilter(site_addresses={5}, encoder_addresses={3})
+        assert address_filter.matches(5, 3)
+        assert address_filter.matches(UECPFrame.ALL_SITES, 3)
+        assert address_filter.matches(5, UECPFrame.ALL_ENCODERS)
+        assert not address_filter.matches(4, 3)
+        assert not address_filter.matches(5, 4)
+
+    def test_unrestricted(self):
+        address_filter = UECPAddressFilter(encoder_addresses={3})
+        assert address_filter.matches(0x3FF, 3)
+        assert not address_filter.matches(0x3FF, 4)
+
+    def test_decoder_drops_foreign_frames(self):
+        frames = [
+            UECPFrame(
+                site_address=1,
+                encoder_address=encoder_address,
+                commands=[DataSetSelectCommand(select_data_set_number=encoder_address)],
+            )
+            for encoder_address in (1, 2, 3)
+        ]
+        data = b"".join(frame.encode() for frame in frames)
+
+        decoder = UECPFrameDecoder(
+            address_filter=UECPAddressFilter(encoder_addresses={2})
+        )
+        frame, remaining_data = decoder.decode(data)
+        assert frame is not None
+        assert frame.encoder_address == 2
+        assert decoder.filtered_frames == 1
+
+        frame, remaining_data = decoder.decode(remaining_data)
+        assert frame is None
+        assert len(remaining_data) == 0
+        assert decoder.filtered_frames == 2
+
+    def test_decoder_checks_crc_of_foreign_frames(self):
+        data = bytearray(UECPFrame(encoder_address=5).encode())
+        data[-2] ^= 0x01
+
+        decoder = UECPFrameDecoder(
+            address_filter=UECPAddressFilter(encoder_addresses={2})
+        )
+        with pytest.raises(ValueError, match="CRC error"):
+            decoder.decode(data)
+        assert decoder.filtered_frames == 0
@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import json
+import multiprocessing
+
+import pytest
+
+from uecp.ip_con.protocol import open_tcp_protocol
+from uecp.loadgen import LoadGenerator, _EmulatorProcess, main, parse_mix
+
+
+def test_parse_mix():
+    assert parse_mix("rt=4,ps,poll=0.5") == {"rt": 4.0, "ps": 1.0, "poll": 0.5}
+    with pytest.raises(ValueError):
+        parse_mix("pi=1")
+    with pytest.raises(ValueError):
+        parse_mix("rt=0")
+
+
+def test_retransmits_on_error_acks(emulator_link):
+    emulator = emulator_link.emulator
+    emulator.error_rate = 0.3
+    generator = LoadGenerator(
+        [functools.partial(open_tcp_protocol, "127.0.0.1", emulator_link.port)] * 2,
+        mix={"rt": 1, "ta": 1, "poll": 1},
+        retries=5,
+        seed=3,
+    )
+    report = emulator_link.run(generator.run(0.2))
+    assert report.connections == 2
+    assert report.frames_sent == emulator.frames_received
+    # without drops every error ack is retransmitted unless retries ran out
+    assert report.error_acks == report.retransmits + report.failures
+    assert report.retransmits > 0
+    assert (
+        report.frames_acknowledged + report.retransmits + report.failures
+        == report.frames_sent
+    )
+    assert len(report.ack_latencies) == report.frames_sent
+
+
+def test_main_json(capsys):
+    assert main(["--emulate", "--duration", "0.1", "--rate", "100", "--json"]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["frames_sent"] > 0
+    assert summary["failures"] == 0
+    assert set(summary["ack_latency_ms"]) == {"p50", "p90", "p99", "p100"}
+    assert summary["emulator_cpu_s"] > 0
+
+
+def test_emulator_process():
+    async def run():
+        emulator = _EmulatorProcess()
+        port = await emulator.start()
+        try:
+            generator = LoadGenerator(
+                [functools.partial(open_tcp_protocol, "127.0.0.1", port)],
+                mix={"ps": 1},
+                rate=50,
+            )
+            report = await generator.run(0.1)
+        finally:
+            cpu_seconds = await emulator.close()
+        return report, cpu_seconds
+
+    report, cpu_seconds = asyncio.run(run())
+    assert report.frames_acknowledged == report.frames_sent > 0
+    # the emulator ran in a child process, not accounted to cpu_seconds
+    assert cpu_seconds > 0
+    assert multiprocessing.active_children() == []
+
+
+def test_late_acknowledgements_not_sampled(emulator_link):
+    emulator = emulator_link.emulator
+    # acknowledgements arrive after the retransmit was written
+    emulator.ack_latency = 0.03
+    generator = LoadGenerator(
+        [functools.partial(open_tcp_protocol, "127.0.0.1", emulator_link.port)],
+        mix={"ps": 1},
+        ack_timeout=0.02,
+        retries=1,
+    )
+    report = emulator_link.run(generator.run(0.3))
+    assert report.uncertain_acks > 0
+    assert len(report.ack_latencies) + report.uncertain_acks == (
+        report.frames_acknowledged + report.error_acks
+    )
+    # none of them was taken for the acknowledgement of a retransmit
+    assert all(latency >= 0.03 for latency in report.ack_latencies)
@@ -0,0 +1,97 @@
+import asyncio
+import math
+
+import pytest
+
+from uecp.metrics import Histogram, Metric, MetricsExporter, MetricsRegistry
+
+
+def test_histogram():
+    histogram = Histogram(bounds=(1, 5, 10))
+    for value in (0.5, 1, 3, 7, 20):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot.counts == (2, 1, 1, 1)
+    assert snapshot.count == 5
+    assert snapshot.sum == pytest.approx(31.5)
+    assert list(snapshot.cumulative()) == [(1, 2), (5, 3), (10, 4), (math.inf, 5)]
+    assert snapshot.quantile(0.5) == 5
+    assert snapshot.quantile(1) == math.inf
+    assert math.isnan(Histogram().snapshot().quantile(0.5))
+
+
+def test_metric_kind():
+    with pytest.raises(ValueError):
+        Metric("name", "summary", "help", 1)
+
+
+def test_registry_render():
+    histogram = Histogram(bounds=(0.5,))
+    histogram.observe(0.25)
+    histogram.observe(2)
+
+    def source():
+        yield Metric("test_frames_total", "counter", "Frames", 3)
+        yield Metric("test_seconds", "histogram", "Time", histogram.snapshot())
+
+    registry = MetricsRegistry()
+    registry.register(source, link='a"b')
+    registry.register(source, link="c")
+
+    snapshot = registry.snapshot()
+    assert [metric.labels for metric in snapshot] == [{"link": 'a"b'}] * 2 + [
+        {"link": "c"}
+    ] * 2
+
+    assert registry.render() == (
+        "# HELP test_frames_total Frames\n"
+        "# TYPE test_frames_total counter\n"
+        'test_frames_total{link="a\\"b"} 3\n'
+        'test_frames_total{link="c"} 3\n'
+        "# HELP test_seconds Time\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{link="a\\"b",le="0.5"} 1\n'
+        'test_seconds_bucket{link="a\\"b",le="+Inf"} 2\n'
+        'test_seconds_sum{link="a\\"b"} 2.25\n'
+        'test_seconds_count{link="a\\"b"} 2\n'
+        'test_seconds_bucket{link="c",le="0.5"} 1\n'
+        'test_seconds_bucket{link="c",le="+Inf"} 2\n'
+        'test_seconds_sum{link="c"} 2.25\n'
+        'test_seconds_count{link="c"} 2\n'
+    )
+
+    registry.unregister(source)
+    assert registry.snapshot() == []
+
+
+def test_exporter(emulator_link):
+    emulator, protocol = emulator_link.emulator, emulator_link.protocol
+
+    async def fetch(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def run():
+        registry = MetricsRegistry()
+        registry.register(protocol.collect_metrics, link="emulator")
+        exporter = MetricsExporter(registry)
+        port = await exporter.start()
+        try:
+            acks = asyncio.Event()
+            protocol.received_frame_callbacks.append(lambda frame: acks.set())
+            protocol.write(emulator._frame([]))
+            await asyncio.wait_for(acks.wait(), 1)
+            return await fetch(port, "/metrics"), await fetch(port, "/")
+        finally:
+            await exporter.close()
+
+    metrics, missing = emulator_link.run(run())
+    assert metrics.startswith(b"HTTP/1.1 200 OK\r\n")
+    body = metrics.split(b"\r\n\r\n", 1)[1].decode()
+    assert 'uecp_frames_sent_total{link="emulator"} 1' in body
+    assert 'uecp_frames_decoded_total{link="emulator"} 1' in body
+    assert 'uecp_decode_seconds_count{link="emulator"} 1' in body
+    assert missing.startswith(b"HTTP/1.1 404 Not Found\r\n")
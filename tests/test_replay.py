@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import json
+
+import pytest
+
+from uecp.capture import CaptureWriter, Direction
+from uecp.commands import (
+    MessageAcknowledgementCommand,
+    ProgrammeServiceNameSetCommand,
+    RadioTextSetCommand,
+    RequestCommand,
+    ResponseCode,
+)
+from uecp.frame import UECPFrame
+from uecp.replay import CaptureReplayer, _parse_time, main, response_key
+
+STEP_NS = 20_000_000
+
+
+def _frames() -> list[UECPFrame]:
+    return [
+        UECPFrame(
+            sequence_counter=1, commands=[ProgrammeServiceNameSetCommand(ps="RADIO")]
+        ),
+        UECPFrame(
+            sequence_counter=2, commands=[RadioTextSetCommand(text="NOW PLAYING\r")]
+        ),
+        UECPFrame(
+            sequence_counter=3,
+            commands=[
+                RequestCommand(
+                    command=ProgrammeServiceNameSetCommand,
+                    data_set_number=0,
+                    programme_service_number=0,
+                )
+            ],
+        ),
+        UECPFrame(sequence_counter=4, commands=[RadioTextSetCommand(text="NEWS\r")]),
+    ]
+
+
+def _record(emulator_link, path):
+    clock = itertools.count(1_000_000_000_000, STEP_NS)
+    protocol = emulator_link.protocol
+
+    async def run():
+        acks: asyncio.Queue = asyncio.Queue()
+        protocol.subscribe(MessageAcknowledgementCommand, acks.put_nowait)
+        with CaptureWriter(path, clock=lambda: next(clock)) as writer:
+            protocol.capture_writer = writer
+            for frame in _frames():
+                protocol.write(frame)
+                await asyncio.wait_for(acks.get(), 1)
+            # a request answers with data and an acknowledgement
+            await asyncio.sleep(0.05)
+            protocol.capture_writer = None
+        protocol.unsubscribe(MessageAcknowledgementCommand, acks.put_nowait)
+
+    emulator_link.run(run())
+
+
+def _replay(emulator_link, path, **kwargs):
+    async def run():
+        protocol = await emulator_link.connect()
+        return await CaptureReplayer(path, **kwargs).run(protocol)
+
+    return emulator_link.run(run())
+
+
+def test_replay_verifies_responses(tmp_path, emulator_link):
+    path = tmp_path / "capture.bin"
+    _record(emulator_link, path)
+    report = _replay(emulator_link, path, speed=None)
+    assert report.frames_sent == 4
+    assert emulator_link.emulator.frames_received == 8
+    assert report.frames_skipped == 0
+    # the sequence counters of the responses moved on since the recording
+    assert report.responses_expected == 5
+    assert report.responses_matched == 5
+    assert report.verified
+
+
+def test_replay_timing(tmp_path, emulator_link):
+    path = tmp_path / "capture.bin"
+    _record(emulator_link, path)
+    original = _replay(emulator_link, path, speed=1)
+    fast = _replay(emulator_link, path, speed=4)
+    assert original.recorded_duration == pytest.approx(fast.recorded_duration, rel=1e-9)
+    assert original.recorded_duration > 0
+    # the last frame is due at the recorded duration divided by the speed
+    assert original.duration >= original.recorded_duration
+    assert fast.duration >= fast.recorded_duration / 4
+    assert len(original.send_lags) == original.frames_sent
+
+
+def test_replay_detects_deviating_responses(tmp_path, emulator_link):
+    path = tmp_path / "capture.bin"
+    _record(emulator_link, path)
+
+    async def run():
+        protocol = await emulator_link.connect()
+        # the emulator answers with a different state than recorded
+        protocol.write(UECPFrame(commands=[ProgrammeServiceNameSetCommand(ps="OTHER")]))
+        await asyncio.sleep(0.05)
+        return await CaptureReplayer(
+            path, speed=None, start_ns=1_000_000_000_000 + 2 * STEP_NS
+        ).run(protocol)
+
+    report = emulator_link.run(run())
+    assert report.frames_sent < 4
+    assert report.responses_mismatched == 1
+    assert not report.verified
+
+
+def test_response_key():
+    ok = UECPFrame(
+        sequence_counter=7,
+        commands=[MessageAcknowledgementCommand(code=ResponseCode.OK)],
+    )
+    error = UECPFrame(
+        commands=[
+            MessageAcknowledgementCommand(
+                code=ResponseCode.CRC_ERROR, sequence_counter=3
+            )
+        ]
+    )
+    other_error = UECPFrame(
+        site_address=1,
+        commands=[
+            MessageAcknowledgementCommand(
+                code=ResponseCode.CRC_ERROR, sequence_counter=9
+            )
+        ],
+    )
+    assert response_key(ok) == (bytes([0x18, 0]),)
+    assert response_key(error) == response_key(other_error) != response_key(ok)
+
+
+def test_replay_range_and_skipped_frames(tmp_path, emulator_link):
+    path = tmp_path / "capture.bin"
+    with CaptureWriter(path) as writer:
+        writer.write(Direction.TX, b"\xfe\x00\x00\x01\x00\x00\x00\xff", 10)
+        writer.write(Direction.TX, _frames()[0].encode(), 20)
+        writer.write(Direction.TX, _frames()[1].encode(), 30)
+    report = _replay(emulator_link, path, speed=None, end_ns=30)
+    assert report.frames_skipped == 1
+    assert report.frames_sent == 1
+    assert report.responses_expected == 0
+
+
+def test_invalid_speed(tmp_path):
+    with pytest.raises(ValueError):
+        CaptureReplayer(tmp_path / "capture.bin", speed=0)
+
+
+def test_parse_time():
+    assert _parse_time("1234") == 1234
+    assert _parse_time("1970-01-01T00:00:01+00:00") == 1_000_000_000
+
+
+def test_main_json(tmp_path, capsys, emulator_link):
+    path = tmp_path / "capture.bin"
+    _record(emulator_link, path)
+    assert main([str(path), "--emulate", "--fast", "--json"]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["frames_sent"] == 4
+    assert summary["verified"] is True
@@ -0,0 +1,108 @@
+import codecs
+
+import pytest
+
+from uecp.commands import RDSEnabledSetCommand
+from uecp.corpus import CorpusGenerator
+from uecp.frame import UECPAddressFilter, UECPFrame
+from uecp.scan import FrameScanner, MappedDumpReader, ScannedFrame, scan_frames, unstuff
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\x00\x01\x02",
+        bytes([0xFD, 0xFE, 0xFF] * 10),
+        bytes([0xFD, 0x01, 0xFD, 0x02, 0xFD, 0x00, 0xFD]),
+        bytes(range(256)),
+    ],
+)
+def test_unstuff(data):
+    assert unstuff(codecs.encode(data, "uecp_frame")) == data
+
+
+@pytest.mark.parametrize("stuffed", [b"\xfd", b"\xfd\x03", b"\x01\xfd\xfd\x00"])
+def test_unstuff_invalid(stuffed):
+    with pytest.raises(ValueError):
+        unstuff(stuffed)
+
+
+def test_scanned_frame():
+    frame = UECPFrame(
+        site_address=0x3FF,
+        encoder_address=0x3F,
+        sequence_counter=0xFE,
+        commands=[RDSEnabledSetCommand(enable=True)],
+    )
+    scanned = ScannedFrame(frame.encode(), 0)
+    assert scanned.valid
+    assert scanned.site_address == 0x3FF
+    assert scanned.encoder_address == 0x3F
+    assert scanned.sequence_counter == 0xFE
+    assert scanned.decode().encode() == frame.encode()
+
+    corrupted = bytearray(frame.encode())
+    corrupted[-2] ^= 0x01
+    assert not ScannedFrame(bytes(corrupted), 0).valid
+    assert not ScannedFrame(b"\xfe\x00\xfd\x05\xff", 0).valid
+
+
+def test_scan_skips_garbage_and_torn_frames():
+    frame = UECPFrame(commands=[RDSEnabledSetCommand(enable=True)]).encode()
+    data = b"\x01\x02" + frame + b"\x03\xff" + frame[:5] + frame + frame
+    frames = list(scan_frames(data))
+    assert [f.raw for f in frames] == [frame] * 3
+    assert [f.offset for f in frames] == [2, 2 + len(frame) + 7, 2 + 2 * len(frame) + 7]
+
+
+def test_scanner_across_pieces():
+    corpus = CorpusGenerator(seed=1, stuffing_density=0.3, chunk_size=(1, 7)).generate(
+        4096
+    )
+    expected = [f.raw for f in scan_frames(corpus.data)]
+    scanner = FrameScanner()
+    found = []
+    offset = 0
+    for chunk in corpus.chunks():
+        found += [
+            raw for raw, _ in scanner.feed(corpus.data, offset, offset + len(chunk))
+        ]
+        offset += len(chunk)
+    assert found == expected
+    assert len(found) == corpus.frames
+
+
+def test_scan_matches_decoder():
+    corpus = CorpusGenerator(
+        seed=2, stuffing_density=0.3, garbage_rate=0.05, corrupt_rate=0.05
+    ).generate(16384)
+    frames = list(scan_frames(corpus.data))
+    assert len(frames) == corpus.frames
+    assert sum(frame.valid for frame in frames) == corpus.valid_frames
+
+
+def test_address_filter():
+    data = b"".join(
+        UECPFrame(site_address=site_address, encoder_address=encoder_address).encode()
+        for site_address, encoder_address in ((1, 1), (1, 2), (2, 1), (0, 0))
+    )
+    address_filter = UECPAddressFilter(site_addresses={1}, encoder_addresses={1})
+    frames = list(scan_frames(data, address_filter=address_filter))
+    assert [(f.site_address, f.encoder_address) for f in frames] == [(1, 1), (0, 0)]
+
+
+def test_mapped_dump_reader(tmp_path):
+    corpus = CorpusGenerator(seed=3).generate(4096)
+    path = tmp_path / "dump.bin"
+    path.write_bytes(corpus.data)
+    with MappedDumpReader(path) as reader:
+        assert reader.size == len(corpus.data)
+        frames = list(reader.frames())
+    # frames outlive the mapping
+    assert sum(frame.valid for frame in frames) == corpus.frames
+
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with MappedDumpReader(empty) as reader:
+        assert list(reader.frames()) == []
@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+from uecp.capture import CaptureReader, CaptureWriter, Direction
+from uecp.wire_trace import WireTrace
+
+
+def test_bounded_by_bytes():
+    trace = WireTrace(capacity=8, clock=itertools.count().__next__)
+    trace.record(Direction.RX, b"\x01\x02\x03")
+    trace.record(Direction.TX, b"\x04\x05\x06")
+    trace.record(Direction.RX, b"\x07\x08\x09")
+    assert trace.entries() == [
+        (1, Direction.TX, b"\x04\x05\x06"),
+        (2, Direction.RX, b"\x07\x08\x09"),
+    ]
+    assert trace.size == 6
+    assert trace.dropped_bytes == 3
+
+    trace.record(Direction.RX, bytes(range(10)))
+    assert trace.entries() == [(3, Direction.RX, bytes(range(2, 10)))]
+    assert trace.size == 8
+
+    trace.clear()
+    assert trace.entries() == []
+    assert trace.size == 0
+
+    with pytest.raises(ValueError):
+        WireTrace(capacity=0)
+
+
+def test_dump():
+    trace = WireTrace(capacity=4, clock=lambda: 1_500_000_000)
+    trace.record(Direction.RX, b"\xfe\x00\x01")
+    trace.record(Direction.TX, b"\xff\x02")
+    assert trace.dump() == (
+        "... 3 older bytes dropped\n" "1970-01-01T00:00:01.500000+00:00 TX ff 02"
+    )
+
+
+def test_write_capture(tmp_path):
+    trace = WireTrace(clock=itertools.count(10).__next__)
+    trace.record(Direction.RX, b"\x01")
+    trace.record(Direction.TX, b"\x02")
+    path = tmp_path / "trace.cap"
+    with CaptureWriter(path) as writer:
+        trace.write_capture(writer)
+    with CaptureReader(path) as reader:
+        assert [(r.timestamp_ns, r.direction, r.data) for r in reader] == [
+            (10, Direction.RX, b"\x01"),
+            (11, Direction.TX, b"\x02"),
+        ]